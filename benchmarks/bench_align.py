@@ -0,0 +1,273 @@
+"""
+Benchmarks for the CPU equivalents of the per-iteration alignment steps in
+`tomopyui.tomocupy.prep.alignment` (`batch_cross_correlation` and
+`shift_prj_update_shift_cp`). The per-image versions here are the baseline for
+the batched steps of `tomopyui.backend.util.alignment`. The reprojection step is
+timed for each of the projectors in `tomopyui.backend.util.projectors`. The
+alignment loops compare the error left after a few iterations with and without
+ordered subsets, for the same reconstruction and reprojection work.
+"""
+
+import numpy as np
+import scipy.ndimage as ndi
+
+from skimage.registration import phase_cross_correlation
+from tomopy.prep.alignment import blur_edges
+
+from tomopyui.backend.util import synthetic
+from tomopyui.backend.util.alignment import (
+    PipelinedIteration,
+    batch_cross_correlation,
+    ordered_subsets,
+    reconstruct,
+    shift_prj_update_shift,
+)
+from tomopyui.backend.util.projectors import make_projector
+
+from .common import StageBenchmark
+
+
+def cross_correlation_cpu(prj, sim, upsample_factor, rin=0.5, rout=0.8):
+    """
+    Same steps as `batch_cross_correlation`, one projection at a time on the CPU.
+    """
+    prj = ndi.median_filter(prj, size=(1, 5, 5))
+    sim = ndi.median_filter(sim, size=(1, 5, 5))
+    sim = np.where(prj < 1e-7, 0, sim)
+    prj = blur_edges(prj, rin, rout)
+    sim = blur_edges(sim, rin, rout)
+    shift = np.zeros((2, prj.shape[0]))
+    for i in range(prj.shape[0]):
+        shift[:, i] = phase_cross_correlation(
+            sim[i], prj[i], upsample_factor=upsample_factor
+        )[0]
+    return shift
+
+
+def shift_projections_cpu(prj, sx, sy, shift, pad):
+    """
+    Same steps as `shift_prj_update_shift_cp`, one projection at a time on the CPU.
+    """
+    for i in range(prj.shape[0]):
+        if (
+            np.abs(sx[i] + shift[1, i]) < pad[0]
+            and np.abs(sy[i] + shift[0, i]) < pad[1]
+        ):
+            sx[i] += shift[1, i]
+            sy[i] += shift[0, i]
+            prj[i] = ndi.shift(prj[i], shift[:, i], order=5)
+    return prj, sx, sy
+
+
+class _AlignmentStep(StageBenchmark):
+    upsample_factor = 50
+    pad = (10, 10)
+
+    def setup(self, scale):
+        shape = synthetic.get_scan_shape(scale)
+        angles = synthetic.make_angles(shape[0])
+        misalignment = synthetic.make_misalignment(shape[0], jitter_std=2)
+        self.prj = synthetic.project_phantom(angles, *shape[1:], misalignment)
+        self.sim = synthetic.project_phantom(angles, *shape[1:])
+        self.shift = np.stack([-misalignment["sy"], -misalignment["sx"]])
+
+
+class CrossCorrelationCPU(_AlignmentStep):
+    """
+    Phase cross correlation of every projection with its reprojection.
+    """
+
+    def run_stage(self, scale):
+        cross_correlation_cpu(self.prj, self.sim, self.upsample_factor)
+
+
+class CrossCorrelationBatched(_AlignmentStep):
+    """
+    Same as CrossCorrelationCPU, with batched real FFTs and cached kernels.
+    """
+
+    def run_stage(self, scale):
+        batch_cross_correlation(self.prj, self.sim, 1, self.upsample_factor)
+
+
+class ShiftProjectionsCPU(_AlignmentStep):
+    """
+    Shifting every projection by the measured shift (5th order spline).
+    """
+
+    def run_stage(self, scale):
+        sx = np.zeros(self.prj.shape[0])
+        sy = np.zeros(self.prj.shape[0])
+        shift_projections_cpu(self.prj.copy(), sx, sy, self.shift, self.pad)
+
+
+class ShiftProjectionsBatched(_AlignmentStep):
+    """
+    Same as ShiftProjectionsCPU, with batched Fourier shifts in place.
+    """
+
+    def run_stage(self, scale):
+        sx = np.zeros(self.prj.shape[0])
+        sy = np.zeros(self.prj.shape[0])
+        shift_prj_update_shift(self.prj.copy(), sx, sy, self.shift, 1, self.pad)
+
+
+class _Reprojection(StageBenchmark):
+    projector_name = None
+
+    def setup(self, scale):
+        num_angles, num_rows, num_cols = synthetic.get_scan_shape(scale)
+        angles = np.deg2rad(synthetic.make_angles(num_angles))
+        self.rec = np.stack(
+            [
+                synthetic.phantom_slice(num_cols, row, num_rows)
+                for row in range(num_rows)
+            ]
+        )
+        self.projector = make_projector(self.projector_name, angles, self.rec.shape)
+        self.sim = np.empty(self.projector.sim_shape, dtype=np.float32)
+
+
+class ReprojectTomopy(_Reprojection):
+    """
+    Reprojection of the reconstruction with `tomopy.project`.
+    """
+
+    projector_name = "tomopy"
+
+    def run_stage(self, scale):
+        self.projector.project(self.rec, out=self.sim)
+
+
+class ReprojectRotation(_Reprojection):
+    """
+    Same as ReprojectTomopy, with the sparse rotate-and-sum projector. The
+    matrices are made in setup, like in the alignment loop after the first
+    iteration.
+    """
+
+    projector_name = "rotation"
+
+    def setup(self, scale):
+        super().setup(scale)
+        self.projector.project(self.rec, out=self.sim)
+
+    def run_stage(self, scale):
+        self.projector.project(self.rec, out=self.sim)
+
+
+class AlignmentIteration(_AlignmentStep):
+    """
+    Reprojection, cross correlation and shift of one alignment iteration, one step
+    after the other over 4 batches.
+    """
+
+    num_batches = 4
+
+    def setup(self, scale):
+        super().setup(scale)
+        angles = np.deg2rad(synthetic.make_angles(self.prj.shape[0]))
+        num_rows, num_cols = self.prj.shape[1:]
+        self.rec = np.stack(
+            [
+                synthetic.phantom_slice(num_cols, row, num_rows)
+                for row in range(num_rows)
+            ]
+        )
+        self.projector = make_projector("rotation", angles, self.rec.shape)
+        self.sim = np.empty(self.projector.sim_shape, dtype=np.float32)
+        self.projector.project(self.rec, out=self.sim)
+
+    def run_stage(self, scale):
+        prj = self.prj.copy()
+        self.projector.project(self.rec, out=self.sim, num_batches=self.num_batches)
+        shift = batch_cross_correlation(
+            prj, self.sim, self.num_batches, self.upsample_factor
+        )
+        sx = np.zeros(prj.shape[0])
+        sy = np.zeros(prj.shape[0])
+        shift_prj_update_shift(prj, sx, sy, shift, self.num_batches, self.pad)
+
+
+class AlignmentIterationPipelined(AlignmentIteration):
+    """
+    Same as AlignmentIteration, with the steps pipelined over the batches.
+    """
+
+    def run_stage(self, scale):
+        iteration = PipelinedIteration(
+            self.projector, self.num_batches, self.upsample_factor, self.pad
+        )
+        sx = np.zeros(self.prj.shape[0])
+        sy = np.zeros(self.prj.shape[0])
+        iteration.run(self.prj.copy(), self.rec, self.sim, sx, sy)
+
+
+class AlignmentLoop(_AlignmentStep):
+    """
+    Joint alignment iterations of the misaligned phantom: SIRT update,
+    reprojection, cross correlation and shift, like
+    `tomopyui.backend.util.alignment.align_joint`. track_residual is the RMS error
+    of the shifts found (up to a common offset), in pixels.
+    """
+
+    num_iter = 3
+    recon_iters = 4
+    num_subsets = 1
+    subset_order = "bit_reversal"
+
+    def setup(self, scale):
+        super().setup(scale)
+        self.angles = np.deg2rad(synthetic.make_angles(self.prj.shape[0]))
+        self.projectors = {}
+
+    def _projector(self, angles, shape):
+        key = (angles.start, angles.step)
+        if key not in self.projectors:
+            self.projectors[key] = make_projector("tomopy", self.angles[angles], shape)
+        return self.projectors[key]
+
+    def align(self):
+        prj = self.prj.copy()
+        sx = np.zeros(prj.shape[0])
+        sy = np.zeros(prj.shape[0])
+        recon = None
+        for n in range(self.num_iter):
+            subsets = ordered_subsets(self.num_subsets, self.subset_order, seed=n)
+            for i, update in enumerate(subsets):
+                angles = subsets[(i + 1) % len(subsets)]
+                recon = reconstruct(
+                    prj[update],
+                    self.angles[update],
+                    "sirt",
+                    num_iter=self.recon_iters,
+                    init_recon=recon,
+                )
+                sim = self._projector(angles, recon.shape).project(recon)
+                shift = batch_cross_correlation(
+                    prj[angles], sim, 1, self.upsample_factor
+                )
+                _, sx[angles], sy[angles], _ = shift_prj_update_shift(
+                    prj[angles], sx[angles], sy[angles], shift, 1, self.pad
+                )
+        return sx, sy
+
+    def run_stage(self, scale):
+        self.align()
+
+    def track_residual(self, scale):
+        sx, sy = self.align()
+        error = np.stack([sy, sx]) - self.shift
+        error -= error.mean(axis=1, keepdims=True)
+        return float(np.sqrt(np.mean(error**2)))
+
+    track_residual.unit = "pixels"
+
+
+class AlignmentLoopOrderedSubsets(AlignmentLoop):
+    """
+    Same as AlignmentLoop with 8 ordered subsets: 8 SIRT updates per iteration,
+    each from an eighth of the angles.
+    """
+
+    num_subsets = 8
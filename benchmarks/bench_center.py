@@ -0,0 +1,63 @@
+"""
+Benchmarks for center of rotation finding.
+"""
+
+import numpy as np
+
+from tomopyui.backend.util.center import write_center, find_center_vo
+
+from .common import StageBenchmark, get_scan
+
+
+class WriteCenter(StageBenchmark):
+    """
+    Reconstructing one slice at 20 centers with the center scan engine (the default
+    manual center search on the Center tab).
+    """
+
+    def setup(self, scale):
+        folder, truth = get_scan("prenormalized", scale)
+        self.prj = np.load(folder / "normalized_projections.npy")
+        self.theta = np.deg2rad(truth["angles_deg"])
+        self.cen_range = (truth["center"] - 5, truth["center"] + 5, 0.5)
+
+    def run_stage(self, scale):
+        write_center(self.prj, self.theta, cen_range=self.cen_range, mask=True)
+
+
+class WriteCenterGridrec(WriteCenter):
+    """
+    Same as WriteCenter, reconstructing a stack of copies of the sinogram with
+    tomopy's gridrec.
+    """
+
+    def run_stage(self, scale):
+        write_center(
+            self.prj,
+            self.theta,
+            cen_range=self.cen_range,
+            mask=True,
+            use_scan_engine=False,
+        )
+
+
+class FindCenterVo(WriteCenter):
+    """
+    Vo's method with batched FFTs on all cores, on a band of 5 rows.
+    """
+
+    def run_stage(self, scale):
+        middle = self.prj.shape[1] // 2
+        find_center_vo(self.prj, rows=(middle - 2, middle + 3))
+
+
+class FindCenterVoTomopy(WriteCenter):
+    """
+    Same as FindCenterVo with `tomopy.recon.rotation.find_center_vo` on one row,
+    as the Center tab used to call it.
+    """
+
+    def run_stage(self, scale):
+        from tomopy.recon.rotation import find_center_vo as find_center_vo_tomopy
+
+        find_center_vo_tomopy(self.prj, ncore=1)
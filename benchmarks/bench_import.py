@@ -0,0 +1,131 @@
+"""
+Benchmarks for importing, normalizing and downsampling raw data.
+"""
+
+import pathlib
+import shutil
+import tempfile
+from types import SimpleNamespace
+
+import dask.array as da
+import h5py
+import numpy as np
+
+from tomopyui.backend.io import (
+    IOBase,
+    Projections_Prenormalized,
+    RawProjectionsBase,
+    RawProjectionsXRM_SSRL62C,
+)
+from tomopyui.backend.util import synthetic
+from tomopyui.backend.util.dask_downsample import pyramid_reduce_gaussian
+
+from .common import StageBenchmark, get_scan
+
+
+class LoadXRMs(StageBenchmark):
+    """
+    Reading every .xrm file of an SSRL 6-2c scan.
+    """
+
+    def setup(self, scale):
+        folder, _ = get_scan("SSRL62C", scale)
+        self.xrm_list = sorted(folder.glob("*.xrm"))
+        self.projections = RawProjectionsXRM_SSRL62C()
+
+    def run_stage(self, scale):
+        uploader = SimpleNamespace(upload_progress=SimpleNamespace(value=0))
+        self.projections.load_xrms(self.xrm_list, uploader)
+
+
+class NormalizeAndAverage(StageBenchmark):
+    """
+    Flat field correction with multiple exposures and reference groups, as done
+    for SSRL 6-2c data.
+    """
+
+    num_exposures = 2
+    ref_num_exposures = 5
+    num_ref_groups = 3
+
+    def setup(self, scale):
+        num_angles, num_rows, num_cols = synthetic.get_scan_shape(scale)
+        flat = synthetic.make_flat(num_rows, num_cols)
+        rng = np.random.default_rng(0)
+        prj = synthetic.project_phantom(
+            synthetic.make_angles(num_angles), num_rows, num_cols
+        )
+        projs = np.repeat(
+            synthetic.absorbance_to_counts(prj, flat, rng=rng),
+            self.num_exposures,
+            axis=0,
+        )
+        flats = synthetic.absorbance_to_counts(
+            np.zeros((self.ref_num_exposures * self.num_ref_groups,) + prj.shape[1:]),
+            flat,
+            rng=rng,
+        )
+        self.projs = da.from_array(projs, chunks=(self.num_exposures, -1, -1)).astype(
+            np.float32
+        )
+        self.flats = da.from_array(
+            flats, chunks=(self.ref_num_exposures, -1, -1)
+        ).astype(np.float32)
+        self.darks = np.zeros((1,) + prj.shape[1:], dtype=np.float32)
+        self.flat_loc = list(
+            np.linspace(0, projs.shape[0], self.num_ref_groups).astype(int)
+        )
+
+    def run_stage(self, scale):
+        RawProjectionsBase.normalize_and_average(
+            self.projs,
+            self.flats,
+            self.darks,
+            self.flat_loc,
+            self.num_exposures,
+            compute=True,
+        )
+
+
+class HistAndSaveData(StageBenchmark):
+    """
+    Computing the histogram of normalized data and saving it to hdf5.
+    """
+
+    def setup(self, scale):
+        folder, _ = get_scan("prenormalized", scale)
+        self.tmpdir = tempfile.mkdtemp()
+        self.projections = Projections_Prenormalized()
+        self.projections.data = da.from_array(
+            np.load(folder / "normalized_projections.npy")
+        )
+        self.projections.filepath = folder / "normalized_projections.npy"
+        self.projections.import_savedir = pathlib.Path(self.tmpdir)
+
+    def teardown(self, scale):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def run_stage(self, scale):
+        self.projections._dask_hist_and_save_data()
+        self.projections._close_hdf_file()
+
+
+class PyramidReduceGaussian(StageBenchmark):
+    """
+    Writing the downsampled pyramid (levels 0-2) of normalized data into hdf5.
+    """
+
+    def setup(self, scale):
+        folder, _ = get_scan("prenormalized", scale)
+        self.tmpdir = tempfile.mkdtemp()
+        self.h5_filepath = f"{self.tmpdir}/{IOBase.normalized_projections_hdf_key}"
+        with h5py.File(self.h5_filepath, "w") as f:
+            f[IOBase.hdf_key_norm_proj] = np.load(folder / "normalized_projections.npy")
+
+    def teardown(self, scale):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def run_stage(self, scale):
+        with h5py.File(self.h5_filepath, "r") as f:
+            image = da.from_array(f[IOBase.hdf_key_norm_proj][:])
+        pyramid_reduce_gaussian(image, h5_filepath=self.h5_filepath)
@@ -0,0 +1,31 @@
+"""
+Benchmarks for reconstruction.
+"""
+
+import numpy as np
+
+from tomopyui.backend.io import Metadata_Recon
+from tomopyui.backend.runanalysis import RunRecon
+
+from .common import StageBenchmark, get_scan
+
+
+class ReconstructGridrec(StageBenchmark):
+    """
+    `RunRecon.reconstruct` with gridrec on the full volume. The RunRecon instance is
+    built without a Recon tab, so nothing is displayed or saved.
+    """
+
+    def setup(self, scale):
+        folder, truth = get_scan("prenormalized", scale)
+        self.run_recon = RunRecon.__new__(RunRecon)
+        self.run_recon.metadata = Metadata_Recon()
+        self.run_recon.metadata.metadata["methods"] = {"gridrec": True}
+        self.run_recon.prjs = np.load(folder / "normalized_projections.npy")
+        self.run_recon.angles_rad = np.deg2rad(truth["angles_deg"])
+        self.run_recon.center = truth["center"]
+        self.run_recon.num_iter = 1
+        self.run_recon.pad_ds = (0, 0)
+
+    def run_stage(self, scale):
+        self.run_recon.reconstruct()
@@ -0,0 +1,93 @@
+"""
+Shared setup for the tomopyui benchmarks.
+
+Every stage benchmark derives from `StageBenchmark`, which times the stage, records
+its peak memory and counts the bytes it reads and writes. The synthetic scans used
+as input are generated once per size with `tomopyui.backend.util.synthetic` and
+cached under $TOMOPYUI_BENCHMARK_DATA (defaults to a folder in the system temporary
+directory).
+"""
+
+import multiprocessing
+import os
+import pathlib
+import tempfile
+
+from tomopyui.backend.util import synthetic
+from tomopyui.backend.util.profiling import io_counters
+
+# Headless: the widgets normally set these when the dashboard is created.
+os.environ.setdefault("num_cpu_cores", str(multiprocessing.cpu_count()))
+os.environ.setdefault("cuda_enabled", "False")
+
+SCALES = ["tiny", "small", "medium"]
+
+data_dir = pathlib.Path(
+    os.environ.get(
+        "TOMOPYUI_BENCHMARK_DATA",
+        pathlib.Path(tempfile.gettempdir()) / "tomopyui_benchmarks",
+    )
+)
+
+_writers = {
+    "SSRL62C": lambda path, scale: synthetic.write_ssrl62c(
+        path, scale=scale, num_exposures=2, jitter_std=1, center_offset=2
+    ),
+    "ALS832": lambda path, scale: synthetic.write_als832(
+        path / "als832.h5", scale=scale, jitter_std=1, center_offset=2
+    ),
+    "prenormalized": lambda path, scale: synthetic.write_prenormalized(
+        path, "npy", scale=scale, jitter_std=1, center_offset=2
+    ),
+}
+
+
+def get_scan(file_format, scale):
+    """
+    Returns (folder, ground truth) of a cached synthetic scan, generating it first
+    if needed.
+    """
+    folder = data_dir / f"{file_format}_{scale}"
+    if not (folder / synthetic.truth_filename).exists():
+        _writers[file_format](folder, scale)
+    return folder, synthetic.load_truth(folder)
+
+
+class StageBenchmark:
+    """
+    Base class for stage benchmarks. Subclasses implement setup(scale) and
+    run_stage(scale). Stages are timed one call at a time because most of them
+    write to disk.
+    """
+
+    params = SCALES
+    param_names = ["scale"]
+    number = 1
+    repeat = (1, 5, 60.0)
+    warmup_time = 0
+    timeout = 1200
+
+    def run_stage(self, scale):
+        raise NotImplementedError
+
+    def time_stage(self, scale):
+        self.run_stage(scale)
+
+    def peakmem_stage(self, scale):
+        self.run_stage(scale)
+
+    def track_bytes_read(self, scale):
+        read_before, _ = io_counters()
+        self.run_stage(scale)
+        read_after, _ = io_counters()
+        return read_after - read_before
+
+    track_bytes_read.unit = "bytes"
+
+    def track_bytes_written(self, scale):
+        _, written_before = io_counters()
+        self.run_stage(scale)
+        _, written_after = io_counters()
+        return written_after - written_before
+
+    track_bytes_written.unit = "bytes"
@@ -0,0 +1,243 @@
+import types
+
+import numpy as np
+import pytest
+
+pytest.importorskip("tomopy")
+
+from tomopyui.backend.util.alignment import (  # noqa: E402
+    align_joint,
+    interpolate_shifts,
+    ordered_subsets,
+    slab_rows,
+    vertical_profile_shifts,
+)
+from tomopyui.backend.util.fast_alignment import (  # noqa: E402
+    align_fast,
+    center_of_mass_shifts,
+)
+from tomopyui.backend.util.padding import pad_projections  # noqa: E402
+from tomopyui.backend.util.scratch import ScratchArrays  # noqa: E402
+from tomopyui.backend.util.synthetic import (  # noqa: E402
+    SHEPP_LOGAN_3D,
+    make_misalignment,
+    project_phantom,
+)
+
+
+def jittered_projections(num_angles=90, size=64, jitter_std=2.0, seed=0):
+    """
+    Projections of a Shepp-Logan phantom shrunk to 60 % of the field of view, so
+    that it stays inside it with the jitter (needed by the center of mass).
+    """
+    angles_deg = np.linspace(0, 180, num_angles, endpoint=False)
+    misalignment = make_misalignment(
+        num_angles, jitter_std, center_offset=1.5, seed=seed
+    )
+    ellipsoids = np.array(SHEPP_LOGAN_3D, dtype=np.float64)
+    ellipsoids[:, 1:7] *= 0.6
+    prj = project_phantom(angles_deg, size, size, misalignment, ellipsoids=ellipsoids)
+    return prj, np.deg2rad(angles_deg), misalignment
+
+
+def sinusoid_residual(shift, theta):
+    """
+    What is left of shift after taking out c + a cos(theta) + b sin(theta), the
+    shift of the projections of a translated object.
+    """
+    design = np.stack([np.ones_like(theta), np.cos(theta), np.sin(theta)], axis=1)
+    return shift - design @ np.linalg.lstsq(design, shift, rcond=None)[0]
+
+
+def alignment_run(prj, theta, pad, center, **options):
+    """
+    The attributes of a RunAlign that align_joint uses, without the widgets.
+    """
+    progress = types.SimpleNamespace(value=0)
+    run = types.SimpleNamespace(
+        prjs=pad_projections(prj, pad),
+        angles_rad=theta,
+        pad_ds=pad,
+        ds_factor=1,
+        center=center + pad[0],
+        metadata=types.SimpleNamespace(metadata={"methods": {"gridrec": {}}}),
+        num_iter=10,
+        recon_iters=[1],
+        pre_alignment_iters=1,
+        conv_threshold=0.01,
+        num_batches=4,
+        upsample_factor=20,
+        use_subset_correlation=False,
+        subset_x=[0, prj.shape[2]],
+        subset_y=[0, prj.shape[1]],
+        plot_output1=None,
+        plot_output2=None,
+        Align=types.SimpleNamespace(
+            progress_reprj=progress,
+            progress_phase_cross_corr=progress,
+            progress_shifting=progress,
+            progress_total=progress,
+        ),
+    )
+    vars(run).update(options)
+    return run
+
+
+def test_align_joint_recovers_shifts():
+    prj, theta, misalignment = jittered_projections(jitter_std=1.5, seed=1)
+    pad = (8, 8)
+    run = align_joint(alignment_run(prj, theta, pad, center=31.5 + 1.5))
+    assert run.pad == pad
+    # the shifts undo the misalignment, up to a translation of the object (which
+    # the reconstruction follows) and a vertical shift of the whole stack
+    residual_x = sinusoid_residual(run.sx + misalignment["sx"], theta)
+    residual_y = run.sy + misalignment["sy"]
+    residual_y -= np.mean(residual_y)
+    for residual in (residual_x, residual_y):
+        assert np.sqrt(np.mean(residual**2)) < 0.2
+        assert np.max(np.abs(residual)) < 0.5
+
+
+def test_pipelined_iterations_match_sequential():
+    prj, theta, _ = jittered_projections(num_angles=45, size=48, seed=2)
+    pad = (6, 6)
+    runs = [
+        align_joint(
+            alignment_run(
+                prj, theta, pad, center=23.5 + 1.5, num_iter=3, pipeline_batches=p
+            )
+        )
+        for p in (False, True)
+    ]
+    sequential, pipelined = runs
+    assert pipelined.pipeline_fallback is None
+    assert pipelined.pipeline_utilization["shift"]["items"] == 3 * 4
+    for name in ("sx", "sy", "conv"):
+        np.testing.assert_allclose(
+            getattr(pipelined, name), getattr(sequential, name), atol=1e-6
+        )
+    np.testing.assert_allclose(pipelined.prjs, sequential.prjs, atol=1e-5)
+
+
+def test_slab_rows():
+    assert slab_rows([10, 20], 4, 100) == slice(6, 24)
+    assert slab_rows([2, 98], 4, 100) == slice(0, 100)
+
+
+def test_vertical_profile_shifts():
+    prj, theta, misalignment = jittered_projections(jitter_std=1.5, seed=1)
+    shift = vertical_profile_shifts(pad_projections(prj, (0, 8)), upsample_factor=20)
+    # the shifts undo the misalignment, up to a shift of the whole stack
+    residual = shift + misalignment["sy"]
+    assert np.max(np.abs(residual - np.mean(residual))) < 0.1
+
+
+def test_center_of_mass_shifts():
+    prj, theta, misalignment = jittered_projections()
+    shift, center = center_of_mass_shifts(prj, theta)
+    residual = sinusoid_residual(shift + misalignment["sx"], theta)
+    assert np.max(np.abs(residual)) < 0.15
+    # the phantom is centered on the rotation axis
+    assert abs(center - (31.5 + 1.5 + np.mean(misalignment["sx"]))) < 0.5
+
+
+def test_align_fast():
+    prj, theta, misalignment = jittered_projections(jitter_std=1.5, seed=1)
+    pad = (8, 8)
+    progress = types.SimpleNamespace(value=0)
+    run = types.SimpleNamespace(
+        prjs=pad_projections(prj, pad),
+        angles_rad=theta,
+        pad_ds=pad,
+        ds_factor=1,
+        num_batches=4,
+        upsample_factor=20,
+        vertical_alignment="profile",
+        Align=types.SimpleNamespace(
+            progress_shifting=progress, progress_total=progress
+        ),
+    )
+    align_fast(run, num_iter=5, tol=0.05)
+    assert run.conv[-1] < run.conv[0] / 10
+    residual_x = sinusoid_residual(run.sx + misalignment["sx"], theta)
+    assert np.max(np.abs(residual_x)) < 0.25
+    residual_y = run.sy + misalignment["sy"]
+    assert np.max(np.abs(residual_y - np.mean(residual_y))) < 0.15
+
+
+@pytest.mark.parametrize("shift_tol, expected", [(0, {}), (0.4, {"tol": 0.2})])
+def test_run_align_fast_uses_alignment_options(monkeypatch, shift_tol, expected):
+    runanalysis = pytest.importorskip("tomopyui.backend.runanalysis")
+    calls = []
+    monkeypatch.setattr(
+        runanalysis, "align_fast", lambda run, **kwargs: calls.append(kwargs)
+    )
+    run = types.SimpleNamespace(
+        num_iter=7,
+        shift_tol=shift_tol,
+        ds_factor=2,
+        profiler=runanalysis.StageProfiler(),
+    )
+    runanalysis.RunAlign._run_align_fast(run)
+    assert calls == [{"num_iter": 7, **expected}]
+
+
+def test_interpolate_shifts():
+    shift = np.array([[0.0, 2.0, 4.0], [1.0, 1.0, -1.0]])
+    result = interpolate_shifts(shift, slice(1, None, 3), 9)
+    np.testing.assert_allclose(result[0], [0, 0, 2 / 3, 4 / 3, 2, 8 / 3, 10 / 3, 4, 4])
+    np.testing.assert_allclose(result[1], [1, 1, 1, 1, 1, 1 / 3, -1 / 3, -1, -1])
+
+
+def test_out_of_core_matches_in_memory(tmp_path):
+    prj, theta, _ = jittered_projections(num_angles=45, size=48, seed=2)
+    pad = (6, 6)
+    in_memory = align_joint(
+        alignment_run(prj, theta, pad, center=23.5 + 1.5, num_iter=3)
+    )
+    scratch = ScratchArrays(tmp_path / "scratch")
+    out_of_core = align_joint(
+        alignment_run(prj, theta, pad, center=23.5 + 1.5, num_iter=3, scratch=scratch)
+    )
+    assert isinstance(out_of_core.recon, np.memmap)
+    for name in ("sx", "sy", "conv", "recon"):
+        np.testing.assert_allclose(
+            getattr(out_of_core, name), getattr(in_memory, name), atol=1e-5
+        )
+    scratch.cleanup()
+    assert not (tmp_path / "scratch").exists()
+
+
+@pytest.mark.parametrize("order", ["sequential", "bit_reversal", "random"])
+@pytest.mark.parametrize("num_subsets, stride", [(1, 1), (4, 1), (3, 2), (8, 1)])
+def test_ordered_subsets_cover_every_angle_once(order, num_subsets, stride):
+    num_angles = 50
+    subsets = ordered_subsets(num_subsets, order, stride, seed=0)
+    assert len(subsets) == num_subsets
+    angles = np.concatenate([np.arange(num_angles)[s] for s in subsets])
+    np.testing.assert_array_equal(np.sort(angles), np.arange(0, num_angles, stride))
+
+
+def test_ordered_subsets_order():
+    starts = [s.start for s in ordered_subsets(4, "sequential")]
+    assert starts == [0, 1, 2, 3]
+    starts = [s.start for s in ordered_subsets(8, "bit_reversal")]
+    assert starts == [0, 4, 2, 6, 1, 5, 3, 7]
+    first = [s.start for s in ordered_subsets(8, "random", seed=3)]
+    assert first == [s.start for s in ordered_subsets(8, "random", seed=3)]
+    with pytest.raises(ValueError):
+        ordered_subsets(2, "unknown")
+
+
+def test_align_joint_with_ordered_subsets():
+    prj, theta, misalignment = jittered_projections(jitter_std=1.5, seed=1)
+    run = alignment_run(prj, theta, (8, 8), center=31.5 + 1.5, num_subsets=3)
+    run = align_joint(run)
+    residual_x = sinusoid_residual(run.sx + misalignment["sx"], theta)
+    residual_y = run.sy + misalignment["sy"]
+    residual_y -= np.mean(residual_y)
+    # each update reconstructs from a third of the angles, so the shifts are
+    # noisier than with one subset
+    for residual in (residual_x, residual_y):
+        assert np.sqrt(np.mean(residual**2)) < 0.25
+        assert np.max(np.abs(residual)) < 0.6
@@ -0,0 +1,146 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("tomopy")
+
+from tomopyui.backend.util.center import (  # noqa: E402
+    _parabola_minimum,
+    center_metric,
+    center_scan,
+    find_center_mirror,
+    find_center_pyramid,
+    find_center_vo,
+    fit_center_rows,
+    scale_center_fit,
+)
+from tomopyui.backend.util.synthetic import (  # noqa: E402
+    SHEPP_LOGAN_3D,
+    make_misalignment,
+    project_phantom,
+)
+
+SIZE = 128
+CENTER_OFFSET = 3.3
+TRUE_CENTER = (SIZE - 1) / 2 + CENTER_OFFSET
+
+
+def phantom_projections(num_angles=181, num_rows=16, tilt_deg=0.0, endpoint=False):
+    """
+    Projections of a Shepp-Logan phantom shrunk to 80 % of the field of view, so
+    that it is not cut off by the detector edges.
+    """
+    angles_deg = np.linspace(0, 180, num_angles, endpoint=endpoint)
+    misalignment = make_misalignment(
+        num_angles, center_offset=CENTER_OFFSET, tilt_deg=tilt_deg
+    )
+    ellipsoids = np.array(SHEPP_LOGAN_3D, dtype=np.float64)
+    ellipsoids[:, 1:7] *= 0.8
+    prj = project_phantom(
+        angles_deg, num_rows, SIZE, misalignment, ellipsoids=ellipsoids
+    )
+    return prj, np.deg2rad(angles_deg)
+
+
+@pytest.mark.parametrize("metric", ["entropy", "negativity"])
+def test_center_scan_metrics(metric):
+    prj, theta = phantom_projections()
+    centers = np.arange(TRUE_CENTER - 5, TRUE_CENTER + 5, 0.25)
+    rec = center_scan(prj[:, 8], theta, centers, ncore=2)
+    assert rec.shape == (len(centers), SIZE, SIZE)
+    values = center_metric(rec, metric=metric)
+    assert abs(_parabola_minimum(centers, values) - TRUE_CENTER) < 0.15
+
+
+def test_center_scan_matches_single_centers():
+    prj, theta = phantom_projections(num_angles=60)
+    centers = np.array([TRUE_CENTER - 1, TRUE_CENTER, TRUE_CENTER + 1.5])
+    rec = center_scan(prj[:, 8], theta, centers, ncore=3)
+    for i, center in enumerate(centers):
+        single = center_scan(prj[:, 8], theta, [center], ncore=1)
+        np.testing.assert_allclose(rec[i], single[0], atol=1e-5)
+
+
+def test_unknown_metric():
+    with pytest.raises(ValueError):
+        center_metric(np.zeros((2, 8, 8)), metric="unknown")
+
+
+def test_find_center_pyramid():
+    prj, theta = phantom_projections()
+    sinogram = prj[:, 8]
+    # level with ds_factor 2: pairs of detector pixels averaged
+    coarse = sinogram.reshape(len(theta), SIZE // 2, 2).mean(axis=2)
+    center, curves = find_center_pyramid(
+        [(2, coarse), (1, sinogram)], theta, (SIZE - 1) / 2, search_range=10
+    )
+    assert abs(center - TRUE_CENTER) < 0.15
+    assert [curve["ds_factor"] for curve in curves] == [2, 1, 1]
+
+
+@pytest.mark.parametrize("tilt_deg", [0.0, 1.0])
+def test_find_center_mirror(tilt_deg):
+    prj, theta = phantom_projections(num_rows=64, tilt_deg=tilt_deg, endpoint=True)
+    center, tilt = find_center_mirror(prj, theta)
+    assert abs(center - TRUE_CENTER) < 0.2
+    assert abs(tilt - tilt_deg) < 0.2
+
+
+@pytest.mark.parametrize("num_rows", [8, 16])
+def test_find_center_mirror_few_rows(num_rows):
+    prj, theta = phantom_projections(num_rows=num_rows, endpoint=True)
+    center, tilt = find_center_mirror(prj, theta)
+    assert abs(center - TRUE_CENTER) < 0.2
+    assert tilt == 0
+
+
+def test_find_center_mirror_without_pairs():
+    prj, theta = phantom_projections(num_angles=10)
+    assert find_center_mirror(prj, theta[:5]) == (None, None)
+
+
+def test_find_center_mirror_rejects_weak_peaks():
+    prj = np.random.default_rng(0).random((181, 64, SIZE))
+    theta = np.deg2rad(np.linspace(0, 180, 181))
+    assert find_center_mirror(prj, theta) == (None, None)
+
+
+def test_fit_center_rows():
+    prj, theta = phantom_projections(num_rows=64, tilt_deg=2.0)
+    rows = [8, 24, 40, 56]
+    fit = fit_center_rows(
+        prj, theta, rows, TRUE_CENTER, 3, step=0.25, metric="negativity", n_jobs=2
+    )
+    assert fit["rows"] == rows
+    assert abs(fit["tilt_deg"] - 2.0) < 0.25
+    middle = fit["intercept"] + fit["slope"] * 31.5
+    assert abs(middle - TRUE_CENTER) < 0.2
+    expected = TRUE_CENTER + np.tan(np.deg2rad(2.0)) * (np.array(rows) - 31.5)
+    np.testing.assert_allclose(fit["centers"], expected, atol=0.2)
+
+
+def test_scale_center_fit():
+    fit = {
+        "rows": [2, 10],
+        "centers": [30.0, 31.0],
+        "slope": 0.125,
+        "intercept": 29.75,
+        "residuals": [0.0, 0.0],
+        "tilt_deg": 7.125,
+    }
+    scaled = scale_center_fit(fit, 2)
+    assert scaled["rows"] == [4, 20]
+    assert scaled["centers"] == [60.5, 62.5]
+    # the scaled line passes through the scaled centers
+    for row, center in zip([4.5, 20.5], scaled["centers"]):
+        assert scaled["intercept"] + scaled["slope"] * row == pytest.approx(center)
+    assert scale_center_fit(fit, 1) is fit
+
+
+def test_find_center_vo():
+    import tomopy
+
+    prj, theta = phantom_projections()
+    coarse, fine = find_center_vo(prj, ncore=2)
+    assert abs(coarse - TRUE_CENTER) <= 1
+    assert abs(fine - tomopy.find_center_vo(prj, ind=8)) <= 0.25
+    assert abs(fine - TRUE_CENTER) < 0.5
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("tomopy")
+
+from tomopyui.backend.util import center_cache  # noqa: E402
+from tomopyui.backend.util.center import write_center  # noqa: E402
+from tomopyui.backend.util.center_cache import (  # noqa: E402
+    CenterScanCache,
+    sinogram_fingerprint,
+)
+
+SIZE = 64
+
+
+@pytest.fixture
+def projections():
+    rng = np.random.default_rng(0)
+    prj = rng.random((30, 4, SIZE), dtype=np.float32)
+    theta = np.linspace(0, np.pi, 30, endpoint=False)
+    return prj, theta
+
+
+@pytest.fixture
+def computed(monkeypatch):
+    """
+    Records the centers that the cache reconstructs with write_center.
+    """
+    centers = []
+
+    def recording_write_center(*args, center=None, **kwargs):
+        centers.extend(center)
+        return write_center(*args, center=center, **kwargs)
+
+    monkeypatch.setattr(center_cache, "write_center", recording_write_center)
+    return centers
+
+
+def test_overlapping_scans_reconstruct_new_centers(projections, computed):
+    prj, theta = projections
+    cache = CenterScanCache()
+    cache.scan(prj, theta, cen_range=(30, 32, 0.5), ind=1)
+    assert computed == [30, 30.5, 31, 31.5]
+    computed.clear()
+    rec, center = cache.scan(prj, theta, cen_range=(31, 33, 0.5), ind=1)
+    assert computed == [32, 32.5]
+    np.testing.assert_array_equal(center, [31, 31.5, 32, 32.5])
+    assert (cache.hits, cache.misses) == (2, 6)
+    # another row is another scan
+    computed.clear()
+    cache.scan(prj, theta, cen_range=(31, 33, 0.5), ind=2)
+    assert len(computed) == 4
+
+
+def test_scan_matches_write_center(projections):
+    prj, theta = projections
+    cache = CenterScanCache()
+    cache.scan(prj, theta, cen_range=(30, 32, 0.5), ind=1)
+    rec, center = cache.scan(prj, theta, cen_range=(29, 33, 0.5), ind=1)
+    expected, expected_center = write_center(prj, theta, cen_range=(29, 33, 0.5), ind=1)
+    np.testing.assert_array_equal(center, expected_center)
+    np.testing.assert_array_equal(rec, expected)
+
+
+def test_disk_store_reloads(projections, computed, tmp_path):
+    prj, theta = projections
+    first, _ = CenterScanCache(cache_dir=tmp_path).scan(
+        prj, theta, cen_range=(30, 32, 0.5), ind=1
+    )
+    assert len(list(tmp_path.glob("*.npz"))) == 1
+    computed.clear()
+    cache = CenterScanCache(cache_dir=tmp_path)
+    rec, _ = cache.scan(prj, theta, cen_range=(30, 32, 0.5), ind=1)
+    assert computed == []
+    assert cache.hits == 4
+    np.testing.assert_array_equal(rec, first)
+    cache.clear(disk=True)
+    assert list(tmp_path.glob("*.npz")) == []
+
+
+def test_lru_eviction_respects_max_bytes():
+    image = np.zeros((SIZE, SIZE), dtype=np.float32)
+    cache = CenterScanCache(max_bytes=5 * image.nbytes)
+    keys = [cache.key(sinogram_fingerprint(image + i, [0.0])) for i in range(3)]
+    cache.put(keys[0], [1.0, 2.0], [image, image])
+    cache.put(keys[1], [1.0, 2.0], [image, image])
+    assert cache.nbytes == 4 * image.nbytes
+    # using the first scan makes the second the least recently used
+    assert len(cache.get(keys[0], [1.0])) == 1
+    cache.put(keys[2], [1.0, 2.0], [image, image])
+    assert cache.nbytes <= cache.max_bytes
+    assert cache.get(keys[1], [1.0, 2.0]) == {}
+    assert len(cache.get(keys[0], [1.0, 2.0])) == 2
+    assert len(cache.get(keys[2], [1.0, 2.0])) == 2
@@ -0,0 +1,126 @@
+import types
+
+import numpy as np
+import pytest
+
+from tomopyui.backend.util.checkpoint import AlignmentCheckpoint, resume_iteration
+from tomopyui.backend.util.padding import pad_projections
+from tomopyui.backend.util.scratch import ScratchArrays
+
+
+def make_run(recon, num_angles=4, num_iter=10):
+    rng = np.random.default_rng(0)
+    return types.SimpleNamespace(
+        sx=rng.normal(size=num_angles),
+        sy=rng.normal(size=num_angles),
+        shift=rng.normal(size=(2, num_angles)),
+        conv=np.arange(num_iter, dtype=np.float64),
+        recon=recon,
+        pad_ds=(4, 2),
+        pyramid_level=0,
+        sx_init=np.zeros(num_angles),
+        sy_init=np.ones(num_angles),
+        level_index=1,
+        levels=[{"pyramid_level": 1, "sx": [0.5]}],
+        current_angle_stride=2,
+    )
+
+
+def resumed_run(state, scratch=None, num_iter=10):
+    return types.SimpleNamespace(
+        resume_state=state, conv=np.zeros(num_iter), scratch=scratch
+    )
+
+
+def test_round_trip(tmp_path):
+    recon = np.random.default_rng(1).random((3, 8, 8)).astype(np.float32)
+    run = make_run(recon)
+    checkpoint = AlignmentCheckpoint(tmp_path, every_iters=1)
+    checkpoint.save(run, 4, center=7.5, scale=2.0)
+    state = AlignmentCheckpoint.load(tmp_path)
+    assert int(state["iteration"]) == 5
+    assert float(state["center"]) == 7.5
+    assert state["levels"] == run.levels
+    np.testing.assert_array_equal(state["sx_init"], run.sx_init)
+
+    resumed = resumed_run(state)
+    assert resume_iteration(resumed, scale=1.0) == 5
+    assert resumed.resume_state is None
+    np.testing.assert_array_equal(resumed.sx, run.sx)
+    np.testing.assert_array_equal(resumed.sy, run.sy)
+    np.testing.assert_array_equal(resumed.shift, run.shift)
+    np.testing.assert_array_equal(resumed.conv[:5], run.conv[:5])
+    np.testing.assert_allclose(resumed.recon, 2 * recon)
+    assert resumed.current_angle_stride == 2
+
+    checkpoint.remove()
+    assert AlignmentCheckpoint.load(tmp_path) is None
+
+
+def test_memory_mapped_recon(tmp_path):
+    scratch = ScratchArrays(tmp_path / "scratch")
+    recon = scratch.zeros("recon", (5, 8, 8))
+    recon[:] = np.random.default_rng(2).random(recon.shape)
+    run = make_run(recon)
+    checkpoint = AlignmentCheckpoint(tmp_path, every_iters=1)
+    checkpoint.save(run, 2, center=4.0)
+    checkpoint.save(run, 3, center=4.0)
+    recon_files = sorted(p.name for p in tmp_path.glob("*.npy"))
+    assert recon_files == [AlignmentCheckpoint.recon_prefix + "4.npy"]
+
+    state = AlignmentCheckpoint.load(tmp_path)
+    assert isinstance(state["recon"], np.memmap)
+    resumed = resumed_run(state, scratch)
+    assert resume_iteration(resumed, scale=0.5) == 4
+    assert isinstance(resumed.recon, np.memmap)
+    np.testing.assert_allclose(resumed.recon, 2 * np.asarray(recon))
+
+    checkpoint.remove()
+    assert not list(tmp_path.glob("*.npy"))
+    assert not list(tmp_path.glob("*.npz"))
+
+
+def test_nothing_to_resume():
+    assert resume_iteration(types.SimpleNamespace(resume_state=None)) == 0
+
+
+@pytest.mark.parametrize(
+    "every_iters, every_minutes, n, due",
+    [(0, 0, 9, False), (5, 0, 4, True), (5, 0, 5, False), (0, 1e-9, 0, True)],
+)
+def test_due(tmp_path, every_iters, every_minutes, n, due):
+    checkpoint = AlignmentCheckpoint(tmp_path, every_iters, every_minutes)
+    assert checkpoint.due(n) is due
+
+
+def checkpoint_run(pad_ds, checkpoint_pad_ds):
+    prj = np.ones((3, 4, 6), dtype=np.float32)
+    state = {
+        "center": 5.0,
+        "pad_ds": np.array(checkpoint_pad_ds),
+        "sx_init": np.zeros(3),
+        "sy_init": np.zeros(3),
+        "sx": np.array([0.0, 5.0, -1.0]),
+        "sy": np.zeros(3),
+    }
+    return types.SimpleNamespace(
+        prjs=pad_projections(prj, pad_ds), pad_ds=pad_ds, resume_state=state
+    )
+
+
+def test_shift_to_checkpoint_pads_like_checkpoint():
+    runanalysis = pytest.importorskip("tomopyui.backend.runanalysis")
+    run = checkpoint_run((1, 1), (2, 3))
+    runanalysis.RunAlign._shift_to_checkpoint(run)
+    assert run.pad_ds == (2, 3)
+    assert run.prjs.shape == (3, 4 + 2 * 3, 6 + 2 * 2)
+    assert run.center == 5.0
+    # the second projection would leave the padding
+    np.testing.assert_array_equal(run.resume_state["sx"], [0, 0, -1])
+
+
+def test_shift_to_checkpoint_with_less_padding():
+    runanalysis = pytest.importorskip("tomopyui.backend.runanalysis")
+    run = checkpoint_run((2, 2), (1, 3))
+    with pytest.raises(ValueError, match="padding"):
+        runanalysis.RunAlign._shift_to_checkpoint(run)
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+from tomopyui.backend.util.convergence import (
+    EarlyStopping,
+    next_angle_stride,
+    recon_iterations,
+)
+
+
+def run_until_stop(stopping, conv, err=None, strides=None):
+    """
+    Index of the iteration that stops the loop, or None.
+    """
+    for n in range(len(conv)):
+        stride = 1 if strides is None else strides[n]
+        update = [1.0] if err is None else err[n]
+        if stopping.update(conv[: n + 1], update, stride):
+            return n
+    return None
+
+
+def test_disabled_criteria_never_stop():
+    stopping = EarlyStopping()
+    assert run_until_stop(stopping, np.zeros(5)) is None
+    assert stopping.reason == "num_iter"
+
+
+def test_conv_threshold_in_full_resolution_pixels():
+    conv = np.array([4.0, 2.0, 0.9, 0.4])
+    assert run_until_stop(EarlyStopping(conv_threshold=1), conv) == 2
+    # conv of data downsampled by 4 is 4 times smaller than at full resolution
+    stopping = EarlyStopping(conv_threshold=1, ds_factor=4)
+    assert run_until_stop(stopping, conv) is None
+
+
+def test_conv_rtol_and_patience():
+    conv = np.array([10.0, 5.0, 4.9, 4.85, 4.8])
+    stopping = EarlyStopping(conv_rtol=0.05)
+    assert run_until_stop(stopping, conv) == 2
+    assert stopping.reason == "conv_rtol"
+    assert run_until_stop(EarlyStopping(conv_rtol=0.05, patience=3), conv) == 4
+
+
+def test_patience_needs_consecutive_iterations():
+    conv = np.array([10.0, 9.9, 5.0, 4.99, 2.0])
+    assert run_until_stop(EarlyStopping(conv_rtol=0.05, patience=2), conv) is None
+
+
+def test_shift_tol():
+    conv = np.ones(3)
+    err = [[0.5, 2.0], [0.5, 0.4], [0.1, 0.1]]
+    stopping = EarlyStopping(shift_tol=1)
+    assert run_until_stop(stopping, conv, err) == 1
+    assert stopping.reason == "shift_tol"
+
+
+def test_conv_rtol_does_not_compare_across_strides():
+    # conv of a stride 2 iteration sums half the projections, so 5.5 and 5.6 are
+    # not comparable
+    conv = np.array([8.0, 5.5, 5.6, 3.0, 2.95])
+    strides = [2, 2, 1, 1, 1]
+    stopping = EarlyStopping(conv_rtol=0.05)
+    assert run_until_stop(stopping, conv, strides=strides) == 4
+
+
+def test_strided_iterations_do_not_stop():
+    stopping = EarlyStopping(conv_threshold=10)
+    assert run_until_stop(stopping, np.ones(3), strides=[4, 2, 1]) == 2
+
+
+def test_from_run():
+    class Run:
+        conv_threshold = 0.5
+        conv_rtol = 0.01
+        patience = 0
+        ds_factor = 2
+
+    stopping = EarlyStopping.from_run(Run)
+    assert stopping.conv_threshold == 0.5
+    assert stopping.conv_rtol == 0.01
+    assert stopping.shift_tol == 0
+    assert stopping.patience == 1
+    assert stopping.ds_factor == 2
+
+
+@pytest.mark.parametrize(
+    "stride, conv, expected",
+    [
+        (1, [100.0], 1),
+        (8, [100.0], 8),
+        (8, [5.0], 4),
+        (8, [100.0, 90.0], 8),
+        (8, [100.0, 110.0], 4),
+        (3, [1.0], 1),
+    ],
+)
+def test_next_angle_stride(stride, conv, expected):
+    assert next_angle_stride(stride, np.array(conv), num_angles=100) == expected
+
+
+def test_recon_iterations():
+    assert recon_iterations(0, pre_alignment_iters=5, recon_iters=[1, 2]) == 5
+    assert [recon_iterations(n, 5, [1, 2, 3]) for n in range(1, 6)] == [1, 2, 3, 3, 3]
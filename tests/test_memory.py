@@ -0,0 +1,90 @@
+import pytest
+
+from tomopyui.backend.util.memory import estimate_memory, plan_memory
+
+SHAPE = (180, 512, 512)
+PAD = (32, 32)
+
+
+@pytest.fixture
+def cuda(monkeypatch):
+    monkeypatch.setenv("cuda_enabled", "True")
+
+
+def host_peak(level, analysis="align", method="gridrec"):
+    return estimate_memory(SHAPE, PAD, level, 1, method, analysis)["host_peak"]
+
+
+def test_fits_keeps_requested_settings():
+    plan = plan_memory(
+        SHAPE, PAD, pyramid_level=0, num_batches=3, host_budget=host_peak(0)
+    )
+    assert plan.fits
+    assert plan.pyramid_level == 0
+    assert plan.num_batches == 3
+    assert not plan.stream
+    assert plan.messages == []
+
+
+def test_host_limited_recommends_finest_level_that_fits():
+    plan = plan_memory(SHAPE, PAD, pyramid_level=-1, host_budget=host_peak(0))
+    assert not plan.fits
+    assert plan.pyramid_level == 0
+    assert not plan.stream
+    assert plan.recommended_estimate["host_peak"] <= plan.host_budget
+    assert "Recommended downsample factor: 2." in plan.messages
+
+
+def test_nothing_fits_recommends_streaming():
+    plan = plan_memory(SHAPE, PAD, host_budget=host_peak(2) - 1)
+    assert not plan.fits
+    assert plan.stream
+    assert plan.pyramid_level == 2
+    assert any("streamed from disk" in message for message in plan.messages)
+
+
+def test_methods_use_largest_estimate():
+    budget = host_peak(-1, "recon", "gridrec")
+    assert plan_memory(
+        SHAPE, PAD, methods=["gridrec"], analysis="recon", host_budget=budget
+    ).fits
+    assert not plan_memory(
+        SHAPE, PAD, methods=["gridrec", "sirt"], analysis="recon", host_budget=budget
+    ).fits
+
+
+def test_cpu_methods_have_no_gpu_estimate(cuda):
+    est = estimate_memory(SHAPE, PAD, -1, 1, "gridrec", "align")
+    assert est["gpu"] == {}
+    assert est["gpu_peak"] == 0
+
+
+def test_gpu_limited_recommends_more_batches(cuda):
+    gpu = [
+        estimate_memory(SHAPE, PAD, -1, batches, "SIRT_CUDA", "align")["gpu_peak"]
+        for batches in (1, 4, 5)
+    ]
+    assert gpu[0] > gpu[1] > gpu[2]
+    plan = plan_memory(
+        SHAPE,
+        PAD,
+        num_batches=1,
+        methods=["SIRT_CUDA"],
+        host_budget=10**12,
+        gpu_budget=gpu[1],
+    )
+    assert not plan.fits
+    assert plan.pyramid_level == -1
+    assert plan.num_batches <= 4
+    assert plan.recommended_estimate["gpu_peak"] <= gpu[1]
+    assert f"Recommended number of batches: {plan.num_batches}." in plan.messages
+
+
+def test_gpu_too_small_at_any_level(cuda):
+    plan = plan_memory(
+        SHAPE, PAD, methods=["SIRT_3D"], host_budget=10**12, gpu_budget=1
+    )
+    assert not plan.fits
+    assert not plan.stream
+    assert plan.pyramid_level == 2
+    assert any("GPU memory is too small" in message for message in plan.messages)
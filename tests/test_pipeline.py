@@ -0,0 +1,23 @@
+import pytest
+
+from tomopyui.backend.util.pipeline import Pipeline
+
+
+def test_results_in_order():
+    pipeline = Pipeline([("double", lambda x: 2 * x, 3), ("add", lambda x: x + 1, 2)])
+    assert pipeline.run(range(20)) == [2 * x + 1 for x in range(20)]
+    stats = pipeline.utilization()
+    assert stats["double"]["items"] == 20
+    assert stats["add"]["items"] == 20
+    assert stats["wall_seconds"] > 0
+
+
+def test_first_exception_is_raised():
+    def fail(x):
+        if x == 3:
+            raise RuntimeError("stage failed")
+        return x
+
+    pipeline = Pipeline([("fail", fail, 1), ("identity", lambda x: x, 1)])
+    with pytest.raises(RuntimeError, match="stage failed"):
+        pipeline.run(range(10))
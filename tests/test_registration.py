@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+import scipy.ndimage as ndi
+from skimage.registration import phase_cross_correlation as skimage_pcc
+
+from tomopyui.backend.util.registration._phase_cross_correlation_cpu import (
+    phase_cross_correlation,
+)
+
+
+def make_pairs(num_images=6, shape=(64, 80), seed=0):
+    rng = np.random.default_rng(seed)
+    reference = ndi.gaussian_filter(rng.random((num_images,) + shape), (0, 2, 2))
+    shifts = rng.uniform(-6, 6, (num_images, 2))
+    moving = np.stack(
+        [
+            np.fft.ifftn(ndi.fourier_shift(np.fft.fftn(image), shift)).real
+            for image, shift in zip(reference, shifts)
+        ]
+    )
+    return reference.astype(np.float32), moving.astype(np.float32), shifts
+
+
+@pytest.mark.parametrize("upsample_factor, tol", [(1, 0.0), (10, 0.1), (20, 0.05)])
+def test_matches_skimage(upsample_factor, tol):
+    reference, moving, _ = make_pairs()
+    shifts = phase_cross_correlation(reference, moving, upsample_factor, workers=1)
+    expected = np.stack(
+        [
+            skimage_pcc(r, m, upsample_factor=upsample_factor, normalization=None)[0]
+            for r, m in zip(reference, moving)
+        ],
+        axis=1,
+    )
+    assert shifts.shape == (2, len(reference))
+    np.testing.assert_allclose(shifts, expected, atol=tol + 1e-9)
+
+
+def test_recovers_shifts():
+    reference, moving, true_shifts = make_pairs(seed=1)
+    shifts = phase_cross_correlation(reference, moving, 20, workers=1)
+    # skimage convention: the shift that registers moving with reference
+    np.testing.assert_allclose(shifts.T, -true_shifts, atol=0.1)
+
+
+def test_shape_mismatch():
+    with pytest.raises(ValueError):
+        phase_cross_correlation(np.zeros((2, 8, 8)), np.zeros((2, 8, 9)))
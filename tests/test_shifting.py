@@ -0,0 +1,95 @@
+import types
+
+import numpy as np
+import scipy.ndimage as ndi
+
+from tomopyui.backend.util.padding import pad_projections
+from tomopyui.backend.util.shifting import (
+    initial_shifts,
+    shift_projections,
+    shift_stack,
+    within_pad,
+)
+
+
+def padded_stack(num_images=5, shape=(24, 32), pad=(8, 6), seed=0):
+    rng = np.random.default_rng(seed)
+    images = ndi.gaussian_filter(rng.random((num_images,) + shape), (0, 2, 2))
+    return pad_projections(images.astype(np.float32), pad)
+
+
+def test_shift_stack_integer_shifts_match_ndimage():
+    prj = padded_stack()
+    sx = np.array([0, 1, -2, 3, -4])
+    sy = np.array([0, -1, 2, 0, 5])
+    out = shift_stack(prj, sx, sy, workers=1)
+    for i in range(len(prj)):
+        expected = ndi.shift(prj[i], (sy[i], sx[i]), order=1, mode="grid-wrap")
+        np.testing.assert_allclose(out[i], expected, atol=1e-5)
+
+
+def test_shift_stack_subpixel_shifts_match_fourier_shift():
+    prj = padded_stack()
+    sx = np.array([0.5, 3.25, -0.75, 1.1, -2.6])
+    sy = np.array([-0.5, 0.25, 1.75, -3.3, 0.9])
+    out = shift_stack(prj, sx, sy, workers=1)
+    for i in range(len(prj)):
+        spectrum = ndi.fourier_shift(np.fft.fft2(prj[i]), (sy[i], sx[i]))
+        np.testing.assert_allclose(out[i], np.fft.ifft2(spectrum).real, atol=2e-3)
+
+
+def test_shift_stack_in_place_and_batches():
+    prj = padded_stack()
+    sx = np.linspace(-3, 3, len(prj))
+    sy = np.linspace(2, -2, len(prj))
+    expected = shift_stack(prj, sx, sy, workers=1)
+    in_place = prj.copy()
+    result = shift_stack(in_place, sx, sy, out=in_place, batch_size=2, workers=1)
+    assert result is in_place
+    np.testing.assert_allclose(in_place, expected, atol=1e-5)
+
+
+def test_shift_stack_mask_copies_unshifted():
+    prj = padded_stack()
+    sx = np.full(len(prj), 2.0)
+    sy = np.zeros(len(prj))
+    mask = np.array([True, False, True, False, True])
+    out = np.full_like(prj, np.nan)
+    shift_stack(prj, sx, sy, out=out, mask=mask, workers=1)
+    np.testing.assert_array_equal(out[~mask], prj[~mask])
+    np.testing.assert_allclose(out[mask], np.roll(prj[mask], 2, axis=2), atol=1e-5)
+
+
+def test_shift_stack_view_of_input_is_in_place():
+    prj = padded_stack()
+    sx = np.array([1.0, 0, 0, 0, 0])
+    sy = np.zeros(len(prj))
+    expected = shift_stack(prj, sx, sy, workers=1)
+    view = prj[:]
+    shift_stack(prj, sx, sy, out=view, mask=sx != 0, workers=1)
+    np.testing.assert_allclose(prj, expected, atol=1e-5)
+
+
+def test_within_pad():
+    sx = np.array([0, 3, -3, 0])
+    sy = np.array([0, 0, 0, 4])
+    mask = within_pad(sx, sy, np.array([1, 1, -1, 0]), np.zeros(4), (4, 4))
+    np.testing.assert_array_equal(mask, [True, False, False, False])
+
+
+def test_initial_shifts():
+    run = types.SimpleNamespace(prjs=np.zeros((3, 4, 4)))
+    sx, sy = initial_shifts(run)
+    np.testing.assert_array_equal(sx, np.zeros(3))
+    np.testing.assert_array_equal(sy, np.zeros(3))
+    run.sx_init = [1, 2, 3]
+    sx, sy = initial_shifts(run)
+    np.testing.assert_array_equal(sx, [1.0, 2.0, 3.0])
+    sx[0] = 10
+    assert run.sx_init[0] == 1
+
+
+def test_shift_projections_pads_by_largest_shift():
+    prj = np.ones((2, 10, 12), dtype=np.float32)
+    out = shift_projections(prj, [0.5, -2.0], [1.0, 0.0])
+    assert out.shape == (2, 10 + 2 * 1, 12 + 2 * 2)
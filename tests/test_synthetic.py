@@ -0,0 +1,35 @@
+import filecmp
+
+import numpy as np
+
+from tomopyui.backend.util import synthetic
+
+
+def test_write_ssrl62c_does_not_depend_on_chunk_size(tmp_path):
+    kwargs = dict(scale="tiny", num_exposures=2, jitter_std=1.0, photons=0)
+    synthetic.write_ssrl62c(tmp_path / "one", chunk_size=1, **kwargs)
+    synthetic.write_ssrl62c(tmp_path / "all", chunk_size=100, **kwargs)
+    files = sorted(p.name for p in (tmp_path / "one").glob("*.xrm"))
+    assert len(files) == 2 * synthetic.SCALES["tiny"][0] + 3 * 5
+    match, mismatch, errors = filecmp.cmpfiles(
+        tmp_path / "one", tmp_path / "all", files, shallow=False
+    )
+    assert not mismatch and not errors
+
+
+def test_write_all_passes_each_writer_its_kwargs(tmp_path):
+    truth = synthetic.write_all(
+        tmp_path, chunk_size=8, energies=(8000.0, 8100.0), num_rows=16, photons=0
+    )
+    assert set(truth) == {
+        "SSRL62C",
+        "SSRL62B",
+        "ALS832",
+        "APS",
+        "prenormalized_tif",
+        "prenormalized_npy",
+    }
+    assert truth["SSRL62C"]["energies"] == [8000.0, 8100.0]
+    assert truth["ALS832"]["shape"][1] == 16
+    prj = np.load(next((tmp_path / "prenormalized_npy").glob("*.npy")))
+    assert prj.shape[1] == 16
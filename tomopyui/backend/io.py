@@ -23,12 +23,94 @@ from abc import ABC, abstractmethod
 from tomopy.sim.project import angles as angle_maker
 from tomopyui.backend.util.dxchange.reader import read_ole_metadata, read_xrm
 from tomopyui.backend.util.dask_downsample import pyramid_reduce_gaussian
+from tomopyui.backend.util.profiling import StageProfiler
 from skimage.transform import rescale
 from joblib import Parallel, delayed
 from ipywidgets import *
 from functools import partial
 
 
+class DatasetDescriptor:
+    """
+    Lightweight handle to an array of projections or reconstructions.
+
+    The array can be a numpy array (including memmaps), an h5py dataset or a dask
+    array. Shape, dtype and size are read from the handle, so describing a dataset
+    that lives on disk or is lazy does not load it. Creating one is cheap, which
+    makes it suitable for the many short-lived `Projections_Child` objects created
+    while browsing data and running analyses.
+
+    Parameters
+    ----------
+    array : array-like, optional
+        Array handle. None for an empty dataset.
+
+    Attributes
+    ----------
+    array : array-like or None
+        The wrapped handle.
+    shape : tuple
+        Shape of the array, () if empty.
+    dtype : numpy.dtype or None
+        Data type of the array.
+    nbytes : int
+        Size of the array in bytes, whether or not it is in memory.
+    """
+
+    __slots__ = ("array", "shape", "dtype", "nbytes")
+
+    def __init__(self, array=None):
+        self.array = array
+        if array is None:
+            self.shape = ()
+            self.dtype = None
+            self.nbytes = 0
+        else:
+            self.shape = tuple(int(x) for x in array.shape)
+            self.dtype = np.dtype(array.dtype)
+            self.nbytes = int(np.prod(self.shape, dtype=np.int64)) * self.dtype.itemsize
+
+    def __repr__(self):
+        kind = type(self.array).__name__
+        return f"DatasetDescriptor({kind}, shape={self.shape}, dtype={self.dtype})"
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size_gb(self):
+        return self.nbytes / 1e9
+
+    @property
+    def in_memory(self):
+        """
+        True if the data is a numpy array that is loaded in memory.
+        """
+        return isinstance(self.array, np.ndarray) and not isinstance(
+            self.array, np.memmap
+        )
+
+    def __getitem__(self, key):
+        """
+        Reads only the requested region, e.g. dataset[:, y0:y1, x0:x1].
+        """
+        subset = self.array[key]
+        if isinstance(subset, da.Array):
+            subset = subset.compute()
+        return subset
+
+    def load(self):
+        """
+        Returns the data as a numpy array in memory.
+        """
+        if self.array is None or self.in_memory:
+            return self.array
+        if isinstance(self.array, da.Array):
+            return self.array.compute()
+        return self.array[()]
+
+
 class IOBase:
     """
     Base class for all data imported. Contains some setter/getter attributes that also
@@ -75,16 +157,18 @@ class IOBase:
 
     def __init__(self):
 
-        self._data = np.random.rand(10, 100, 100)
-        self.data = self._data
-        self.data_ds = self.data
+        self._dataset = DatasetDescriptor()
+        self.data_ds = None
         self.imported = False
         self._filepath = pathlib.Path()
         self.dtype = None
         self.shape = None
-        self.pxX = self._data.shape[2]
-        self.pxY = self._data.shape[1]
-        self.pxZ = self._data.shape[0]
+        self.pxX = 0
+        self.pxY = 0
+        self.pxZ = 0
+        self.rangeX = (0, -1)
+        self.rangeY = (0, -1)
+        self.rangeZ = (0, -1)
         self.size_gb = None
         self.filedir = None
         self.filename = None
@@ -95,22 +179,53 @@ class IOBase:
         self.single_file = False
         self.hist = None
         self.allowed_extensions = [".npy", ".tiff", ".tif"]
-        self.metadata = Metadata_General_Prenorm()
+        self._metadata = None
         self.hdf_file = None
 
+    @property
+    def metadata(self):
+        # Created on first use: metadata classes make widgets, and most children
+        # never need the default one.
+        if self._metadata is None:
+            self._metadata = Metadata_General_Prenorm()
+        return self._metadata
+
+    @metadata.setter
+    def metadata(self, value):
+        self._metadata = value
+
+    @property
+    def dataset(self):
+        """
+        `DatasetDescriptor` of the current data.
+        """
+        return self._dataset
+
+    @property
+    def _data(self):
+        return self._dataset.array
+
+    @_data.setter
+    def _data(self, value):
+        self._dataset = DatasetDescriptor(value)
+
     @property
     def data(self):
-        return self._data
+        return self._dataset.array
 
     @data.setter
     def data(self, value):
-        (self.pxZ, self.pxY, self.pxX) = self._data.shape
-        self.rangeX = (0, self.pxX - 1)
-        self.rangeY = (0, self.pxY - 1)
-        self.rangeZ = (0, self.pxZ - 1)
-        self.size_gb = self._data.nbytes / 1048576 / 1000
-        self.dtype = self._data.dtype
-        self._data = value
+        if value is not self._dataset.array:
+            self._dataset = DatasetDescriptor(value)
+        dataset = self._dataset
+        if dataset.ndim == 3:
+            (self.pxZ, self.pxY, self.pxX) = dataset.shape
+            self.rangeX = (0, self.pxX - 1)
+            self.rangeY = (0, self.pxY - 1)
+            self.rangeZ = (0, self.pxZ - 1)
+        if dataset.array is not None:
+            self.size_gb = dataset.nbytes / 1048576 / 1000
+            self.dtype = dataset.dtype
 
     @property
     def filepath(self):
@@ -210,10 +325,8 @@ class IOBase:
         else:
             x = px_range[0]
             y = px_range[1]
-            self.data_returned = self.hdf_file[ds_data_key]
-            self.data_returned = copy.deepcopy(
-                self.data_returned[:, y[0] : y[1], x[0] : x[1]]
-            )
+            # slicing an h5py dataset already reads a new array
+            self.data_returned = self.hdf_file[ds_data_key][:, y[0] : y[1], x[0] : x[1]]
 
     @_check_and_open_hdf
     def _return_data(self, px_range=None):
@@ -225,6 +338,41 @@ class IOBase:
             :, y[0] : y[1], x[0] : x[1]
         ]
 
+    @_check_and_open_hdf
+    def _return_data_padded(
+        self, scratch, pyramid_level=-1, px_range=None, pad=(0, 0), batch_size=32
+    ):
+        """
+        Like _return_data (pyramid_level -1) and _return_ds_data, but copies the
+        data batch_size projections at a time into the middle of a zero-padded
+        memory-mapped array made with scratch, a
+        `tomopyui.backend.util.scratch.ScratchArrays`. The data is never in memory
+        at once, and no padded copy is made.
+
+        Parameters
+        ----------
+        pad : tuple
+            Padding in x and y.
+        """
+        if pyramid_level == -1:
+            dataset = self.hdf_file[self.hdf_key_norm_proj]
+        else:
+            pyramid_level = self.hdf_key_ds + str(pyramid_level) + "/"
+            dataset = self.hdf_file[pyramid_level + self.hdf_key_data]
+        if px_range is None:
+            px_range = ([0, dataset.shape[2]], [0, dataset.shape[1]])
+        x = slice(px_range[0][0], px_range[0][1])
+        y = slice(px_range[1][0], px_range[1][1])
+        height = len(range(dataset.shape[1])[y])
+        width = len(range(dataset.shape[2])[x])
+        shape = (dataset.shape[0], height + 2 * pad[1], width + 2 * pad[0])
+        self.data_returned = scratch.zeros("prjs", shape)
+        for start in range(0, shape[0], batch_size):
+            stop = min(start + batch_size, shape[0])
+            self.data_returned[
+                start:stop, pad[1] : pad[1] + height, pad[0] : pad[0] + width
+            ] = dataset[start:stop, y, x]
+
     @_check_and_open_hdf
     def _delete_downsampled_data(self):
         if self.hdf_key_ds in self.hdf_file:
@@ -424,6 +572,16 @@ class IOBase:
         return fullpaths_of_files_with_ext
 
 
+def _alias(name):
+    """
+    Property that reads and writes attribute `name` under another name.
+    """
+    return property(
+        lambda self: getattr(self, name),
+        lambda self, value: setattr(self, name, value),
+    )
+
+
 class ProjectionsBase(IOBase, ABC):
 
     """
@@ -433,17 +591,15 @@ class ProjectionsBase(IOBase, ABC):
 
     """
 
-    # https://stackoverflow.com/questions/4017572/
-    # how-can-i-make-an-alias-to-a-non-function-member-attribute-in-a-python-class
-    aliases = {
-        "prj_imgs": "data",
-        "num_angles": "pxZ",
-        "width": "pxX",
-        "height": "pxY",
-        "px_range_x": "rangeX",
-        "px_range_y": "rangeY",
-        "px_range_z": "rangeZ",  # Could probably fix these
-    }
+    # Aliases are plain properties, so that other attribute lookups do not go through
+    # them.
+    prj_imgs = _alias("data")
+    num_angles = _alias("pxZ")
+    width = _alias("pxX")
+    height = _alias("pxY")
+    px_range_x = _alias("rangeX")
+    px_range_y = _alias("rangeY")
+    px_range_z = _alias("rangeZ")  # Could probably fix these
 
     def __init__(self):
         super().__init__()
@@ -453,16 +609,7 @@ class ProjectionsBase(IOBase, ABC):
         self.angles_deg = None
         self.saved_as_tiff = False
         self.tiff_folder = False
-
-    def __setattr__(self, name, value):
-        name = self.aliases.get(name, name)
-        object.__setattr__(self, name, value)
-
-    def __getattr__(self, name):
-        if name == "aliases":
-            raise AttributeError  # http://nedbatchelder.com/blog/201010/surprising_getattr_recursion.html
-        name = self.aliases.get(name, name)
-        return object.__getattribute__(self, name)
+        self.profiler = StageProfiler(enabled=False)
 
     def save_normalized_as_tiff(self):
         """
@@ -564,6 +711,35 @@ class Projections_Child(ProjectionsBase):
         self.parent_projections._close_hdf_file()
         print(self.data.shape)
 
+    def get_parent_data_padded_to_scratch(
+        self, scratch, pyramid_level=-1, px_range=None, pad=(0, 0)
+    ):
+        """
+        Copies data (pyramid_level -1) or downsampled data from the hdf file into a
+        padded memory-mapped array made with scratch, and stores it in self.data or
+        self.data_ds. Used by out-of-core alignment.
+
+        Returns
+        -------
+        numpy.memmap
+            The padded projections.
+        """
+        self.parent_projections._unload_hdf_normalized_and_ds()
+        self.parent_projections._return_data_padded(
+            scratch, pyramid_level, px_range, pad
+        )
+        data = self.parent_projections.data_returned
+        self.parent_projections._close_hdf_file()
+        if pyramid_level == -1:
+            self.data_ds = None
+            self._data = data
+            self.data = self._data
+        else:
+            self.data = None
+            self._data = None
+            self.data_ds = data
+        return data
+
     def get_parent_data_ds_from_hdf(self, pyramid_level, px_range=None):
         self.data = None
         self._data = None
@@ -605,6 +781,7 @@ class Projections_Prenormalized(ProjectionsBase):
             self.import_file_projections(Uploader)
             return
         self.tic = time.perf_counter()
+        self.profiler = StageProfiler()
         Uploader.import_status_label.value = "Importing file directory."
         self.filedir = Uploader.filedir
         if not Uploader.imported_metadata:
@@ -612,7 +789,8 @@ class Projections_Prenormalized(ProjectionsBase):
             self.metadata.set_attributes_from_metadata_before_import(self)
         cwd = os.getcwd()
         os.chdir(self.filedir)
-        self._data = dask_image.imread.imread("*.tif").astype(np.float32)
+        with self.profiler.stage("import"):
+            self._data = dask_image.imread.imread("*.tif").astype(np.float32)
         self.data = self._data
         self.metadata.set_metadata_from_attributes_after_import(self)
         print(self.metadata.metadata)
@@ -638,6 +816,7 @@ class Projections_Prenormalized(ProjectionsBase):
             self.import_filedir_projections(Uploader)
             return
         self.tic = time.perf_counter()
+        self.profiler = StageProfiler()
         Uploader.import_status_label.value = "Importing single file."
         self.imported = False
         self.filedir = Uploader.filedir
@@ -678,15 +857,17 @@ class Projections_Prenormalized(ProjectionsBase):
             self.imported = True
 
         elif any([x in self.filename for x in [".tif", ".tiff"]]):
-            self._data = dask_image.imread.imread(self.filepath).astype(np.float32)
-            self._data = da.where(da.isfinite(self._data), self._data, 0)
+            with self.profiler.stage("import"):
+                self._data = dask_image.imread.imread(self.filepath).astype(np.float32)
+                self._data = da.where(da.isfinite(self._data), self._data, 0)
             self.data = self._data
             self.save_data_and_metadata(Uploader)
             self.imported = True
 
         elif ".npy" in self.filename:
-            self._data = np.load(self.filepath).astype(np.float32)
-            self._data = np.where(np.isfinite(self._data), self._data, 0)
+            with self.profiler.stage("import"):
+                self._data = np.load(self.filepath).astype(np.float32)
+                self._data = np.where(np.isfinite(self._data), self._data, 0)
             self.data = self._data
             self.save_data_and_metadata(Uploader)
             self.imported = True
@@ -716,12 +897,14 @@ class Projections_Prenormalized(ProjectionsBase):
         Saves current data and metadata in import_savedir.
         """
         self.filedir = self.import_savedir
-        self._dask_hist_and_save_data()
+        with self.profiler.stage("hist_and_save"):
+            self._dask_hist_and_save_data()
         self.saved_as_tiff = False
         if Uploader.save_tiff_on_import_checkbox.value:
             Uploader.import_status_label.value = "Saving projections as .tiff."
             self.saved_as_tiff = True
-            self.save_normalized_as_tiff()
+            with self.profiler.stage("save_tiff"):
+                self.save_normalized_as_tiff()
             self.metadata.metadata["saved_as_tiff"] = True
         self.metadata.filedir = self.filedir
         self.toc = time.perf_counter()
@@ -729,7 +912,10 @@ class Projections_Prenormalized(ProjectionsBase):
         self.metadata.set_metadata_from_attributes_after_import(self)
         self.metadata.save_metadata()
         Uploader.import_status_label.value = "Checking for downsampled data."
-        self._check_downsampled_data(label=Uploader.import_status_label)
+        with self.profiler.stage("pyramid"):
+            self._check_downsampled_data(label=Uploader.import_status_label)
+        self.metadata.metadata["profile"] = self.profiler.as_dict()
+        self.metadata.save_metadata()
 
 
 class RawProjectionsBase(ProjectionsBase, ABC):
@@ -1351,6 +1537,7 @@ class RawProjectionsXRM_SSRL62C(RawProjectionsBase):
                 continue
             else:
                 _tmp_filedir = copy.deepcopy(self.filedir)
+                self.profiler = StageProfiler()
                 self.metadata = Metadata_SSRL62C_Prenorm()
                 self.metadata.set_parent_metadata(parent_metadata)
                 Uploader.upload_progress.value = 0
@@ -1385,12 +1572,14 @@ class RawProjectionsXRM_SSRL62C(RawProjectionsBase):
                 Uploader.upload_progress.max = len(self.flats_filenames) + len(
                     self.data_filenames
                 )
-                self.flats, self.scan_info["FLAT_METADATA"] = self.load_xrms(
-                    self.flats_filenames, Uploader
-                )
-                self._data, self.scan_info["PROJECTION_METADATA"] = self.load_xrms(
-                    self.data_filenames, Uploader
-                )
+                with self.profiler.stage("import"):
+                    self.flats, self.scan_info["FLAT_METADATA"] = self.load_xrms(
+                        self.flats_filenames, Uploader
+                    )
+                    (
+                        self._data,
+                        self.scan_info["PROJECTION_METADATA"],
+                    ) = self.load_xrms(self.data_filenames, Uploader)
                 self.darks = np.zeros_like(self.flats[0])[np.newaxis, ...]
                 energy_filedir_name = str(energy + "eV")
                 self.import_savedir = self.filedir / energy_filedir_name
@@ -1405,34 +1594,41 @@ class RawProjectionsXRM_SSRL62C(RawProjectionsBase):
                         save_name = dt_str + energy_filedir_name
                         self.import_savedir = pathlib.Path(self.filedir / save_name)
                 self.import_savedir.mkdir()
-                projs, flats, darks = self.setup_normalize()
+                with self.profiler.stage("save_raw"):
+                    projs, flats, darks = self.setup_normalize()
                 self.status_label.value = "Calculating flat positions."
                 self.flats_ind_from_collect(collect)
                 self.status_label.value = "Normalizing."
-                self._data = RawProjectionsBase.normalize_and_average(
-                    projs,
-                    flats,
-                    darks,
-                    self.flats_ind,
-                    self.scan_info["NEXPOSURES"],
-                    status_label=self.status_label,
-                    compute=False,
-                )
+                # normalization is lazy, most of it is computed in hist_and_save.
+                with self.profiler.stage("normalize"):
+                    self._data = RawProjectionsBase.normalize_and_average(
+                        projs,
+                        flats,
+                        darks,
+                        self.flats_ind,
+                        self.scan_info["NEXPOSURES"],
+                        status_label=self.status_label,
+                        compute=False,
+                    )
                 self.data = self._data
 
                 self.status_label.value = "Saving projections as .npy for faster IO."
-                self._dask_hist_and_save_data()
+                with self.profiler.stage("hist_and_save"):
+                    self._dask_hist_and_save_data()
                 self.saved_as_tiff = False
                 self.filedir = self.import_savedir
                 if Uploader.save_tiff_on_import_checkbox.value:
                     self.status_label.value = "Saving projections as .tiff."
                     self.saved_as_tiff = True
-                    self.save_normalized_as_tiff()
+                    with self.profiler.stage("save_tiff"):
+                        self.save_normalized_as_tiff()
                 self.status_label.value = "Downsampling data for faster viewing."
-                self._check_downsampled_data()
+                with self.profiler.stage("pyramid"):
+                    self._check_downsampled_data()
                 self.status_label.value = "Saving metadata."
                 self.data_hierarchy_level = 1
                 self.metadata.set_metadata(self)
+                self.metadata.metadata["profile"] = self.profiler.as_dict()
                 self.metadata.filedir = self.import_savedir
                 self.metadata.filename = "import_metadata.json"
                 self.metadata.save_metadata()
@@ -1545,29 +1741,35 @@ class RawProjectionsTiff_SSRL62B(RawProjectionsBase):
         save_filedir_name = str(self.metadata_projections.metadata["energy_str"] + "eV")
         self.import_savedir = self.metadata_projections.filedir / save_filedir_name
         self.make_import_savedir(save_filedir_name)
-        self.import_filedir_projections(Uploader)
-        self.import_filedir_flats(Uploader)
+        self.profiler = StageProfiler()
+        with self.profiler.stage("import"):
+            self.import_filedir_projections(Uploader)
+            self.import_filedir_flats(Uploader)
         self.filedir = self.import_savedir
         projs, flats, darks = self.setup_normalize(Uploader)
         Uploader.import_status_label.value = "Normalizing projections"
-        self._data = self.normalize_no_locations_no_average(
-            projs, flats, darks, compute=False
-        )
+        # normalization is lazy, most of it is computed in hist_and_save.
+        with self.profiler.stage("normalize"):
+            self._data = self.normalize_no_locations_no_average(
+                projs, flats, darks, compute=False
+            )
         self.data = self._data
-        hist, r, bins, percentile = self._dask_hist()
-        grp = self.hdf_key_norm
-        data_dict = {
-            self.hdf_key_norm_proj: self.data,
-            grp + self.hdf_key_bin_frequency: hist[0],
-            grp + self.hdf_key_bin_edges: hist[1],
-            grp + self.hdf_key_image_range: r,
-            grp + self.hdf_key_percentile: percentile,
-        }
-        self.dask_data_to_h5(data_dict, savedir=self.import_savedir)
-        self._dask_bin_centers(grp, write=True, savedir=self.import_savedir)
+        with self.profiler.stage("hist_and_save"):
+            hist, r, bins, percentile = self._dask_hist()
+            grp = self.hdf_key_norm
+            data_dict = {
+                self.hdf_key_norm_proj: self.data,
+                grp + self.hdf_key_bin_frequency: hist[0],
+                grp + self.hdf_key_bin_edges: hist[1],
+                grp + self.hdf_key_image_range: r,
+                grp + self.hdf_key_percentile: percentile,
+            }
+            self.dask_data_to_h5(data_dict, savedir=self.import_savedir)
+            self._dask_bin_centers(grp, write=True, savedir=self.import_savedir)
         Uploader.import_status_label.value = "Downsampling data in a pyramid"
         self.filedir = self.import_savedir
-        self._check_downsampled_data(label=Uploader.import_status_label)
+        with self.profiler.stage("pyramid"):
+            self._check_downsampled_data(label=Uploader.import_status_label)
         self.metadata_projections.set_attributes_from_metadata(self)
         self.metadata_prenorm = Metadata_SSRL62B_Prenorm()
         self.metadata_prenorm.set_metadata(self)
@@ -1579,6 +1781,7 @@ class RawProjectionsTiff_SSRL62B(RawProjectionsBase):
             self.saved_as_tiff = True
             self.save_normalized_as_tiff()
             self.metadata["saved_as_tiff"] = projections.saved_as_tiff
+        self.metadata_prenorm.metadata["profile"] = self.profiler.as_dict()
         self.metadata_prenorm.filedir = self.filedir
         self.metadata_prenorm.filepath = self.filedir / self.metadata_prenorm.filename
         self.metadata_prenorm.save_metadata()
@@ -1735,6 +1938,7 @@ class RawProjectionsHDF5_ALS832(RawProjectionsBase):
     def import_file_all(self, Uploader):
         self.import_status_label = Uploader.import_status_label
         self.tic = time.perf_counter()
+        self.profiler = StageProfiler()
         self.filedir = Uploader.filedir
         self.filename = Uploader.filename
         self.filepath = self.filedir / self.filename
@@ -1743,12 +1947,13 @@ class RawProjectionsHDF5_ALS832(RawProjectionsBase):
         self.metadata.set_attributes_from_metadata(self)
         self.import_status_label.value = "Importing"
         self.metadata.set_attributes_from_metadata(self)
-        (
-            self._data,
-            self.flats,
-            self.darks,
-            self.angles_rad,
-        ) = dxchange.exchange.read_aps_tomoscan_hdf5(self.filepath)
+        with self.profiler.stage("import"):
+            (
+                self._data,
+                self.flats,
+                self.darks,
+                self.angles_rad,
+            ) = dxchange.exchange.read_aps_tomoscan_hdf5(self.filepath)
         self.data = self._data
         self.angles_deg = (180 / np.pi) * self.angles_rad
         self.metadata.set_metadata(self)
@@ -1768,12 +1973,15 @@ class RawProjectionsHDF5_ALS832(RawProjectionsBase):
                 self.import_savedir = pathlib.Path(self.filedir / save_name)
         self.import_savedir.mkdir()
         self.import_status_label.value = "Normalizing"
-        self.normalize()
+        with self.profiler.stage("normalize"):
+            self.normalize()
         _metadata = self.metadata.metadata.copy()
         self.import_status_label.value = "Saving projections as npy for faster IO"
         self.filedir = self.import_savedir
-        self.save_normalized_as_npy()
-        self._check_downsampled_data()
+        with self.profiler.stage("hist_and_save"):
+            self.save_normalized_as_npy()
+        with self.profiler.stage("pyramid"):
+            self._check_downsampled_data()
         self.toc = time.perf_counter()
         self.metadata = self.save_normalized_metadata(self.toc - self.tic, _metadata)
 
@@ -1807,6 +2015,7 @@ class RawProjectionsHDF5_ALS832(RawProjectionsBase):
             metadata.metadata["parent_metadata"] = parent_metadata.copy()
         if import_time is not None:
             metadata.metadata["import_time"] = import_time
+        metadata.metadata["profile"] = self.profiler.as_dict()
         metadata.set_metadata(self)
         metadata.save_metadata()
         return metadata
@@ -1830,6 +2039,7 @@ class RawProjectionsHDF5_APS(RawProjectionsHDF5_ALS832):
             metadata.metadata["parent_metadata"] = parent_metadata.copy()
         if import_time is not None:
             metadata.metadata["import_time"] = import_time
+        metadata.metadata["profile"] = self.profiler.as_dict()
         metadata.set_metadata(self)
         metadata.save_metadata()
         return metadata
@@ -3531,6 +3741,9 @@ class Metadata_Align(Metadata):
         self.metadata["angles_deg"] = list(Align.projections.angles_deg)
         self.metadata["angle_start"] = Align.projections.angles_deg[0]
         self.metadata["angle_end"] = Align.projections.angles_deg[-1]
+        self.metadata["center_profile"] = Align.Center.profiler.as_dict()
+        if Align.memory_plan is not None:
+            self.metadata["memory_plan"] = Align.memory_plan.as_dict()
         self.set_metadata_obj_specific(Align)
 
     def set_metadata_obj_specific(self, Align):
@@ -3543,6 +3756,24 @@ class Metadata_Align(Metadata):
         self.metadata["subset_range_x"] = Align.subset_range_x
         self.metadata["subset_range_y"] = Align.subset_range_y
         self.metadata["opts"]["num_batches"] = Align.num_batches
+        self.metadata["opts"]["projector"] = Align.projector
+        self.metadata["opts"]["multi_resolution"] = Align.multi_resolution
+        self.metadata["opts"]["alignment_schedule"] = Align.alignment_schedule
+        self.metadata["opts"]["conv_threshold"] = Align.conv_threshold
+        self.metadata["opts"]["conv_rtol"] = Align.conv_rtol
+        self.metadata["opts"]["shift_tol"] = Align.shift_tol
+        self.metadata["opts"]["patience"] = Align.patience
+        self.metadata["opts"]["recon_iters"] = Align.recon_iters
+        self.metadata["opts"]["checkpoint_iters"] = Align.checkpoint_iters
+        self.metadata["opts"]["checkpoint_minutes"] = Align.checkpoint_minutes
+        self.metadata["opts"]["pipeline_batches"] = Align.pipeline_batches
+        self.metadata["opts"]["slab_alignment"] = Align.slab_alignment
+        self.metadata["opts"]["vertical_alignment"] = Align.vertical_alignment
+        self.metadata["opts"]["fast_alignment"] = Align.fast_alignment
+        self.metadata["opts"]["angle_stride"] = Align.angle_stride
+        self.metadata["opts"]["out_of_core"] = Align.out_of_core
+        self.metadata["opts"]["num_subsets"] = Align.num_subsets
+        self.metadata["opts"]["subset_order"] = Align.subset_order
 
     def metadata_to_DataFrame(self):
         metadata_frame = {}
@@ -3627,6 +3858,29 @@ class Metadata_Align(Metadata):
         Align.subset_y = self.metadata["subset_range_y"]
         Align.use_subset_correlation = self.metadata["use_subset_correlation"]
         Align.num_batches = self.metadata["opts"]["num_batches"]
+        if "projector" in self.metadata["opts"]:
+            Align.projector = self.metadata["opts"]["projector"]
+        if "multi_resolution" in self.metadata["opts"]:
+            Align.multi_resolution = self.metadata["opts"]["multi_resolution"]
+            Align.alignment_schedule = self.metadata["opts"]["alignment_schedule"]
+        else:
+            Align.multi_resolution = False
+        opts = self.metadata["opts"]
+        Align.conv_threshold = opts.get("conv_threshold", 0)
+        Align.conv_rtol = opts.get("conv_rtol", 0)
+        Align.shift_tol = opts.get("shift_tol", 0)
+        Align.patience = opts.get("patience", 1)
+        Align.recon_iters = opts.get("recon_iters", [1])
+        Align.checkpoint_iters = opts.get("checkpoint_iters", 0)
+        Align.checkpoint_minutes = opts.get("checkpoint_minutes", 0)
+        Align.pipeline_batches = opts.get("pipeline_batches", False)
+        Align.slab_alignment = opts.get("slab_alignment", False)
+        Align.vertical_alignment = opts.get("vertical_alignment", "band")
+        Align.fast_alignment = opts.get("fast_alignment", "off")
+        Align.angle_stride = opts.get("angle_stride", 1)
+        Align.out_of_core = opts.get("out_of_core", False)
+        Align.num_subsets = opts.get("num_subsets", 1)
+        Align.subset_order = opts.get("subset_order", "bit_reversal")
 
 
 class Metadata_Recon(Metadata_Align):
@@ -3637,13 +3891,18 @@ class Metadata_Recon(Metadata_Align):
         self.table_label.value = "Reconstruction Metadata"
 
     def set_metadata_obj_specific(self, Recon):
-        pass
+        self.metadata["opts"]["use_center_fit"] = Recon.use_center_fit
+        if Recon.use_center_fit:
+            self.metadata["center_fit"] = Recon.Center.center_fit
+        else:
+            self.metadata["center_fit"] = None
 
     def set_attributes_from_metadata(self, Recon):
         super().set_attributes_from_metadata(Recon)
 
     def set_attributes_object_specific(self, Recon):
-        pass
+        Recon.use_center_fit = self.metadata["opts"].get("use_center_fit", False)
+        Recon.center_fit = self.metadata.get("center_fit")
 
 
 # https://stackoverflow.com/questions/
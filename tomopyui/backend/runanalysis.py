@@ -11,10 +11,15 @@ from abc import ABC, abstractmethod
 from copy import copy, deepcopy
 from time import perf_counter
 from skimage.transform import rescale  # look for better option
-from tomopy.prep.alignment import align_joint as align_joint_tomopy
+from tomopyui.backend.util.alignment import align_joint as align_joint_cpu
 from tomopyui.backend.util.padding import *
 from tomopyui._sharedvars import *
 from tomopyui.backend.io import Metadata_Align, Metadata_Recon, Projections_Child
+from tomopyui.backend.util.checkpoint import AlignmentCheckpoint
+from tomopyui.backend.util.fast_alignment import align_fast
+from tomopyui.backend.util.profiling import StageProfiler, DaskTrace
+from tomopyui.backend.util.scratch import ScratchArrays
+from tomopyui.backend.util.shifting import shift_projections, shift_stack, within_pad
 from tomopy.recon import algorithm as tomopy_algorithm
 from tomopy.misc.corr import circ_mask
 from tomopy.recon import wrappers
@@ -30,7 +35,6 @@ if os.environ["cuda_enabled"] == "True":
     import cupy as cp
     from ..tomocupy.prep.alignment import align_joint as align_joint_cupy
     from ..tomocupy.prep.alignment import shift_prj_cp
-    from tomopyui.widgets.prep import shift_projections
 
 
 class RunAnalysisBase(ABC):
@@ -40,6 +44,10 @@ class RunAnalysisBase(ABC):
 
     def __init__(self, analysis_parent):
         self.recon = None
+        self.scratch = None
+        self.projection_cache = {}
+        self.cache_projections = False
+        self.cache_key = None
         self.analysis_parent = analysis_parent
         self.parent_projections = analysis_parent.projections
         self.projections = Projections_Child(self.parent_projections)
@@ -124,14 +132,15 @@ class RunAnalysisBase(ABC):
         self.px_range_x_ds = [int(x / self.ds_factor) for x in self.px_range_x]
         self.px_range_y_ds = [int(y / self.ds_factor) for y in self.px_range_y]
         self.px_range_ds = (self.px_range_x_ds, self.px_range_y_ds)
-        if self.pyramid_level == -1:
-            self.projections.get_parent_data_from_hdf(self.px_range_ds)
-            self.prjs = self.projections.data
-        else:
-            self.projections.get_parent_data_ds_from_hdf(
-                self.pyramid_level, self.px_range_ds
+        self.pad_ds = tuple([int(x / self.ds_factor) for x in self.pad])
+        if self.scratch is not None:
+            # out-of-core: streamed into padded memory-mapped projections
+            self.prjs = self.projections.get_parent_data_padded_to_scratch(
+                self.scratch, self.pyramid_level, self.px_range_ds, self.pad_ds
             )
-            self.prjs = self.projections.data_ds
+        else:
+            key = self._projection_key(self.pyramid_level)
+            self.prjs = self._prepared_projections(key)
         if self.use_subset_correlation:
             self.subset_x = [int(x / self.ds_factor) for x in self.subset_x]
             self.subset_y = [int(y / self.ds_factor) for y in self.subset_y]
@@ -141,17 +150,76 @@ class RunAnalysisBase(ABC):
         self.center = self.center + self.pad[0]
         self.center = self.center / self.ds_factor
 
-        # Pad
-        self.pad_ds = tuple([int(x / self.ds_factor) for x in self.pad])
-        print(self.pad_ds)
-        print(self.prjs.shape)
-        self.prjs = pad_projections(self.prjs, self.pad_ds)
+    def _load_padded_projections(self):
+        """
+        Reads the projections in px_range_ds at pyramid_level from the hdf file and
+        pads them by pad_ds.
+        """
+        if self.pyramid_level == -1:
+            self.projections.get_parent_data_from_hdf(self.px_range_ds)
+            prjs = self.projections.data
+        else:
+            self.projections.get_parent_data_ds_from_hdf(
+                self.pyramid_level, self.px_range_ds
+            )
+            prjs = self.projections.data_ds
+        return pad_projections(prjs, self.pad_ds)
+
+    def _projection_key(self, pyramid_level):
+        """
+        Key of the padded projections at pyramid_level in projection_cache:
+        (pyramid_level, px_range_x_ds, px_range_y_ds, pad_ds).
+        """
+        ds_factor = np.power(2, int(pyramid_level + 1))
+        return (
+            int(pyramid_level),
+            tuple(int(x / ds_factor) for x in self.px_range_x),
+            tuple(int(y / ds_factor) for y in self.px_range_y),
+            tuple(int(x / ds_factor) for x in self.pad),
+        )
+
+    def _keep_projection_cache(self, key):
+        """
+        Makes key the only projections projection_cache can keep, and drops any
+        others. The cache then holds at most one array.
+        """
+        self.cache_key = key
+        self.projection_cache = {
+            k: prjs for k, prjs in self.projection_cache.items() if k == key
+        }
+
+    def _prepared_projections(self, key):
+        """
+        Padded projections for key, read from the hdf file only if they are not in
+        projection_cache. If key is cache_key and cache_projections is set (other
+        methods of the run will need them), they are kept in the cache and a copy
+        is returned, because the analysis changes its projections in place.
+        Otherwise they are taken out of the cache, so that they are released with
+        the analysis.
+        """
+        prjs = self.projection_cache.pop(key, None)
+        if prjs is None:
+            prjs = self._load_padded_projections()
+        if self.cache_projections and key == self.cache_key:
+            self.projection_cache[key] = prjs
+            return prjs.copy()
+        return prjs
 
     def _save_data_after(self):
         self.make_wd_subdir()
         self.metadata.filedir = self.wd_subdir
         self.metadata.save_metadata()
 
+    def _save_profile(self):
+        """
+        Adds the stage profile to the metadata of the current run and saves it again,
+        so that the time spent saving is included. Saves the dask trace if it was
+        recorded.
+        """
+        self.metadata.metadata["profile"] = self.profiler.as_dict()
+        self.metadata.save_metadata()
+        self.dask_trace.save(self.wd_subdir)
+
     def make_wd_subdir(self):
         """
         Creates a save directory to put projections into.
@@ -189,6 +257,20 @@ class RunRecon(RunAnalysisBase):
                 tf.imwrite(self.wd_subdir / "recon.tif", self.recon)
         self.analysis_parent.run_list.append({self.wd_subdir: self.metadata})
 
+    def center_per_row(self):
+        """
+        Centers of each row of the padded projections from the center fit (in full
+        resolution pixels), converted like the scalar center in init_projections.
+        """
+        fit = self.center_fit
+        num_rows = self.prjs.shape[1]
+        rows = np.arange(num_rows) - self.pad_ds[1]
+        rows = (rows + 0.5) * self.ds_factor - 0.5 + self.px_range_y[0]
+        center = fit["intercept"] + fit["slope"] * rows
+        center = center - self.px_range_x_ds[0]
+        center = center + self.pad[0]
+        return center / self.ds_factor
+
     def reconstruct(self):
 
         # ensure it only runs on 1 thread for CUDA
@@ -206,26 +288,27 @@ class RunRecon(RunAnalysisBase):
             method_str = "EM_CUDA"
 
         # TODO: parsing recon method could be done in an Align method
+        # The 3D astra methods take one center, so per-row centers are averaged.
         if method_str == "SIRT_Plugin":
             self.recon = tomocupy_algorithm.recon_sirt_plugin(
                 self.prjs,
                 self.angles_rad,
                 num_iter=self.num_iter,
-                center=self.center,
+                center=np.mean(self.center),
             )
         elif method_str == "SIRT_3D":
             self.recon = tomocupy_algorithm.recon_sirt_3D(
                 self.prjs,
                 self.angles_rad,
                 num_iter=self.num_iter,
-                center=self.center,
+                center=np.mean(self.center),
             )
         elif method_str == "CGLS_3D":
             self.recon = tomocupy_algorithm.recon_cgls_3D_allgpu(
                 self.prjs,
                 self.angles_rad,
                 num_iter=self.num_iter,
-                center=self.center,
+                center=np.mean(self.center),
             )
         elif self.current_recon_is_cuda:
             # Options go into kwargs which go into recon()
@@ -271,37 +354,249 @@ class RunRecon(RunAnalysisBase):
         """
 
         metadata_list = super().make_metadata_list()
-        super().init_projections()
+        init_profiler = StageProfiler()
+        with init_profiler.stage("init_projections"):
+            super().init_projections()
+        if self.use_center_fit and self.center_fit is not None:
+            self.center = self.center_per_row()
         for i in range(len(metadata_list)):
             self.metadata = metadata_list[i]
-            tic = time.perf_counter()
-            self.reconstruct()
-            toc = time.perf_counter()
+            self.profiler = StageProfiler()
+            self.profiler.stages.update(init_profiler.as_dict())
+            self.dask_trace = DaskTrace(
+                enabled=self.metadata.metadata["save_opts"].get("dask_trace", False)
+            )
+            tic = perf_counter()
+            with self.dask_trace, self.profiler.stage("reconstruct"):
+                self.reconstruct()
+            toc = perf_counter()
             self.metadata.metadata["analysis_time"] = {
                 "seconds": toc - tic,
                 "minutes": (toc - tic) / 60,
                 "hours": (toc - tic) / 3600,
             }
-            self.save_data_after()
+            with self.profiler.stage("save"):
+                self.save_data_after()
+            self._save_profile()
 
 
 # TODO: create superclass for RunRecon and RunAlign, as they basically do the same thing.
 class RunAlign(RunAnalysisBase):
-    """ """
+    """
+    Runs the alignment. If resume_dir is the folder of a previous alignment run
+    (one with an alignment checkpoint), that run is continued from its latest
+    checkpoint, with the metadata saved in that folder.
+    """
 
-    def __init__(self, Align):
+    def __init__(self, Align, resume_dir=None):
+        self.Align = Align
+        self.resume_dir = None if resume_dir is None else pathlib.Path(resume_dir)
+        self.resume_state = None
+        self.checkpoint = None
         self.shift = None
         self.sx = None
         self.sy = None
+        self.sx_init = None
+        self.sy_init = None
         self.conv = None
+        self.stop_reason = None
+        self.pipeline_utilization = None
+        self.pipeline_fallback = None
+        self.angle_strides = None
+        self.fast_center = None
+        self.level_index = 0
+        self.levels = []
         self.metadata_class = Metadata_Align
         self.metadata = self.metadata_class()
         self.savedir_suffix = "alignment"
         super().__init__(Align)
 
+    def make_wd(self):
+        if self.resume_dir is None:
+            super().make_wd()
+        else:
+            self.wd = self.resume_dir.parent
+
+    def save_overall_metadata(self):
+        if self.resume_dir is None:
+            super().save_overall_metadata()
+
+    def save_data_before_analysis(self):
+        if self.resume_dir is None:
+            super().save_data_before_analysis()
+
+    def _load_run_metadata(self):
+        """
+        Loads the metadata saved at the start of the run in resume_dir.
+        """
+        metadata = self.metadata_class()
+        metadata.filepath = self.resume_dir / metadata.filename
+        metadata.load_metadata()
+        return metadata
+
+    def _shift_to_checkpoint(self):
+        """
+        Shifts the projections loaded by init_projections to where the checkpoint
+        in resume_state left them, and restores the center and padding. The saved
+        sx and sy are total shifts. Like the shifts between levels, projections
+        whose total shift would leave the padding are not shifted, and their
+        shifts are reset to 0.
+
+        Raises ValueError if the checkpoint has less padding than the projections,
+        which happens if the padding was changed since the checkpoint was saved.
+        """
+        state = self.resume_state
+        pad_ds = tuple(int(p) for p in state["pad_ds"])
+        if any(new < old for new, old in zip(pad_ds, self.pad_ds)):
+            raise ValueError(
+                f"The padding {tuple(self.pad_ds)} differs from the checkpoint's "
+                + f"{pad_ds}. Resume with the padding of the checkpoint."
+            )
+        self.center = float(state["center"])
+        if pad_ds != tuple(self.pad_ds):
+            extra = [new - old for new, old in zip(pad_ds, self.pad_ds)]
+            self.prjs = pad_projections(self.prjs, extra)
+            self.pad_ds = pad_ds
+        self.sx_init = state["sx_init"]
+        self.sy_init = state["sy_init"]
+        mask = within_pad(state["sx"], state["sy"], 0, 0, self.pad_ds)
+        state["sx"][~mask] = 0
+        state["sy"][~mask] = 0
+        self.prjs = shift_stack(
+            self.prjs, state["sx"], state["sy"], out=self.prjs, mask=mask
+        )
+
+    def _uses_multiresolution(self):
+        return self.multi_resolution and self.fast_alignment != "standalone"
+
     def align(self):
         """
-        Aligns a TomoData object using options in GUI.
+        Aligns a TomoData object using options in GUI. The shifts in sx, sy and
+        shift are converted to full resolution pixels.
+
+        With fast_alignment "standalone", only
+        `tomopyui.backend.util.fast_alignment.align_fast` is run (on the data at
+        pyramid_level, also when multi_resolution is set). With "initialize", the
+        joint alignment starts from its shifts.
+        """
+        if self._uses_multiresolution():
+            self.align_multiresolution()
+            return
+        self.sx_init = np.zeros(len(self.angles_rad))
+        self.sy_init = np.zeros(len(self.angles_rad))
+        if self.resume_state is not None:
+            with self.profiler.stage("shift"):
+                self._shift_to_checkpoint()
+        elif self.fast_alignment == "initialize":
+            self._align_fast()
+        if self.fast_alignment == "standalone":
+            self._run_align_fast()
+            self._save_fast_center()
+        else:
+            self._align_level()
+        self.sx = self.sx * self.ds_factor
+        self.sy = self.sy * self.ds_factor
+        self.shift = self.shift * self.ds_factor
+
+    def _align_fast(self):
+        """
+        Runs `tomopyui.backend.util.fast_alignment.align_fast` on self.prjs and
+        makes its total shifts sx_init and sy_init, so that the joint alignment
+        continues from them and bounds the combined shift by the padding.
+        """
+        self._run_align_fast()
+        self.sx_init = self.sx.copy()
+        self.sy_init = self.sy.copy()
+        self._save_fast_center()
+
+    def _run_align_fast(self):
+        """
+        Runs `tomopyui.backend.util.fast_alignment.align_fast` for up to num_iter
+        passes. A nonzero shift_tol (in full resolution pixels) replaces its default
+        tolerance.
+        """
+        kwargs = {"num_iter": self.num_iter}
+        shift_tol = getattr(self, "shift_tol", 0)
+        if shift_tol:
+            kwargs["tol"] = shift_tol / self.ds_factor
+        with self.profiler.stage("fast_alignment"):
+            align_fast(self, **kwargs)
+
+    def _save_fast_center(self):
+        """
+        Saves the center of rotation fitted by the fast alignment, in pixels of the
+        full resolution projections like center.
+        """
+        center = self.fast_center * self.ds_factor - self.pad[0]
+        center = center + self.px_range_x_ds[0]
+        self.metadata.metadata["fast_alignment_center"] = float(center)
+
+    def align_multiresolution(self):
+        """
+        Coarse-to-fine alignment following alignment_schedule. Each level loads the
+        projections at its pyramid level, shifts them by the shifts found at the
+        previous levels (scaled to this level) and refines them with up to
+        num_iter iterations, stopping early when the convergence (in full
+        resolution pixels) drops below conv_threshold (or on the other stopping
+        criteria). A conv_threshold of 0 uses the one of the alignment options. The
+        projections of the last level are kept, so a last level of -1 aligns the
+        full resolution data.
+        """
+        sx = np.zeros(len(self.angles_rad))
+        sy = np.zeros(len(self.angles_rad))
+        self.levels = []
+        start_level = 0
+        if self.resume_state is not None:
+            self.levels = self.resume_state["levels"]
+            start_level = int(self.resume_state["level_index"])
+        for index in range(start_level, len(self.alignment_schedule)):
+            level = self.alignment_schedule[index]
+            self.level_index = index
+            # init_projections converts the center, padding and subset in place
+            self.metadata.set_attributes_from_metadata(self)
+            self.pyramid_level = level["pyramid_level"]
+            self.downsample = self.pyramid_level != -1
+            self.num_iter = level["num_iter"]
+            self.conv_threshold = level["conv_threshold"] or self.conv_threshold
+            self.Align.progress_total.max = self.num_iter
+            with self.profiler.stage("init_projections"):
+                self.init_projections()
+            with self.profiler.stage("shift"):
+                if self.resume_state is not None:
+                    self._shift_to_checkpoint()
+                else:
+                    self.sx_init = sx / self.ds_factor
+                    self.sy_init = sy / self.ds_factor
+                    mask = within_pad(self.sx_init, self.sy_init, 0, 0, self.pad_ds)
+                    self.sx_init[~mask] = 0
+                    self.sy_init[~mask] = 0
+                    self.prjs = shift_stack(
+                        self.prjs, self.sx_init, self.sy_init, out=self.prjs, mask=mask
+                    )
+            if index == 0 and self.resume_state is None:
+                if self.fast_alignment == "initialize":
+                    self._align_fast()
+            self._align_level()
+            sx = self.sx * self.ds_factor
+            sy = self.sy * self.ds_factor
+            self.levels.append(
+                {
+                    **level,
+                    "iterations_run": len(self.conv),
+                    "stop_reason": self.stop_reason,
+                    "convergence": list(self.conv),
+                }
+            )
+        self.sx = sx
+        self.sy = sy
+        self.shift = self.shift * self.ds_factor
+        self.conv = np.concatenate([level["convergence"] for level in self.levels])
+        self.metadata.metadata["alignment_levels"] = self.levels
+
+    def _align_level(self):
+        """
+        Runs the alignment engine on self.prjs. The shifts are in pixels of
+        self.prjs, and include sx_init and sy_init.
         """
         for method in self.metadata.metadata["methods"]:
             if (
@@ -312,27 +607,7 @@ class RunAlign(RunAnalysisBase):
                 align_joint_cupy(self)
             else:
                 self.current_align_is_cuda = False
-                os.environ["TOMOPY_PYTHON_THREADS"] = str(os.environ["num_cpu_cores"])
-                import scipy.fft as fft
-
-                fft.set_backend("scipy")
-                if method == "gridrec" or method == "fbp":
-                    self.prjs, self.sx, self.sy, self.conv = align_joint_tomopy(
-                        self.prjs,
-                        self.angles_rad,
-                        upsample_factor=self.upsample_factor,
-                        center=self.center,
-                        algorithm=method,
-                    )
-                else:
-                    self.prjs, self.sx, self.sy, self.conv = align_joint_tomopy(
-                        self.prjs,
-                        self.angles_rad,
-                        upsample_factor=self.upsample_factor,
-                        center=self.center,
-                        algorithm=method,
-                        iters=self.num_iter,
-                    )
+                align_joint_cpu(self)
 
     def _shift_prjs_after_alignment(self):
         if self.shift_full_dataset_after:
@@ -340,22 +615,25 @@ class RunAlign(RunAnalysisBase):
                 self.projections.data = self.prjs
                 return
             self.projections.get_parent_data_from_hdf(None)
-            if self.current_align_is_cuda:
-                self.projections.data = shift_projections(
-                    self.projections.data, self.sx, self.sy
-                )
-            else:
-                # TODO: make shift projections without cupy
-                pass
+            self.projections.data = shift_projections(
+                self.projections.data, self.sx, self.sy
+            )
         else:
             self.projections.data = self.prjs
 
     def save_data_after(self):
-        super()._save_data_after()
-        print("trying to save after")
+        # wd_subdir was made, and the metadata saved in it, before aligning
         self.metadata.metadata["sx"] = list(self.sx)
         self.metadata.metadata["sy"] = list(self.sy)
         self.metadata.metadata["convergence"] = list(self.conv)
+        self.metadata.metadata["stop_reason"] = self.stop_reason
+        self.metadata.metadata["iterations_run"] = len(self.conv)
+        if self.pipeline_utilization is not None:
+            self.metadata.metadata["pipeline_utilization"] = self.pipeline_utilization
+        if self.pipeline_fallback is not None:
+            self.metadata.metadata["pipeline_fallback"] = self.pipeline_fallback
+        if self.angle_strides:
+            self.metadata.metadata["angle_strides"] = self.angle_strides
         if self.metadata.metadata["save_opts"]["tomo_after"]:
             if self.metadata.metadata["save_opts"]["hdf"]:
                 self.projections.filepath = (
@@ -368,7 +646,7 @@ class RunAlign(RunAnalysisBase):
                     self.wd_subdir / "normalized_projections.tif",
                     self.projections.data,
                 )
-        if self.metadata.metadata["save_opts"]["recon"] and self.current_align_is_cuda:
+        if self.metadata.metadata["save_opts"]["recon"] and self.recon is not None:
 
             if self.metadata.metadata["save_opts"]["tiff"]:
                 tf.imwrite(self.wd_subdir / "recon.tif", self.recon)
@@ -378,22 +656,60 @@ class RunAlign(RunAnalysisBase):
     def run(self):
         """ """
 
-        metadata_list = self.make_metadata_list()
+        if self.resume_dir is None:
+            metadata_list = self.make_metadata_list()
+        else:
+            metadata_list = [self._load_run_metadata()]
         for i in range(len(metadata_list)):
             self.metadata = metadata_list[i]
-            print(f"iter {i}")
-            self.init_projections()
-            print(self.prjs.shape)
-            tic = perf_counter()
-            self.align()
-            print("finished alignemtn")
-            # make new dataset and pad/shift it
-            self._shift_prjs_after_alignment()
-            toc = perf_counter()
+            self.metadata.set_attributes_from_metadata(self)
+            # the methods after this one reuse the projections it loads at its
+            # finest level, the only ones kept
+            self.cache_projections = i < len(metadata_list) - 1
+            if self._uses_multiresolution():
+                finest_level = self.alignment_schedule[-1]["pyramid_level"]
+            else:
+                finest_level = self.pyramid_level if self.downsample else -1
+            self._keep_projection_cache(self._projection_key(finest_level))
+            if self.resume_dir is None:
+                self.make_wd_subdir()
+            else:
+                self.wd_subdir = self.resume_dir
+                self.resume_state = AlignmentCheckpoint.load(self.wd_subdir)
+            if self.out_of_core:
+                self.scratch = ScratchArrays(self.wd_subdir / "scratch")
+            # saved first, so that the run can be resumed with the same metadata
+            self.metadata.filedir = self.wd_subdir
+            self.metadata.save_metadata()
+            self.checkpoint = AlignmentCheckpoint(
+                self.wd_subdir, self.checkpoint_iters, self.checkpoint_minutes
+            )
+            self.profiler = StageProfiler()
+            self.dask_trace = DaskTrace(
+                enabled=self.metadata.metadata["save_opts"].get("dask_trace", False)
+            )
+            with self.dask_trace:
+                if not self._uses_multiresolution():
+                    with self.profiler.stage("init_projections"):
+                        self.init_projections()
+                tic = perf_counter()
+                with self.profiler.stage("align"):
+                    self.align()
+                # make new dataset and pad/shift it
+                with self.profiler.stage("shift_after_alignment"):
+                    self._shift_prjs_after_alignment()
+                toc = perf_counter()
             self.metadata.metadata["analysis_time"] = {
                 "seconds": toc - tic,
                 "minutes": (toc - tic) / 60,
                 "hours": (toc - tic) / 3600,
             }
-            self.save_data_after()
+            with self.profiler.stage("save"):
+                self.save_data_after()
+            self._save_profile()
+            self.checkpoint.remove()
+            if self.scratch is not None:
+                self.scratch.cleanup()
+                self.scratch = None
             # self.save_reconstructed_data()
+        self.projection_cache = {}
@@ -0,0 +1,789 @@
+"""
+CPU version of the joint alignment loop in `tomopyui.tomocupy.prep.alignment`.
+
+Used by `RunAlign.align` when CUDA is not available. Each iteration reconstructs
+with tomopy (or astra's CPU algorithms through tomopy), reprojects with one of the
+projectors in `tomopyui.backend.util.projectors`, finds the shift of every
+projection relative to its reprojection with phase cross-correlation and shifts
+the projections in Fourier space, with the same batching, subset correlation, pad
+limits, live plots and sx/sy/conv/recon outputs as the CUDA version. Batches are
+processed in parallel threads. The live plots (`tomopyui.widgets.view.AlignmentPlots`)
+are only imported when the run has plot outputs, so the loop also runs without the
+widget libraries.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import scipy.ndimage as ndi
+import tomopy
+from tomopy.misc.corr import circ_mask
+from tomopy.prep.alignment import scale as scale_tomo
+from tomopy.recon import wrappers
+
+from tomopyui.backend.util.checkpoint import resume_iteration
+from tomopyui.backend.util.convergence import (
+    EarlyStopping,
+    next_angle_stride,
+    recon_iterations,
+)
+from tomopyui.backend.util.pipeline import Pipeline
+from tomopyui.backend.util.profiling import StageProfiler
+from tomopyui.backend.util.projectors import make_projector
+from tomopyui.backend.util.shifting import initial_shifts, shift_stack, within_pad
+from tomopyui.backend.util.registration._phase_cross_correlation_cpu import (
+    edge_mask,
+    phase_cross_correlation,
+)
+
+# astra algorithms that run on the CPU
+astra_cpu_methods = {"FBP", "SIRT", "SART", "CGLS"}
+
+# CPU equivalents of the CUDA methods
+cuda_to_cpu_methods = {
+    "FBP_CUDA": "FBP",
+    "SIRT_CUDA": "SIRT",
+    "SART_CUDA": "SART",
+    "CGLS_CUDA": "CGLS",
+    "MLEM_CUDA": "mlem",
+    "SIRT_Plugin": "SIRT",
+    "SIRT_3D": "SIRT",
+}
+
+# coarse-to-fine schedule used by RunAlign.align_multiresolution: pyramid level
+# (-1 is full resolution), iterations and convergence threshold of each level
+default_alignment_schedule = [
+    {"pyramid_level": 2, "num_iter": 20, "conv_threshold": 0},
+    {"pyramid_level": 1, "num_iter": 10, "conv_threshold": 0},
+    {"pyramid_level": -1, "num_iter": 5, "conv_threshold": 0},
+]
+
+
+def parse_alignment_schedule(text):
+    """
+    Parses a schedule written as comma separated "level:iterations[:threshold]"
+    entries, for example "2:20:1.5, 1:10, -1:5".
+
+    Returns
+    -------
+    list of dict
+        {"pyramid_level", "num_iter", "conv_threshold"} of each level, from coarse
+        to fine.
+
+    Raises
+    ------
+    ValueError
+        If an entry cannot be parsed, or the levels do not go from coarse to fine.
+    """
+    schedule = []
+    for entry in text.split(","):
+        values = entry.strip().split(":")
+        if len(values) not in (2, 3):
+            raise ValueError(f"Expected level:iterations[:threshold], got {entry}")
+        schedule.append(
+            {
+                "pyramid_level": int(values[0]),
+                "num_iter": int(values[1]),
+                "conv_threshold": float(values[2]) if len(values) == 3 else 0,
+            }
+        )
+    levels = [level["pyramid_level"] for level in schedule]
+    if min(levels) < -1 or any(a <= b for a, b in zip(levels[:-1], levels[1:])):
+        raise ValueError("Pyramid levels must go from coarse to fine, down to -1.")
+    return schedule
+
+
+def format_alignment_schedule(schedule):
+    """
+    Inverse of `parse_alignment_schedule`.
+    """
+    return ", ".join(
+        f"{level['pyramid_level']}:{level['num_iter']}:{level['conv_threshold']:g}"
+        for level in schedule
+    )
+
+
+def _ncore():
+    return int(os.environ.get("num_cpu_cores", os.cpu_count()))
+
+
+def _map_batches(func, num_batches, ncore, progress=None):
+    """
+    Calls func(batch) for every batch in a thread pool. Returns the results in
+    order and steps the progress bar as batches finish.
+    """
+    results = [None] * num_batches
+    with ThreadPoolExecutor(max_workers=max(1, min(ncore, num_batches))) as pool:
+        futures = {pool.submit(func, batch): batch for batch in range(num_batches)}
+        for future in futures:
+            results[futures[future]] = future.result()
+            if progress is not None:
+                progress.value += 1
+    return results
+
+
+def reconstruct(
+    prj,
+    theta,
+    method,
+    num_iter=1,
+    init_recon=None,
+    center=None,
+    ncore=None,
+    out=None,
+    num_chunks=1,
+):
+    """
+    Reconstructs with a tomopy algorithm, or with an astra CPU algorithm through
+    tomopy's astra wrapper. CUDA method names are mapped to their CPU equivalents.
+    NaNs in the reconstruction are set to 0.
+
+    With out, the slices are reconstructed in num_chunks chunks along z (they are
+    independent in parallel beam geometry) and written into out, so prj,
+    init_recon and out can be memory-mapped arrays larger than memory.
+
+    Parameters
+    ----------
+    prj : ndarray
+        Projections with shape (angles, dy, dx).
+    theta : ndarray
+        Angles in radians.
+    method : str
+        tomopy algorithm ("gridrec", "sirt", ...), astra CPU algorithm ("SIRT",
+        "SART", "CGLS", "FBP") or one of the keys of `cuda_to_cpu_methods`.
+    num_iter : int
+        Iterations of iterative algorithms.
+    init_recon : ndarray, optional
+        Starting reconstruction of iterative algorithms.
+    center : float, optional
+        Center of rotation.
+    ncore : int, optional
+        Number of cores. Defaults to the num_cpu_cores environment variable.
+    out : ndarray, optional
+        Array with shape (dy, dx, dx) to write the reconstruction into.
+    num_chunks : int
+        Number of chunks of slices when out is given.
+
+    Returns
+    -------
+    ndarray
+        Reconstruction with shape (dy, dx, dx) (out, if it is given).
+    """
+    if ncore is None:
+        ncore = _ncore()
+    method = cuda_to_cpu_methods.get(method, method)
+    if method in astra_cpu_methods:
+        kwargs = {
+            "algorithm": wrappers.astra,
+            "options": {
+                "proj_type": "linear",
+                "method": method,
+                "num_iter": num_iter,
+                "extra_options": {"MinConstraint": 0},
+            },
+        }
+    elif method in ("gridrec", "fbp"):
+        kwargs = {"algorithm": method}
+        init_recon = None
+    else:
+        kwargs = {"algorithm": method, "num_iter": num_iter}
+    if out is None:
+        if init_recon is not None:
+            kwargs["init_recon"] = init_recon
+        rec = tomopy.recon(
+            np.ascontiguousarray(prj), theta, center=center, ncore=ncore, **kwargs
+        )
+        rec[np.isnan(rec)] = 0
+        return rec
+    bounds = np.linspace(0, prj.shape[1], num_chunks + 1).astype(int)
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        if init_recon is not None:
+            kwargs["init_recon"] = np.array(init_recon[start:stop], dtype=np.float32)
+        rec = tomopy.recon(
+            np.ascontiguousarray(prj[:, start:stop]),
+            theta,
+            center=center,
+            ncore=ncore,
+            **kwargs,
+        )
+        rec[np.isnan(rec)] = 0
+        out[start:stop] = rec
+    return out
+
+
+def batch_cross_correlation(
+    prj,
+    sim,
+    num_batches,
+    upsample_factor,
+    blur=True,
+    rin=0.5,
+    rout=0.8,
+    subset_correlation=False,
+    subset_x=None,
+    subset_y=None,
+    mask_sim=True,
+    median_filter=True,
+    ncore=None,
+    progress=None,
+):
+    """
+    Shifts that register each projection with its simulated projection, with the
+    same preprocessing and sign convention as
+    `tomopyui.tomocupy.prep.alignment.batch_cross_correlation`. Batches are
+    correlated in parallel threads, each with one batched FFT correlation (see
+    `tomopyui.backend.util.registration._phase_cross_correlation_cpu`).
+
+    Returns
+    -------
+    shift : ndarray
+        Shifts with shape (2, angles): y shifts in shift[0], x shifts in shift[1].
+    """
+    if ncore is None:
+        ncore = _ncore()
+    bounds = np.linspace(0, prj.shape[0], num_batches + 1).astype(int)
+    fft_workers = max(1, ncore // num_batches)
+    if subset_correlation:
+        region = (slice(subset_y[0], subset_y[1]), slice(subset_x[0], subset_x[1]))
+    else:
+        region = (slice(None), slice(None))
+
+    def correlate(batch):
+        images = slice(bounds[batch], bounds[batch + 1])
+        _prj = np.array(prj[(images,) + region], dtype=np.float32)
+        _sim = np.array(sim[(images,) + region], dtype=np.float32)
+        if median_filter:
+            _prj = ndi.median_filter(_prj, size=(1, 5, 5))
+            _sim = ndi.median_filter(_sim, size=(1, 5, 5))
+        if mask_sim:
+            _sim = np.where(_prj < 1e-7, 0, _sim)
+        if blur:
+            mask = edge_mask(_prj.shape[1:], rin, rout)
+            _prj *= mask
+            _sim *= mask
+        return phase_cross_correlation(
+            _sim, _prj, upsample_factor=upsample_factor, workers=fft_workers
+        )
+
+    shifts = _map_batches(correlate, num_batches, ncore, progress)
+    return np.concatenate(shifts, axis=1)
+
+
+def shift_prj_update_shift(
+    prj, sx, sy, shift, num_batches, pad, ncore=None, progress=None
+):
+    """
+    Adds shift to sx and sy and shifts the projections by it (in place, with
+    `tomopyui.backend.util.shifting.shift_stack`), for the projections that stay
+    within the padding. Same rule as
+    `tomopyui.tomocupy.prep.alignment.shift_prj_update_shift_cp`.
+
+    Returns
+    -------
+    prj, sx, sy : ndarray
+        Shifted projections and updated total shifts.
+    err : ndarray
+        Length of the shift of every projection.
+    """
+    if ncore is None:
+        ncore = _ncore()
+    err = np.sqrt(shift[0] ** 2 + shift[1] ** 2)
+    shifted = within_pad(sx, sy, shift[1], shift[0], pad)
+    sx = np.where(shifted, sx + shift[1], sx)
+    sy = np.where(shifted, sy + shift[0], sy)
+    bounds = np.linspace(0, prj.shape[0], num_batches + 1).astype(int)
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        shift_stack(
+            prj[start:stop],
+            shift[1, start:stop],
+            shift[0, start:stop],
+            out=prj[start:stop],
+            mask=shifted[start:stop],
+            workers=ncore,
+        )
+        if progress is not None:
+            progress.value += 1
+    return prj, sx, sy, err
+
+
+def interpolate_shifts(shift, angles, num_angles):
+    """
+    Shifts of all projections from the shifts of the projections in angles (a
+    slice), linearly interpolated along the projection number. Projections before
+    the first and after the last one in angles get their shifts.
+
+    Returns
+    -------
+    ndarray
+        Shifts with shape (2, num_angles).
+    """
+    indices = np.arange(num_angles)[angles]
+    return np.stack([np.interp(np.arange(num_angles), indices, s) for s in shift])
+
+
+def ordered_subsets(num_subsets, order="bit_reversal", stride=1, seed=None):
+    """
+    Angle subsets of one ordered-subsets alignment iteration, in the order they
+    are processed. Subset j has every num_subsets-th of the projections used
+    (every stride-th projection), starting at the j-th of them.
+
+    Parameters
+    ----------
+    order : str
+        "sequential" (subset 0, 1, 2, ...), "bit_reversal" (each subset is as far
+        in angle as possible from the ones just before it, the usual OSEM order)
+        or "random" (a permutation made with seed).
+
+    Returns
+    -------
+    list of slice
+    """
+    step = stride * num_subsets
+    if order == "sequential":
+        indices = np.arange(num_subsets)
+    elif order == "bit_reversal":
+        bits = max(1, int(np.ceil(np.log2(num_subsets))))
+        reversed_bits = [int(f"{j:0{bits}b}"[::-1], 2) for j in range(num_subsets)]
+        indices = np.argsort(reversed_bits)
+    elif order == "random":
+        indices = np.random.default_rng(seed).permutation(num_subsets)
+    else:
+        raise ValueError(
+            f"Unknown subset order {order}, choose sequential, bit_reversal or random"
+        )
+    return [slice(int(j) * stride, None, step) for j in indices]
+
+
+def slab_rows(subset_y, margin, num_rows):
+    """
+    Rows reconstructed in slab alignment: the correlation subset subset_y, plus
+    margin rows above and below it for the vertical shifts.
+    """
+    return slice(max(0, subset_y[0] - margin), min(num_rows, subset_y[1] + margin))
+
+
+def vertical_profile_shifts(prj, upsample_factor=1, workers=None):
+    """
+    Vertical shifts of the projections from their row sums. In parallel beam
+    geometry, the sum of a projection row is the total absorption of that slice at
+    every angle, so the row sums of all projections should match. Each profile is
+    registered to the median profile with a 1D phase cross-correlation, which is
+    much cheaper than reconstructing the full height.
+
+    Returns
+    -------
+    ndarray
+        y shifts, with the sign convention of `batch_cross_correlation`.
+    """
+    profiles = np.asarray(prj, dtype=np.float32).sum(axis=2)
+    reference = np.median(profiles, axis=0)
+    reference = np.broadcast_to(reference, profiles.shape)
+    shift = phase_cross_correlation(
+        reference[:, :, None],
+        profiles[:, :, None],
+        upsample_factor=upsample_factor,
+        workers=workers,
+    )
+    return shift[0]
+
+
+def pipeline_fallback_reason(slab=False, vertical_alignment="band", num_subsets=1):
+    """
+    Why `PipelinedIteration` cannot be used with these alignment settings, or None
+    if it can. It needs every angle and the full height of the projections in each
+    iteration. Iterations with an angle stride above 1 are not pipelined either.
+
+    Parameters
+    ----------
+    slab : bool
+        Slab alignment (only the subset rows are reconstructed).
+    vertical_alignment : str
+        "band", "profile" or "none".
+    num_subsets : int
+        Number of ordered subsets.
+
+    Returns
+    -------
+    str or None
+    """
+    if slab:
+        return "slab alignment reconstructs only the subset rows"
+    if vertical_alignment != "band":
+        return f'vertical alignment is "{vertical_alignment}"'
+    if num_subsets > 1:
+        return "ordered subsets update part of the angles at a time"
+    return None
+
+
+class PipelinedIteration:
+    """
+    Reprojection, cross-correlation and shifting of one alignment iteration,
+    pipelined over batches of projections with
+    `tomopyui.backend.util.pipeline.Pipeline`: batch k is correlated as soon as it
+    is reprojected, and shifted as soon as it is correlated, while the next batches
+    are still being reprojected. Gives the same shifts as running the three steps
+    one after the other.
+
+    Parameters
+    ----------
+    projector : `tomopyui.backend.util.projectors.ForwardProjector`
+        Projector of the run.
+    num_batches : int
+        Number of batches of projections.
+    upsample_factor, subset_correlation, subset_x, subset_y
+        Cross-correlation options, see `batch_cross_correlation`.
+    pad : tuple
+        Padding of the projections, see `shift_prj_update_shift`.
+    ncore : int, optional
+        Threads used inside each step.
+    progress : dict, optional
+        Progress bars by step ("reproject", "cross_correlation", "shift").
+    maxsize : int
+        Batches that can wait between two steps.
+    """
+
+    def __init__(
+        self,
+        projector,
+        num_batches,
+        upsample_factor,
+        pad,
+        subset_correlation=False,
+        subset_x=None,
+        subset_y=None,
+        ncore=None,
+        progress=None,
+        maxsize=2,
+    ):
+        self.projector = projector
+        self.num_batches = num_batches
+        self.upsample_factor = upsample_factor
+        self.pad = pad
+        self.subset_correlation = subset_correlation
+        self.subset_x = subset_x
+        self.subset_y = subset_y
+        self.ncore = _ncore() if ncore is None else ncore
+        self.pipeline = Pipeline(
+            [
+                ("reproject", self._reproject, 1),
+                ("cross_correlation", self._correlate, 1),
+                ("shift", self._shift, 1),
+            ],
+            maxsize=maxsize,
+            progress=progress,
+        )
+
+    def run(self, prj, recon, sim, sx, sy):
+        """
+        Runs the iteration. prj is shifted in place and sim is filled with the
+        reprojections.
+
+        Returns
+        -------
+        shift, sx, sy, err : ndarray
+            Same as `batch_cross_correlation` and `shift_prj_update_shift`.
+        """
+        self.prj = prj
+        self.recon = recon
+        self.sim = sim
+        self.sx = np.array(sx, dtype=np.float64)
+        self.sy = np.array(sy, dtype=np.float64)
+        self.shift = np.zeros((2, prj.shape[0]))
+        self.err = np.zeros(prj.shape[0])
+        self.bounds = np.linspace(0, prj.shape[0], self.num_batches + 1).astype(int)
+        self.pipeline.run(range(self.num_batches))
+        return self.shift, self.sx, self.sy, self.err
+
+    def _angles(self, batch):
+        return slice(self.bounds[batch], self.bounds[batch + 1])
+
+    def _reproject(self, batch):
+        angles = self._angles(batch)
+        self.projector.project(self.recon, out=self.sim[angles], angles=angles)
+        return batch
+
+    def _correlate(self, batch):
+        angles = self._angles(batch)
+        self.shift[:, angles] = batch_cross_correlation(
+            self.prj[angles],
+            self.sim[angles],
+            1,
+            self.upsample_factor,
+            subset_correlation=self.subset_correlation,
+            subset_x=self.subset_x,
+            subset_y=self.subset_y,
+            ncore=self.ncore,
+        )
+        return batch
+
+    def _shift(self, batch):
+        angles = self._angles(batch)
+        _, self.sx[angles], self.sy[angles], self.err[angles] = shift_prj_update_shift(
+            self.prj[angles],
+            self.sx[angles],
+            self.sy[angles],
+            self.shift[:, angles],
+            1,
+            self.pad,
+            self.ncore,
+        )
+        return batch
+
+
+def align_joint(RunAlign):
+    """
+    Aligns RunAlign.prjs on the CPU. Sets RunAlign.prjs, sx, sy, shift, conv,
+    recon and pad like `tomopyui.tomocupy.prep.alignment.align_joint`. The shifts
+    are in pixels of RunAlign.prjs, and start from RunAlign.sx_init and sy_init
+    (the shifts the projections already have), so they are the total shifts that
+    the padding limits. Stops early on the criteria of
+    `tomopyui.backend.util.convergence.EarlyStopping` and sets RunAlign.stop_reason.
+    Saves checkpoints with RunAlign.checkpoint, and continues from
+    RunAlign.resume_state if it is set. With RunAlign.pipeline_batches, the
+    reprojection, correlation and shift of each iteration are pipelined over the
+    batches (see `PipelinedIteration`) and RunAlign.pipeline_utilization is set.
+    If the other settings do not allow it, RunAlign.pipeline_fallback is set to the
+    reason (see `pipeline_fallback_reason`). The live plots are shown in
+    RunAlign.plot_output1 and plot_output2, and skipped if they are None.
+
+    With RunAlign.slab_alignment and subset correlation, only the rows of the
+    subset (plus the vertical padding) are reconstructed and reprojected, and
+    RunAlign.recon only has these rows. RunAlign.vertical_alignment chooses how
+    the vertical shifts are found: "band" (from the correlation, like the
+    horizontal ones), "profile" (`vertical_profile_shifts` on the full height) or
+    "none". All the rows of the projections are shifted.
+
+    With RunAlign.angle_stride k > 1, the first iterations reconstruct, reproject
+    and correlate only every k-th projection, and the shifts of the others are
+    interpolated (`interpolate_shifts`). The stride is halved as the alignment
+    converges (`tomopyui.backend.util.convergence.next_angle_stride`), and the
+    stopping criteria are only checked once all projections are used. The stride
+    of every iteration is saved in RunAlign.angle_strides.
+
+    With RunAlign.num_subsets k > 1 (ordered subsets), each iteration goes through
+    k interleaved subsets of the angles in RunAlign.subset_order (see
+    `ordered_subsets`). For each subset, the reconstruction is updated from that
+    subset only, and then reprojected at the angles of the next subset, whose
+    projections are correlated and shifted. Reprojecting at the angles the update
+    was just fitted to would mostly give back the current misalignment. The
+    reconstruction gets k updates per iteration for about the same cost as one,
+    which suits iterative methods (SIRT, OSEM, ...).
+    """
+    ncore = _ncore()
+    os.environ["TOMOPY_PYTHON_THREADS"] = str(ncore)
+
+    # Initialize variables from metadata for ease of reading:
+    num_iter = RunAlign.num_iter
+    pad_ds = RunAlign.pad_ds
+    method_str = list(RunAlign.metadata.metadata["methods"].keys())[0]
+    upsample_factor = RunAlign.upsample_factor
+    num_batches = RunAlign.num_batches
+    center = RunAlign.center
+    pre_alignment_iters = RunAlign.pre_alignment_iters
+    stopping = EarlyStopping.from_run(RunAlign)
+    checkpoint = getattr(RunAlign, "checkpoint", None)
+    profiler = getattr(RunAlign, "profiler", StageProfiler(enabled=False))
+
+    # Needs scaling for skimage float operations
+    RunAlign.prjs, scl = scale_tomo(RunAlign.prjs)
+    RunAlign.prjs = np.ascontiguousarray(RunAlign.prjs, dtype=np.float32)
+    RunAlign.recon = None
+
+    # Out-of-core: reprojections and reconstruction in memory-mapped scratch files
+    scratch = getattr(RunAlign, "scratch", None)
+
+    def allocate(name, shape):
+        if scratch is None:
+            return np.empty(shape, dtype=np.float32)
+        return scratch.zeros(name, shape)
+
+    # Initialize shift/convergence
+    RunAlign.sx, RunAlign.sy = initial_shifts(RunAlign)
+    RunAlign.conv = np.zeros((num_iter))
+    RunAlign.current_angle_stride = max(1, int(getattr(RunAlign, "angle_stride", 1)))
+    start = resume_iteration(RunAlign, scl)
+    RunAlign.angle_strides = []
+    subset_x = [int(x) + pad_ds[0] for x in RunAlign.subset_x]
+    subset_y = [int(y) + pad_ds[1] for y in RunAlign.subset_y]
+
+    # Slab alignment: reconstruct and reproject only the rows around subset_y
+    vertical_alignment = getattr(RunAlign, "vertical_alignment", "band")
+    full_height = slice(0, RunAlign.prjs.shape[1])
+    rows = full_height
+    if RunAlign.use_subset_correlation and getattr(RunAlign, "slab_alignment", False):
+        rows = slab_rows(subset_y, pad_ds[1], RunAlign.prjs.shape[1])
+        subset_y = [y - rows.start for y in subset_y]
+    num_rows = rows.stop - rows.start
+    num_angles = RunAlign.prjs.shape[0]
+    num_subsets = max(1, int(getattr(RunAlign, "num_subsets", 1)))
+    subset_order = getattr(RunAlign, "subset_order", "bit_reversal")
+    # projectors and reprojection arrays of each set of angles (a slice)
+    projectors = {}
+
+    def projector_for(angles):
+        key = (angles.start, angles.step)
+        if key not in projectors:
+            projector = make_projector(
+                getattr(RunAlign, "projector", "tomopy"),
+                RunAlign.angles_rad[angles],
+                (num_rows, RunAlign.prjs.shape[2], RunAlign.prjs.shape[2]),
+                center=center,
+                ncore=ncore,
+            )
+            sim = allocate(f"sim_{key[0]}_{key[1]}", projector.sim_shape)
+            projectors[key] = projector, sim
+        return projectors[key]
+
+    projector, sim = projector_for(slice(0, None, 1))
+    recon_out = None
+    if scratch is not None:
+        recon_out = allocate("recon", (num_rows,) + projector.shape[1:])
+    iteration = None
+    RunAlign.pipeline_fallback = None
+    if getattr(RunAlign, "pipeline_batches", False):
+        RunAlign.pipeline_fallback = pipeline_fallback_reason(
+            rows != full_height, vertical_alignment, num_subsets
+        )
+    if RunAlign.pipeline_fallback is not None:
+        print(f"Batches not pipelined: {RunAlign.pipeline_fallback}.")
+    elif getattr(RunAlign, "pipeline_batches", False):
+        iteration = PipelinedIteration(
+            projector,
+            num_batches,
+            upsample_factor,
+            pad_ds,
+            subset_correlation=RunAlign.use_subset_correlation,
+            subset_x=subset_x,
+            subset_y=subset_y,
+            ncore=ncore,
+            progress={
+                "reproject": RunAlign.Align.progress_reprj,
+                "cross_correlation": RunAlign.Align.progress_phase_cross_corr,
+                "shift": RunAlign.Align.progress_shifting,
+            },
+        )
+    plots = None
+    if getattr(RunAlign, "plot_output1", None) is not None:
+        from tomopyui.widgets.view import AlignmentPlots
+
+        plots = AlignmentPlots(RunAlign)
+
+    # Start alignment
+    for n in range(start, num_iter):
+        recon_iters = recon_iterations(n, pre_alignment_iters, RunAlign.recon_iters)
+        stride = RunAlign.current_angle_stride
+        RunAlign.angle_strides.append(stride)
+        subsets = ordered_subsets(
+            num_subsets if stride == 1 else 1, subset_order, stride, seed=n
+        )
+        err = np.zeros(num_angles)
+        RunAlign.shift = np.zeros((2, num_angles))
+        for i, update in enumerate(subsets):
+            # the reconstruction is updated from one subset, and the next subset
+            # (not fitted by that update) is corrected
+            angles = subsets[(i + 1) % len(subsets)]
+            projector, sim = projector_for(angles)
+
+            # for progress bars
+            RunAlign.Align.progress_shifting.value = 0
+            RunAlign.Align.progress_reprj.value = 0
+            RunAlign.Align.progress_phase_cross_corr.value = 0
+            with profiler.stage("reconstruct"):
+                RunAlign.recon = reconstruct(
+                    RunAlign.prjs[update, rows],
+                    RunAlign.angles_rad[update],
+                    method_str,
+                    num_iter=recon_iters,
+                    init_recon=RunAlign.recon,
+                    center=center,
+                    ncore=ncore,
+                    out=recon_out,
+                    num_chunks=num_batches,
+                )
+
+            if iteration is not None and stride == 1:
+                with profiler.stage("reproject_correlate_shift"):
+                    RunAlign.shift, RunAlign.sx, RunAlign.sy, err = iteration.run(
+                        RunAlign.prjs, RunAlign.recon, sim, RunAlign.sx, RunAlign.sy
+                    )
+                continue
+            with profiler.stage("reproject"):
+                projector.project(
+                    RunAlign.recon,
+                    out=sim,
+                    num_batches=num_batches,
+                    progress=RunAlign.Align.progress_reprj,
+                )
+            with profiler.stage("cross_correlation"):
+                shift = batch_cross_correlation(
+                    RunAlign.prjs[angles, rows],
+                    sim,
+                    num_batches,
+                    upsample_factor,
+                    subset_correlation=RunAlign.use_subset_correlation,
+                    subset_x=subset_x,
+                    subset_y=subset_y,
+                    ncore=ncore,
+                    progress=RunAlign.Align.progress_phase_cross_corr,
+                )
+                # projections to shift: all of them when the others are
+                # interpolated, the subset otherwise
+                shifted = angles
+                if stride > 1:
+                    shift = interpolate_shifts(shift, angles, num_angles)
+                    shifted = slice(None)
+                if vertical_alignment == "profile":
+                    shift[0] = vertical_profile_shifts(
+                        RunAlign.prjs[shifted], upsample_factor, ncore
+                    )
+                elif vertical_alignment == "none":
+                    shift[0] = 0
+            with profiler.stage("shift"):
+                _, sx, sy, err[shifted] = shift_prj_update_shift(
+                    RunAlign.prjs[shifted],
+                    RunAlign.sx[shifted],
+                    RunAlign.sy[shifted],
+                    shift,
+                    num_batches,
+                    pad_ds,
+                    ncore,
+                    progress=RunAlign.Align.progress_shifting,
+                )
+                RunAlign.sx[shifted] = sx
+                RunAlign.sy[shifted] = sy
+                RunAlign.shift[:, shifted] = shift
+        RunAlign.Align.progress_total.value = n + 1
+        RunAlign.conv[n] = np.linalg.norm(err)
+        if plots is not None:
+            plots.update(
+                n,
+                RunAlign.prjs[angles, rows],
+                sim,
+                RunAlign.sx,
+                RunAlign.sy,
+                RunAlign.conv,
+                stride=angles.step,
+                offset=angles.start,
+            )
+        RunAlign.current_angle_stride = next_angle_stride(
+            stride, RunAlign.conv[: n + 1], num_angles, RunAlign.ds_factor
+        )
+        if checkpoint is not None and checkpoint.due(n):
+            with profiler.stage("checkpoint"):
+                checkpoint.save(RunAlign, n, center, scl)
+        if stopping.update(RunAlign.conv[: n + 1], err, stride):
+            RunAlign.conv = RunAlign.conv[: n + 1]
+            break
+    RunAlign.stop_reason = stopping.reason
+    if iteration is not None:
+        RunAlign.pipeline_utilization = iteration.pipeline.utilization()
+
+    # Re-normalize data
+    RunAlign.prjs *= scl
+    bounds = np.linspace(0, num_rows, num_batches + 1).astype(int)
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        RunAlign.recon[start:stop] = circ_mask(RunAlign.recon[start:stop], 0)
+
+    RunAlign.pad = tuple([int(x / RunAlign.ds_factor) for x in RunAlign.pad_ds])
+    return RunAlign
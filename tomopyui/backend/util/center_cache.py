@@ -0,0 +1,255 @@
+"""
+Cache for center scans (one slice reconstructed at a range of centers).
+
+Reconstructions are stored per center, keyed by a fingerprint of the sinogram and
+angles, the pyramid level, the row and the reconstruction settings. Scanning a
+range that overlaps a previous scan only reconstructs the new centers. Entries are
+kept in memory (least recently used are dropped first) and, optionally, in .npz
+files in a folder on disk so they survive restarting the notebook.
+
+Example
+-------
+cache = CenterScanCache(cache_dir=projections.filedir / CenterScanCache.dirname)
+rec, center = cache.scan(prj, theta, cen_range=(1020, 1030, 0.5), ind=512)
+"""
+
+import hashlib
+import json
+import pathlib
+from collections import OrderedDict
+
+import numpy as np
+
+from tomopyui.backend.util.center import write_center
+
+
+def sinogram_fingerprint(sinogram, theta):
+    """
+    Hex digest identifying a sinogram and its angles. Hashes the values, so
+    renormalized or reimported data gets a new fingerprint.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    sinogram = np.ascontiguousarray(sinogram)
+    digest.update(str((sinogram.shape, sinogram.dtype.str)).encode())
+    digest.update(sinogram.tobytes())
+    digest.update(np.ascontiguousarray(theta, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+class CenterScanCache:
+    """
+    In-memory LRU cache of center scans, with an optional store on disk.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Memory used by cached reconstructions before the least recently used
+        scans are dropped.
+    cache_dir : str or pathlib.Path, optional
+        Folder for the store on disk. Nothing is written to disk if None.
+    decimals : int
+        Centers are rounded to this many decimals to match them between scans.
+
+    Attributes
+    ----------
+    hits, misses : int
+        Number of centers that were found in the cache, or had to be
+        reconstructed.
+    """
+
+    dirname = "center_scans"
+
+    def __init__(self, max_bytes=2 * 1024**3, cache_dir=None, decimals=3):
+        self.max_bytes = max_bytes
+        self.cache_dir = None if cache_dir is None else pathlib.Path(cache_dir)
+        self.decimals = decimals
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._nbytes = 0
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    def key(
+        self,
+        fingerprint,
+        pyramid_level=-1,
+        ind=None,
+        algorithm="gridrec",
+        filter_name="parzen",
+        num_iter=1,
+        mask=False,
+        ratio=1.0,
+    ):
+        """
+        Hashable key of one center scan, without its centers.
+        """
+        if algorithm in ("gridrec", "fbp"):
+            num_iter = None
+        else:
+            filter_name = None
+        return (
+            fingerprint,
+            int(pyramid_level),
+            None if ind is None else int(ind),
+            algorithm,
+            filter_name,
+            num_iter,
+            bool(mask),
+            float(ratio) if mask else None,
+        )
+
+    def get(self, key, center):
+        """
+        Returns {center: reconstruction} of the centers in center that are cached
+        under key.
+        """
+        entry = self._load(key)
+        if entry is None:
+            return {}
+        centers = np.round(center, self.decimals)
+        return {c: entry[c] for c in centers if c in entry}
+
+    def put(self, key, center, rec):
+        """
+        Adds reconstructions rec (one per center) to the scan under key.
+        """
+        entry = self._load(key)
+        if entry is None:
+            entry = self._entries[key] = {}
+        for c, image in zip(np.round(center, self.decimals), rec):
+            if c not in entry:
+                self._nbytes += image.nbytes
+            else:
+                self._nbytes += image.nbytes - entry[c].nbytes
+            entry[c] = image
+        self._entries.move_to_end(key)
+        self._save(key, entry)
+        self._evict()
+
+    def clear(self, disk=False):
+        """
+        Empties the cache in memory, and the store on disk if disk is True.
+        """
+        self._entries.clear()
+        self._nbytes = 0
+        if disk and self.cache_dir is not None and self.cache_dir.exists():
+            for path in self.cache_dir.glob("*.npz"):
+                path.unlink()
+
+    def scan(
+        self,
+        tomo,
+        theta,
+        cen_range=None,
+        ind=None,
+        pyramid_level=-1,
+        num_iter=1,
+        mask=False,
+        ratio=1.0,
+        algorithm="gridrec",
+        filter_name="parzen",
+        fingerprint=None,
+    ):
+        """
+        Same as `tomopyui.backend.util.center.write_center`, but only reconstructs
+        the centers that are not cached.
+
+        Parameters
+        ----------
+        pyramid_level : int
+            Pyramid level of tomo (-1 for full resolution). Part of the key.
+        fingerprint : str, optional
+            Fingerprint of the data. Computed from the sinogram at ind with
+            `sinogram_fingerprint` if None.
+
+        Returns
+        -------
+        rec : ndarray
+            Reconstructions with shape (len(center), dx, dx).
+        center : ndarray
+            Centers used.
+        """
+        dt, dy, dx = tomo.shape
+        if ind is None:
+            ind = dy // 2
+        if cen_range is None:
+            center = np.arange(dx / 2 - 5, dx / 2 + 5, 0.5)
+        else:
+            center = np.arange(*cen_range)
+        if theta is None:
+            return None, cen_range
+        if fingerprint is None:
+            fingerprint = sinogram_fingerprint(tomo[:, ind, :], theta)
+        key = self.key(
+            fingerprint,
+            pyramid_level,
+            ind,
+            algorithm,
+            filter_name,
+            num_iter,
+            mask,
+            ratio,
+        )
+        cached = self.get(key, center)
+        missing = [c for c in center if np.round(c, self.decimals) not in cached]
+        self.hits += len(center) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            rec, missing = write_center(
+                tomo,
+                theta,
+                ind=ind,
+                num_iter=num_iter,
+                mask=mask,
+                ratio=ratio,
+                algorithm=algorithm,
+                filter_name=filter_name,
+                center=missing,
+            )
+            if rec is None:
+                return None, center
+            self.put(key, missing, rec)
+            cached.update(zip(np.round(missing, self.decimals), rec))
+        rec = np.stack([cached[c] for c in np.round(center, self.decimals)])
+        return rec, center
+
+    def _path(self, key):
+        name = hashlib.blake2b(json.dumps(key).encode(), digest_size=16).hexdigest()
+        return self.cache_dir / f"{name}.npz"
+
+    def _load(self, key):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        if self.cache_dir is None:
+            return None
+        path = self._path(key)
+        if not path.exists():
+            return None
+        try:
+            with np.load(path) as f:
+                entry = dict(zip(f["center"].tolist(), f["rec"]))
+        except (OSError, ValueError, KeyError):
+            return None
+        self._entries[key] = entry
+        self._nbytes += sum(image.nbytes for image in entry.values())
+        return entry
+
+    def _save(self, key, entry):
+        if self.cache_dir is None:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        centers = sorted(entry)
+        path = self._path(key)
+        tmp_path = path.with_suffix(".tmp.npz")
+        np.savez(tmp_path, center=centers, rec=np.stack([entry[c] for c in centers]))
+        tmp_path.replace(path)
+
+    def _evict(self):
+        # keep the most recent scan even if it is larger than max_bytes
+        while self._nbytes > self.max_bytes and len(self._entries) > 1:
+            key, entry = self._entries.popitem(last=False)
+            self._nbytes -= sum(image.nbytes for image in entry.values())
@@ -0,0 +1,193 @@
+"""
+Checkpoints of the joint alignment loops, so that long runs can be resumed.
+
+Every few iterations (or minutes), `AlignmentCheckpoint.save` writes the state of
+the loop to a compressed .npz file in the run's folder: shifts, convergence
+history, the current padded reconstruction, padding, center and, for
+coarse-to-fine runs, the schedule level and the results of the finished levels.
+The projections are not saved. When resuming, they are loaded again and shifted
+by the saved shifts, which brings them back to where the loop left them.
+
+The file is written to a temporary name and renamed, so a run that dies while
+saving keeps its previous checkpoint. A memory-mapped reconstruction (out-of-core
+runs) is not read into memory: it is copied a chunk of slices at a time to a .npy
+file next to the checkpoint, which only stores its name.
+"""
+
+import json
+import os
+import pathlib
+from time import perf_counter
+
+import numpy as np
+
+
+class AlignmentCheckpoint:
+    """
+    Saves and loads checkpoints of an alignment run.
+
+    Parameters
+    ----------
+    savedir : pathlib.Path
+        Folder of the run (RunAlign.wd_subdir).
+    every_iters : int
+        Save every this many iterations. 0 to disable.
+    every_minutes : float
+        Save when this many minutes have passed since the last checkpoint. 0 to
+        disable.
+    """
+
+    filename = "alignment_checkpoint.npz"
+    recon_prefix = "alignment_checkpoint_recon_"
+
+    def __init__(self, savedir, every_iters=0, every_minutes=0):
+        self.filepath = pathlib.Path(savedir) / self.filename
+        self.every_iters = every_iters
+        self.every_minutes = every_minutes
+        self.last_save = perf_counter()
+
+    def due(self, n):
+        """
+        True if a checkpoint should be saved after iteration n.
+        """
+        if self.every_iters and (n + 1) % self.every_iters == 0:
+            return True
+        minutes = (perf_counter() - self.last_save) / 60
+        return bool(self.every_minutes) and minutes >= self.every_minutes
+
+    def save(self, RunAlign, n, center, scale=1):
+        """
+        Saves the state of RunAlign after iteration n.
+
+        Parameters
+        ----------
+        center : float
+            Current center of rotation of the padded projections.
+        scale : float
+            Factor the projections were divided by in the loop (the reconstruction
+            is saved in these units).
+        """
+        tmp_filepath = self.filepath.with_name("tmp_" + self.filename)
+        if isinstance(RunAlign.recon, np.memmap):
+            recon_filename = f"{self.recon_prefix}{n + 1}.npy"
+            recon_out = np.lib.format.open_memmap(
+                self.filepath.with_name(recon_filename),
+                mode="w+",
+                dtype=np.float32,
+                shape=RunAlign.recon.shape,
+            )
+            _copy_slices(RunAlign.recon, recon_out)
+            recon_out.flush()
+            del recon_out
+            recon = {"recon_file": recon_filename}
+        else:
+            recon_filename = None
+            recon = {"recon": np.asarray(RunAlign.recon, dtype=np.float32)}
+        np.savez_compressed(
+            tmp_filepath,
+            iteration=n + 1,
+            sx=RunAlign.sx,
+            sy=RunAlign.sy,
+            shift=RunAlign.shift,
+            conv=RunAlign.conv[: n + 1],
+            scale=scale,
+            pad_ds=RunAlign.pad_ds,
+            center=center,
+            pyramid_level=RunAlign.pyramid_level,
+            sx_init=RunAlign.sx_init,
+            sy_init=RunAlign.sy_init,
+            level_index=RunAlign.level_index,
+            angle_stride=getattr(RunAlign, "current_angle_stride", 1),
+            levels=json.dumps(RunAlign.levels),
+            **recon,
+        )
+        os.replace(tmp_filepath, self.filepath)
+        self._remove_recon_files(keep=recon_filename)
+        self.last_save = perf_counter()
+
+    def _remove_recon_files(self, keep=None):
+        for filepath in self.filepath.parent.glob(self.recon_prefix + "*.npy"):
+            if filepath.name != keep:
+                filepath.unlink()
+
+    def remove(self):
+        """
+        Deletes the checkpoint, after the run has been saved.
+        """
+        if self.filepath.exists():
+            self.filepath.unlink()
+        self._remove_recon_files()
+
+    @classmethod
+    def load(cls, savedir):
+        """
+        Loads the checkpoint in savedir.
+
+        Returns
+        -------
+        dict or None
+            The saved arrays, with "levels" decoded to a list of dicts. A
+            reconstruction saved to its own file is memory-mapped read-only. None if
+            there is no checkpoint.
+        """
+        filepath = pathlib.Path(savedir) / cls.filename
+        if not filepath.exists():
+            return None
+        with np.load(filepath) as f:
+            state = {key: f[key] for key in f.files}
+        state["levels"] = json.loads(str(state["levels"]))
+        if "recon_file" in state:
+            state["recon"] = np.load(
+                filepath.with_name(str(state.pop("recon_file"))), mmap_mode="r"
+            )
+        return state
+
+
+def _copy_slices(source, target, factor=1, chunk_bytes=2**28):
+    """
+    Copies source, times factor, into target a chunk of slices (about chunk_bytes)
+    at a time, so that memory-mapped arrays are not read into memory at once.
+    """
+    slice_bytes = int(np.prod(target.shape[1:])) * target.itemsize
+    step = max(1, chunk_bytes // max(1, slice_bytes))
+    for start in range(0, target.shape[0], step):
+        chunk = slice(start, start + step)
+        target[chunk] = source[chunk] * factor
+
+
+def resume_iteration(RunAlign, scale=1):
+    """
+    Restores sx, sy, shift, conv, recon and the angle stride of an alignment loop
+    from RunAlign.resume_state (set by RunAlign when resuming) and clears it. With
+    RunAlign.scratch, recon is restored into a memory-mapped scratch array a chunk
+    of slices at a time.
+
+    Parameters
+    ----------
+    scale : float
+        Factor the projections are divided by in the loop.
+
+    Returns
+    -------
+    int
+        Iteration to continue from. 0 if there is nothing to resume.
+    """
+    state = getattr(RunAlign, "resume_state", None)
+    if state is None:
+        return 0
+    RunAlign.resume_state = None
+    start = int(state["iteration"])
+    RunAlign.sx = state["sx"].copy()
+    RunAlign.sy = state["sy"].copy()
+    RunAlign.shift = state["shift"].copy()
+    RunAlign.conv[:start] = state["conv"][:start]
+    factor = np.float32(state["scale"] / scale)
+    scratch = getattr(RunAlign, "scratch", None)
+    if scratch is None:
+        RunAlign.recon = state["recon"] * factor
+    else:
+        RunAlign.recon = scratch.zeros("resume_recon", state["recon"].shape)
+        _copy_slices(state["recon"], RunAlign.recon, factor)
+    if "angle_stride" in state:
+        RunAlign.current_angle_stride = int(state["angle_stride"])
+    return start
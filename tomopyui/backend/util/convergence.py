@@ -0,0 +1,158 @@
+"""
+Stopping criteria and reconstruction iteration counts for the joint alignment
+loops (`tomopyui.backend.util.alignment.align_joint` and
+`tomopyui.tomocupy.prep.alignment.align_joint`).
+
+Each alignment iteration measures a shift update for every projection (err, in
+pixels of the aligned data) and records its norm in conv. `EarlyStopping` ends the
+loop when one of its criteria has held for `patience` iterations in a row:
+
+- conv_threshold: conv is below this many full resolution pixels,
+- conv_rtol: conv changed by less than this fraction since the last iteration,
+- shift_tol: no projection moved by more than this many full resolution pixels.
+
+A criterion set to 0 is not used. With all of them at 0 the loop runs num_iter
+iterations, as before.
+
+With angle decimation (`next_angle_stride`), conv of iterations with different
+strides sums the updates of different numbers of projections, so the criteria are
+only checked with every angle, and conv_rtol only compares iterations with the same
+stride.
+"""
+
+import numpy as np
+
+
+class EarlyStopping:
+    """
+    Decides when to stop the alignment loop.
+
+    Parameters
+    ----------
+    conv_threshold : float
+        Absolute convergence threshold in full resolution pixels.
+    conv_rtol : float
+        Relative change of the convergence between two iterations.
+    shift_tol : float
+        Largest shift update of any projection, in full resolution pixels.
+    patience : int
+        Number of consecutive iterations a criterion must hold before stopping.
+    ds_factor : int
+        Downsampling factor of the aligned data, to convert to full resolution
+        pixels.
+
+    Attributes
+    ----------
+    reason : str
+        Criterion that stopped the loop, or "num_iter" if none did.
+    """
+
+    criteria = ("conv_threshold", "conv_rtol", "shift_tol")
+
+    def __init__(
+        self, conv_threshold=0, conv_rtol=0, shift_tol=0, patience=1, ds_factor=1
+    ):
+        self.conv_threshold = conv_threshold
+        self.conv_rtol = conv_rtol
+        self.shift_tol = shift_tol
+        self.patience = max(1, int(patience))
+        self.ds_factor = ds_factor
+        self.reason = "num_iter"
+        self.counts = {criterion: 0 for criterion in self.criteria}
+        self.stride = None
+        self.history_start = 0
+
+    @classmethod
+    def from_run(cls, RunAlign):
+        """
+        Makes the stopping criteria from the options of a RunAlign instance.
+        """
+        return cls(
+            conv_threshold=RunAlign.conv_threshold,
+            conv_rtol=getattr(RunAlign, "conv_rtol", 0),
+            shift_tol=getattr(RunAlign, "shift_tol", 0),
+            patience=getattr(RunAlign, "patience", 1),
+            ds_factor=RunAlign.ds_factor,
+        )
+
+    def update(self, conv, err, stride=1):
+        """
+        Checks the criteria after an iteration. When the angle stride changes (or
+        on the first call, which can follow a resumed history), the counts are reset
+        and conv_rtol starts comparing from this iteration. Iterations with a stride
+        above 1 never stop the loop.
+
+        Parameters
+        ----------
+        conv : array-like
+            Convergence of the iterations so far, the last one included.
+        err : array-like
+            Shift update of every projection in the last iteration.
+        stride : int
+            Angle stride of the last iteration.
+
+        Returns
+        -------
+        bool
+            True if the loop should stop.
+        """
+        if stride != self.stride:
+            self.stride = stride
+            self.history_start = len(conv) - 1
+            self.counts = {criterion: 0 for criterion in self.criteria}
+        if stride > 1:
+            return False
+        current = conv[-1] * self.ds_factor
+        previous = None
+        if len(conv) - 1 > self.history_start:
+            previous = conv[-2] * self.ds_factor
+        met = {
+            "conv_threshold": current < self.conv_threshold,
+            "conv_rtol": previous is not None
+            and abs(previous - current) < self.conv_rtol * previous,
+            "shift_tol": np.max(err, initial=0) * self.ds_factor < self.shift_tol,
+        }
+        for criterion in self.criteria:
+            if met[criterion]:
+                self.counts[criterion] += 1
+            else:
+                self.counts[criterion] = 0
+            if self.counts[criterion] >= self.patience:
+                self.reason = criterion
+                return True
+        return False
+
+
+def next_angle_stride(stride, conv, num_angles, ds_factor=1, threshold=1.0):
+    """
+    Angle stride of the next alignment iteration when the first iterations use
+    every stride-th angle only. The stride is halved once the RMS shift update of
+    the last iteration is below threshold full resolution pixels, or when conv
+    stopped decreasing.
+
+    Parameters
+    ----------
+    stride : int
+        Stride of the last iteration.
+    conv : array-like
+        Convergence of the iterations so far, the last one included.
+    num_angles : int
+        Number of projections.
+    """
+    if stride <= 1:
+        return 1
+    rms = conv[-1] / np.sqrt(num_angles) * ds_factor
+    stalled = len(conv) > 1 and conv[-1] >= conv[-2]
+    if rms < threshold or stalled:
+        return max(1, stride // 2)
+    return stride
+
+
+def recon_iterations(n, pre_alignment_iters=1, recon_iters=(1,)):
+    """
+    Reconstruction iterations to run in alignment iteration n: pre_alignment_iters
+    for the first one, then recon_iters[n - 1], repeating the last entry.
+    """
+    if n == 0:
+        return pre_alignment_iters
+    return recon_iters[min(n, len(recon_iters)) - 1]
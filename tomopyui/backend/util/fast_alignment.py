@@ -0,0 +1,115 @@
+"""
+Fast alignment from 1D projections of the data, without reconstructing.
+
+In parallel beam geometry:
+
+- the sum of a projection row is the total absorption of that slice, which is the
+  same at every angle. Vertical jitter is found by registering the row-sum profile
+  of each projection to the median profile
+  (`tomopyui.backend.util.alignment.vertical_profile_shifts`).
+- the horizontal center of mass of a projection is the projection of the center of
+  mass of the sample, so it follows the sinusoid c + a cos(theta) + b sin(theta).
+  Horizontal jitter is the residual of a least squares fit of that sinusoid
+  (`center_of_mass_shifts`).
+
+Both take a few vectorized passes over the projections, so `align_fast` finishes
+in seconds. The center of mass needs the sample to stay within the field of view
+and a background close to 0 (absorption data). `align_fast` can be used on its
+own or to start the joint alignment from its shifts.
+"""
+
+import numpy as np
+
+from tomopyui.backend.util.alignment import (
+    _ncore,
+    shift_prj_update_shift,
+    vertical_profile_shifts,
+)
+from tomopyui.backend.util.shifting import initial_shifts
+
+
+def center_of_mass_shifts(prj, theta):
+    """
+    Horizontal shifts that move the center of mass of each projection onto the
+    sinusoid fitted through all of them.
+
+    Parameters
+    ----------
+    prj : ndarray
+        Projections with shape (angles, dy, dx). Negative values are ignored.
+    theta : array-like
+        Angles in radians.
+
+    Returns
+    -------
+    shift : ndarray
+        x shifts, with the sign convention of
+        `tomopyui.backend.util.alignment.batch_cross_correlation`.
+    center : float
+        Detector position of the rotation axis given by the fit.
+    """
+    theta = np.asarray(theta, dtype=np.float64)
+    # one projection at a time, so prj can be memory-mapped
+    profiles = np.stack(
+        [np.clip(image, 0, None).sum(axis=0, dtype=np.float64) for image in prj]
+    )
+    mass = profiles.sum(axis=1)
+    x = np.arange(profiles.shape[1])
+    valid = mass > 0
+    com = np.zeros(len(theta))
+    com[valid] = profiles[valid] @ x / mass[valid]
+    design = np.stack([np.ones_like(theta), np.cos(theta), np.sin(theta)], axis=1)
+    coefficients = np.linalg.lstsq(design[valid], com[valid], rcond=None)[0]
+    shift = np.where(valid, design @ coefficients - com, 0)
+    return shift, float(coefficients[0])
+
+
+def align_fast(RunAlign, num_iter=5, tol=0.05):
+    """
+    Aligns RunAlign.prjs with `vertical_profile_shifts` and
+    `center_of_mass_shifts`, alternating both until no projection moves by more
+    than tol pixels (or for num_iter passes). Sets RunAlign.prjs, sx, sy, shift,
+    conv and stop_reason like `tomopyui.backend.util.alignment.align_joint`, with
+    the shifts in pixels of RunAlign.prjs (starting from RunAlign.sx_init and
+    sy_init), and RunAlign.fast_center to the center
+    of rotation fitted to the centers of mass. RunAlign.vertical_alignment "none"
+    only finds horizontal shifts.
+    """
+    ncore = _ncore()
+    pad_ds = RunAlign.pad_ds
+    num_batches = RunAlign.num_batches
+    vertical = getattr(RunAlign, "vertical_alignment", "band") != "none"
+    RunAlign.prjs = np.ascontiguousarray(RunAlign.prjs, dtype=np.float32)
+    RunAlign.sx, RunAlign.sy = initial_shifts(RunAlign)
+    RunAlign.shift = np.zeros((2, RunAlign.prjs.shape[0]))
+    conv = []
+    RunAlign.stop_reason = "num_iter"
+    for n in range(num_iter):
+        RunAlign.Align.progress_shifting.value = 0
+        shift = np.zeros((2, RunAlign.prjs.shape[0]))
+        if vertical:
+            shift[0] = vertical_profile_shifts(
+                RunAlign.prjs, RunAlign.upsample_factor, ncore
+            )
+        shift[1], RunAlign.fast_center = center_of_mass_shifts(
+            RunAlign.prjs, RunAlign.angles_rad
+        )
+        RunAlign.shift = shift
+        RunAlign.prjs, RunAlign.sx, RunAlign.sy, err = shift_prj_update_shift(
+            RunAlign.prjs,
+            RunAlign.sx,
+            RunAlign.sy,
+            shift,
+            num_batches,
+            pad_ds,
+            ncore,
+            progress=RunAlign.Align.progress_shifting,
+        )
+        conv.append(np.linalg.norm(err))
+        RunAlign.Align.progress_total.value = n + 1
+        if np.max(err, initial=0) < tol:
+            RunAlign.stop_reason = "shift_tol"
+            break
+    RunAlign.conv = np.array(conv)
+    RunAlign.pad = tuple([int(x / RunAlign.ds_factor) for x in RunAlign.pad_ds])
+    return RunAlign
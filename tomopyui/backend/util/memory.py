@@ -0,0 +1,357 @@
+"""
+Memory planning for alignment and reconstruction runs.
+
+The estimates follow the arrays that `RunAlign`/`RunRecon` and the alignment loops
+allocate: the cropped and padded projections, the cubic reconstruction
+(rows x cols x cols), the simulated projections and the per-batch GPU buffers used
+for reprojection, phase cross correlation and shifting. They are deliberately on
+the high side, since underestimating ends in an out-of-memory kill.
+
+`plan_memory` compares the estimates with a memory budget and recommends
+`num_batches`, `pyramid_level` and whether the run should stream its data from disk.
+"""
+
+import math
+import os
+
+import numpy as np
+
+from tomopyui._sharedvars import astra_cuda_recon_algorithm_underscores
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Astra methods that keep the whole volume and all projections on the GPU.
+gpu_3d_methods = ["SIRT_Plugin", "SIRT_3D", "CGLS_3D"]
+bytes_per_px = np.dtype(np.float32).itemsize
+
+# Approximate bytes of GPU memory per projection pixel in a batch. Cross correlation
+# holds the projections, simulated projections, their median-filtered copies and
+# three complex64 FFT buffers. Shifting prefilters each image in float64 for the
+# 5th order spline.
+cross_correlation_bytes_per_px = 2 * 4 + 2 * 4 + 3 * 8
+shift_bytes_per_px = 4 + 8 + 4
+
+
+def available_memory():
+    """
+    Memory available to this process in bytes.
+    """
+    if psutil is not None:
+        return psutil.virtual_memory().available
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_AVPHYS_PAGES")
+
+
+def available_gpu_memory():
+    """
+    Free memory on the current GPU in bytes, or None if cupy is not enabled.
+    """
+    if os.environ.get("cuda_enabled") != "True":
+        return None
+    import cupy as cp
+
+    free, total = cp.cuda.runtime.memGetInfo()
+    # memory held by the cupy pool can be reused by the run.
+    return free + cp.get_default_memory_pool().free_bytes()
+
+
+def format_bytes(num_bytes):
+    """
+    Formats bytes as a human readable string, e.g. "1.5 GB".
+    """
+    for unit in ["B", "KB", "MB", "GB"]:
+        if abs(num_bytes) < 1000:
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1000
+    return f"{num_bytes:.1f} TB"
+
+
+def downsampled_shape(shape, pad, pyramid_level):
+    """
+    Shape of the padded projections after downsampling to pyramid_level (-1 for the
+    original data), as done in `RunAnalysisBase.init_projections`.
+
+    Returns
+    -------
+    cropped : tuple
+        (angles, rows, cols) before padding.
+    padded : tuple
+        (angles, rows, cols) after padding.
+    """
+    ds_factor = np.power(2, int(pyramid_level + 1))
+    num_angles, rows, cols = shape
+    rows, cols = int(rows / ds_factor), int(cols / ds_factor)
+    pad_ds = [int(p / ds_factor) for p in pad]
+    return (num_angles, rows, cols), (
+        num_angles,
+        rows + 2 * pad_ds[1],
+        cols + 2 * pad_ds[0],
+    )
+
+
+def estimate_memory(
+    shape,
+    pad=(0, 0),
+    pyramid_level=-1,
+    num_batches=1,
+    method="gridrec",
+    analysis="align",
+):
+    """
+    Estimates the memory needed by each stage of an alignment or reconstruction.
+
+    Parameters
+    ----------
+    shape : tuple
+        (angles, rows, cols) of the projections at full resolution, after cropping to
+        px_range_x and px_range_y.
+    pad : tuple
+        (x, y) padding at full resolution.
+    pyramid_level : int
+        -1 for the original data, 0, 1, 2 for data downsampled by 2, 4, 8.
+    num_batches : int
+        Number of batches the GPU work is split into.
+    method : str
+        Reconstruction method, with underscores (e.g. "SIRT_CUDA", "gridrec").
+    analysis : str
+        "align" or "recon".
+
+    Returns
+    -------
+    dict
+        {"host": {stage: bytes}, "gpu": {stage: bytes}, "host_peak": bytes,
+        "gpu_peak": bytes}. GPU entries are empty for CPU methods.
+    """
+    cuda = (
+        method in astra_cuda_recon_algorithm_underscores
+        and os.environ.get("cuda_enabled") == "True"
+    )
+    cropped, padded = downsampled_shape(shape, pad, pyramid_level)
+    num_angles, rows, cols = padded
+    prj_0 = int(np.prod(cropped)) * bytes_per_px
+    prj = int(np.prod(padded)) * bytes_per_px
+    rec = rows * cols * cols * bytes_per_px
+    num_batches = max(1, min(int(num_batches), num_angles, rows))
+    host = {"init_projections": prj_0 + prj}
+    gpu = {}
+    if analysis == "recon":
+        # tomopy makes a float32, sinogram-ordered copy of the projections.
+        iterative = method not in ("gridrec", "fbp")
+        host["reconstruct"] = 2 * prj + rec * (2 if iterative else 1)
+        host["save"] = prj + rec
+        if cuda and method in gpu_3d_methods:
+            gpu["reconstruct"] = (3 if method == "CGLS_3D" else 2) * (prj + rec)
+        elif cuda:
+            # astra through tomopy reconstructs slice by slice
+            gpu["reconstruct"] = 2 * (num_angles * cols + cols * cols) * bytes_per_px
+    elif cuda:
+        batch_prj = math.ceil(num_angles / num_batches) * rows * cols
+        batch_rows = math.ceil(rows / num_batches)
+        host["reconstruct"] = 2 * prj + 2 * rec
+        host["reproject"] = 3 * prj + rec
+        host["cross_correlation"] = 2 * prj + rec + 2 * prj // num_batches
+        host["shift"] = 3 * prj + rec
+        if method in gpu_3d_methods:
+            gpu["reconstruct"] = (3 if method == "CGLS_3D" else 2) * (prj + rec)
+        else:
+            gpu["reconstruct"] = 2 * (num_angles * cols + cols * cols) * bytes_per_px
+        gpu["reproject"] = (
+            batch_rows * cols * cols + num_angles * batch_rows * cols
+        ) * bytes_per_px
+        gpu["cross_correlation"] = batch_prj * cross_correlation_bytes_per_px
+        gpu["shift"] = batch_prj * shift_bytes_per_px
+    else:
+        # tomopy's align_joint keeps the projections, their edge-blurred copy, the
+        # simulated projections and the reconstruction.
+        host["align"] = 4 * prj + 2 * rec
+    return {
+        "host": host,
+        "gpu": gpu,
+        "host_peak": max(host.values()),
+        "gpu_peak": max(gpu.values()) if gpu else 0,
+    }
+
+
+class MemoryPlan:
+    """
+    Result of `plan_memory`.
+
+    Attributes
+    ----------
+    estimate : dict
+        `estimate_memory` output for the requested settings.
+    host_budget, gpu_budget : int or None
+        Budgets in bytes.
+    fits : bool
+        Whether the requested settings fit in the budgets.
+    num_batches : int
+        Recommended number of batches.
+    pyramid_level : int
+        Recommended pyramid level (-1 for original data).
+    stream : bool
+        True if nothing fits in host memory, so the projections and simulated
+        projections should be streamed from disk.
+    messages : list of str
+        Human readable warnings.
+    """
+
+    def __init__(self):
+        self.estimate = None
+        self.recommended_estimate = None
+        self.host_budget = None
+        self.gpu_budget = None
+        self.fits = True
+        self.num_batches = 1
+        self.pyramid_level = -1
+        self.stream = False
+        self.messages = []
+
+    def as_dict(self):
+        return {
+            "fits": self.fits,
+            "host_peak": self.estimate["host_peak"],
+            "gpu_peak": self.estimate["gpu_peak"],
+            "host_budget": self.host_budget,
+            "gpu_budget": self.gpu_budget,
+            "recommended_num_batches": self.num_batches,
+            "recommended_pyramid_level": self.pyramid_level,
+            "stream": self.stream,
+            "messages": self.messages,
+        }
+
+    def summary(self):
+        """
+        One line summary of the estimated peak memory and budget.
+        """
+        s = f"Estimated peak memory: {format_bytes(self.estimate['host_peak'])}"
+        s += f" of {format_bytes(self.host_budget)} RAM"
+        if self.gpu_budget is not None and self.estimate["gpu_peak"]:
+            s += f", {format_bytes(self.estimate['gpu_peak'])}"
+            s += f" of {format_bytes(self.gpu_budget)} GPU"
+        return s
+
+
+def plan_memory(
+    shape,
+    pad=(0, 0),
+    pyramid_level=-1,
+    num_batches=1,
+    methods=("gridrec",),
+    analysis="align",
+    host_budget=None,
+    gpu_budget=None,
+    budget_fraction=0.8,
+):
+    """
+    Checks whether a run fits in memory and recommends settings that do.
+
+    The requested pyramid level is kept if it fits, otherwise the finest coarser
+    level that fits is recommended. The requested number of batches is kept if the
+    GPU buffers fit, otherwise the smallest number of batches that fits is
+    recommended. The largest estimate across methods is used, since methods are run
+    one after another with the same settings.
+
+    Parameters
+    ----------
+    shape, pad, pyramid_level, num_batches, analysis
+        See `estimate_memory`.
+    methods : sequence of str
+        Methods that will be run.
+    host_budget, gpu_budget : int, optional
+        Budgets in bytes. Default to budget_fraction of the available memory.
+    budget_fraction : float
+        Fraction of available memory to use when a budget is not given.
+
+    Returns
+    -------
+    MemoryPlan
+    """
+    methods = list(methods) or ["gridrec"]
+    plan = MemoryPlan()
+    if host_budget is None:
+        host_budget = int(budget_fraction * available_memory())
+    if gpu_budget is None:
+        gpu_free = available_gpu_memory()
+        gpu_budget = None if gpu_free is None else int(budget_fraction * gpu_free)
+    plan.host_budget = host_budget
+    plan.gpu_budget = gpu_budget
+
+    def estimate(level, batches):
+        estimates = [
+            estimate_memory(shape, pad, level, batches, method, analysis)
+            for method in methods
+        ]
+        return max(estimates, key=lambda e: (e["host_peak"], e["gpu_peak"]))
+
+    def fits_gpu(est):
+        return gpu_budget is None or est["gpu_peak"] <= gpu_budget
+
+    plan.estimate = estimate(pyramid_level, num_batches)
+    plan.fits = plan.estimate["host_peak"] <= host_budget and fits_gpu(plan.estimate)
+
+    # pyramid level: keep it if it fits, otherwise go coarser. The GPU check uses
+    # the most batches possible, since batches are chosen below.
+    num_angles = shape[0]
+    levels = [level for level in (-1, 0, 1, 2) if level >= pyramid_level]
+    fits_host_levels = [
+        level
+        for level in levels
+        if estimate(level, num_batches)["host_peak"] <= host_budget
+    ]
+    fits_levels = [
+        level for level in fits_host_levels if fits_gpu(estimate(level, num_angles))
+    ]
+    plan.stream = not fits_host_levels
+    if fits_levels:
+        plan.pyramid_level = fits_levels[0]
+    elif fits_host_levels:
+        plan.pyramid_level = levels[-1]
+        plan.messages.append(
+            "GPU memory is too small at any downsampling level. Crop the projections "
+            + "or use a CPU method."
+        )
+    else:
+        plan.pyramid_level = levels[-1]
+
+    # batches: keep the requested number if the GPU buffers fit, otherwise use the
+    # smallest number that fits.
+    plan.num_batches = max(1, int(num_batches))
+    if not fits_gpu(estimate(plan.pyramid_level, plan.num_batches)):
+        for batches in range(plan.num_batches, num_angles + 1):
+            if fits_gpu(estimate(plan.pyramid_level, batches)):
+                plan.num_batches = batches
+                break
+    plan.recommended_estimate = estimate(plan.pyramid_level, plan.num_batches)
+
+    if plan.estimate["host_peak"] > host_budget:
+        plan.messages.append(
+            f"Needs about {format_bytes(plan.estimate['host_peak'])} of RAM, "
+            + f"but only {format_bytes(host_budget)} is available."
+        )
+    if not fits_gpu(plan.estimate):
+        plan.messages.append(
+            f"Needs about {format_bytes(plan.estimate['gpu_peak'])} of GPU memory, "
+            + f"but only {format_bytes(gpu_budget)} is available."
+        )
+    if plan.stream:
+        plan.messages.append(
+            "Does not fit in RAM at any downsampling level: data should be "
+            + "streamed from disk."
+        )
+    elif plan.pyramid_level != pyramid_level:
+        plan.messages.append(
+            "Recommended downsample factor: "
+            + f"{np.power(2, int(plan.pyramid_level + 1))}."
+        )
+    if plan.num_batches != num_batches:
+        plan.messages.append(f"Recommended number of batches: {plan.num_batches}.")
+    return plan
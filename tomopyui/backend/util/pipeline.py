@@ -0,0 +1,150 @@
+"""
+Pipelined execution of batched stages.
+
+`Pipeline` streams items (for example batches of projections) through a chain of
+stages. Each stage has its own worker threads and passes its results to the next
+stage through a bounded queue, so batch k can be in the second stage while batch
+k + 1 is still in the first one. The bounded queues keep at most a few batches in
+flight between stages, which bounds the extra memory.
+
+The stages only overlap when they release the GIL, which numpy, scipy.fft,
+scipy.sparse and tomopy do for the heavy work.
+
+Example
+-------
+pipeline = Pipeline(
+    [("reproject", reproject, 1), ("correlate", correlate, 1), ("shift", shift, 1)]
+)
+results = pipeline.run(range(num_batches))
+pipeline.utilization()  # {"reproject": {"busy_seconds", "utilization", ...}, ...}
+"""
+
+import queue
+import threading
+from time import perf_counter
+
+_done = object()
+
+
+class Pipeline:
+    """
+    Runs items through stages, each in its own worker threads.
+
+    Parameters
+    ----------
+    stages : list of tuple
+        (name, func, num_workers) of each stage, in order. func gets the result of
+        the previous stage (the item itself for the first stage).
+    maxsize : int
+        Size of the queues between stages.
+    progress : dict, optional
+        Progress bar to step for each item a stage finishes, by stage name.
+    """
+
+    def __init__(self, stages, maxsize=2, progress=None):
+        self.stages = [
+            (name, func, max(1, int(workers))) for name, func, workers in stages
+        ]
+        self.maxsize = maxsize
+        self.progress = {} if progress is None else progress
+        self.busy = {name: 0.0 for name, _, _ in self.stages}
+        self.items = {name: 0 for name, _, _ in self.stages}
+        self.wall_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def run(self, items):
+        """
+        Runs all items through the stages.
+
+        Returns
+        -------
+        list
+            Results of the last stage, in the order of items.
+
+        Raises
+        ------
+        Exception
+            The first exception raised by a stage, after all threads stopped.
+        """
+        items = list(items)
+        queues = [queue.Queue(self.maxsize) for _ in range(len(self.stages))]
+        results = [None] * len(items)
+        errors = []
+        failed = threading.Event()
+        remaining = [workers for _, _, workers in self.stages]
+
+        def work(stage):
+            name, func, _ = self.stages[stage]
+            in_queue = queues[stage]
+            while True:
+                entry = in_queue.get()
+                if entry is _done:
+                    break
+                index, value = entry
+                if failed.is_set():
+                    continue
+                tic = perf_counter()
+                try:
+                    value = func(value)
+                except Exception as e:
+                    with self._lock:
+                        errors.append(e)
+                    failed.set()
+                    continue
+                with self._lock:
+                    self.busy[name] += perf_counter() - tic
+                    self.items[name] += 1
+                    if name in self.progress:
+                        self.progress[name].value += 1
+                if stage + 1 < len(self.stages):
+                    queues[stage + 1].put((index, value))
+                else:
+                    results[index] = value
+            # the last worker of a stage tells the workers of the next one to stop
+            with self._lock:
+                remaining[stage] -= 1
+                last = remaining[stage] == 0
+            if last and stage + 1 < len(self.stages):
+                for _ in range(self.stages[stage + 1][2]):
+                    queues[stage + 1].put(_done)
+
+        threads = [
+            threading.Thread(target=work, args=(stage,), daemon=True)
+            for stage, (_, _, workers) in enumerate(self.stages)
+            for _ in range(workers)
+        ]
+        tic = perf_counter()
+        for thread in threads:
+            thread.start()
+        for entry in enumerate(items):
+            queues[0].put(entry)
+        for _ in range(self.stages[0][2]):
+            queues[0].put(_done)
+        for thread in threads:
+            thread.join()
+        self.wall_seconds += perf_counter() - tic
+        if errors:
+            raise errors[0]
+        return results
+
+    def utilization(self):
+        """
+        Busy time of every stage so far, and the fraction of the wall time its
+        workers were busy (1 means the stage was always working, so it is the
+        bottleneck).
+
+        Returns
+        -------
+        dict
+            {stage: {"busy_seconds", "items", "utilization"}}, plus
+            "wall_seconds".
+        """
+        stats = {"wall_seconds": self.wall_seconds}
+        for name, _, workers in self.stages:
+            wall = self.wall_seconds * workers
+            stats[name] = {
+                "busy_seconds": self.busy[name],
+                "items": self.items[name],
+                "utilization": self.busy[name] / wall if wall else 0.0,
+            }
+        return stats
@@ -0,0 +1,297 @@
+"""
+Lightweight stage profiling.
+
+`StageProfiler` records wall time, CPU time, peak resident memory (RSS) and bytes
+read/written (the rchar and wchar counters of /proc/self/io) for named stages of a
+run (import, normalize, hist, pyramid, center, init_projections, alignment steps,
+save, ...). Stages that run more than once, like the steps inside each alignment
+iteration, are accumulated. The results are plain dictionaries that go into the
+metadata JSON of each run under "profile".
+
+`DaskTrace` optionally records a dask `ResourceProfiler` and `Profiler` trace that
+can be saved next to the run's metadata.
+
+Example
+-------
+profiler = StageProfiler()
+with profiler.stage("normalize"):
+    ...
+metadata.metadata["profile"] = profiler.as_dict()
+"""
+
+import functools
+import importlib.util
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+_page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss():
+    """
+    Current resident memory of this process in bytes, or None if it cannot be
+    determined on this platform.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _page_size
+    except OSError:
+        pass
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    return None
+
+
+def io_counters():
+    """
+    Bytes read and written by this process through system calls (including reads
+    served from the page cache), as (read, written): the rchar and wchar counters
+    of /proc/self/io. Returns (0, 0) where /proc/self/io is not available, rather
+    than mixing in counters of another kind (like the storage-level bytes of
+    psutil).
+    """
+    try:
+        with open("/proc/self/io") as f:
+            counters = dict(line.split(": ") for line in f.read().splitlines())
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        return 0, 0
+
+
+def synchronize_cuda():
+    """
+    Waits for the work queued on the current CUDA device, so that GPU stages are
+    measured to their end rather than to the return of asynchronous kernel
+    launches. Does nothing if cupy has not been imported.
+    """
+    cupy = sys.modules.get("cupy")
+    if cupy is not None:
+        cupy.cuda.Device().synchronize()
+
+
+class StageProfiler:
+    """
+    Records per-stage wall time, CPU time, peak RSS and I/O bytes.
+
+    Peak RSS is sampled by a background thread that only runs while a stage is
+    active. Stages can be nested; each one records its own peak. The CUDA device
+    is synchronized when a stage starts and ends (see `synchronize_cuda`).
+
+    Parameters
+    ----------
+    sample_interval : float
+        Seconds between RSS samples.
+    enabled : bool
+        If False, stages are not measured. Lets callers always use
+        `StageProfiler.stage` without checking whether profiling is on.
+
+    Attributes
+    ----------
+    stages : dict
+        {stage name: {"calls", "wall_s", "cpu_s", "peak_rss_bytes",
+        "read_bytes", "written_bytes"}}, in the order stages first ran.
+    """
+
+    def __init__(self, sample_interval=0.05, enabled=True):
+        self.sample_interval = sample_interval
+        self.enabled = enabled
+        self.stages = {}
+        self._active = []
+        self._lock = threading.Lock()
+        self._stop_sampling = threading.Event()
+        self._sampler = None
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Context manager that measures the code inside it as stage `name`.
+        """
+        if not self.enabled:
+            yield
+            return
+        synchronize_cuda()
+        record = {"peak_rss": current_rss() or 0}
+        self._start(record)
+        read_before, written_before = io_counters()
+        cpu_before = time.process_time()
+        wall_before = time.perf_counter()
+        try:
+            yield
+        finally:
+            synchronize_cuda()
+            wall = time.perf_counter() - wall_before
+            cpu = time.process_time() - cpu_before
+            read_after, written_after = io_counters()
+            self._stop(record)
+            self._add(
+                name,
+                wall,
+                cpu,
+                record["peak_rss"],
+                read_after - read_before,
+                written_after - written_before,
+            )
+
+    def profile(self, name=None):
+        """
+        Decorator version of `stage`. Uses the function name if name is None.
+        """
+
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name or func.__name__):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def as_dict(self):
+        """
+        Returns a copy of the recorded stages that can be saved as JSON.
+        """
+        return {name: dict(stats) for name, stats in self.stages.items()}
+
+    def _add(self, name, wall, cpu, peak_rss, read_bytes, written_bytes):
+        stats = self.stages.setdefault(
+            name,
+            {
+                "calls": 0,
+                "wall_s": 0.0,
+                "cpu_s": 0.0,
+                "peak_rss_bytes": 0,
+                "read_bytes": 0,
+                "written_bytes": 0,
+            },
+        )
+        stats["calls"] += 1
+        stats["wall_s"] += wall
+        stats["cpu_s"] += cpu
+        stats["peak_rss_bytes"] = max(stats["peak_rss_bytes"], peak_rss)
+        stats["read_bytes"] += read_bytes
+        stats["written_bytes"] += written_bytes
+
+    def _start(self, record):
+        with self._lock:
+            self._active.append(record)
+            if self._sampler is None:
+                self._stop_sampling.clear()
+                self._sampler = threading.Thread(target=self._sample, daemon=True)
+                self._sampler.start()
+
+    def _stop(self, record):
+        rss = current_rss() or 0
+        sampler = None
+        with self._lock:
+            record["peak_rss"] = max(record["peak_rss"], rss)
+            # compare by identity, records of nested stages can be equal
+            self._active = [r for r in self._active if r is not record]
+            if not self._active:
+                sampler, self._sampler = self._sampler, None
+                self._stop_sampling.set()
+        if sampler is not None:
+            sampler.join()
+
+    def _sample(self):
+        while not self._stop_sampling.wait(self.sample_interval):
+            rss = current_rss() or 0
+            with self._lock:
+                for record in self._active:
+                    record["peak_rss"] = max(record["peak_rss"], rss)
+
+
+class DaskTrace:
+    """
+    Context manager that records dask task and resource usage for everything
+    computed inside it, using `dask.diagnostics.Profiler` and
+    `dask.diagnostics.ResourceProfiler`.
+
+    Only computations run by the local dask schedulers are recorded.
+
+    Parameters
+    ----------
+    enabled : bool
+        If False, nothing is recorded and `save` does nothing.
+    dt : float
+        Seconds between resource samples.
+    """
+
+    filename = "dask_profile.json"
+    html_filename = "dask_profile.html"
+
+    def __init__(self, enabled=True, dt=0.25):
+        self.enabled = enabled
+        self.dt = dt
+        self.profilers = None
+
+    def __enter__(self):
+        if self.enabled:
+            from dask.diagnostics import Profiler, ResourceProfiler
+
+            self.profilers = [Profiler(), ResourceProfiler(dt=self.dt)]
+            for profiler in self.profilers:
+                profiler.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        if self.profilers is not None:
+            for profiler in reversed(self.profilers):
+                profiler.__exit__(*exc)
+        return False
+
+    def save(self, savedir):
+        """
+        Saves the trace in savedir as dask_profile.json (resource samples and task
+        timings) and, if bokeh is installed, as an interactive dask_profile.html.
+        Failures to write the trace are logged as warnings, so that they do not stop
+        the run.
+        """
+        if self.profilers is None:
+            return
+        task_profiler, resource_profiler = self.profilers
+        trace = {
+            "resources": [
+                {"time": r.time, "mem_mb": r.mem, "cpu_percent": r.cpu}
+                for r in resource_profiler.results
+            ],
+            "tasks": [
+                {
+                    "key": str(t.key),
+                    "start": t.start_time,
+                    "end": t.end_time,
+                    "worker": t.worker_id,
+                }
+                for t in task_profiler.results
+            ],
+        }
+        try:
+            with open(os.path.join(savedir, self.filename), "w") as f:
+                json.dump(trace, f, indent=4)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning("Could not save the dask trace: %s", e)
+        if importlib.util.find_spec("bokeh") is None:
+            return
+        from dask.diagnostics import visualize
+
+        try:
+            visualize(
+                self.profilers,
+                filename=os.path.join(savedir, self.html_filename),
+                show=False,
+                save=True,
+            )
+        except (OSError, ValueError) as e:
+            logger.warning("Could not save the dask trace plot: %s", e)
@@ -0,0 +1,297 @@
+"""
+CPU forward projectors for the reprojection step of the alignment loop.
+
+Every projector is made once per alignment run for the angles, volume shape and
+center of rotation, so geometries and other setup are reused across iterations.
+`ForwardProjector.project` writes into a preallocated (angles, dy, dx) array, for
+all angles or for a contiguous range of them (a batch of projections).
+
+- "tomopy": `tomopy.project`. Matches the orientation of tomopy reconstructions.
+- "astra": astra's 2D CPU projectors ("line", "strip" or "linear"), one slice
+  at a time in a thread pool. The center is set with `astra.geom_postalignment`
+  like in `tomopyui.tomocupy.prep.alignment.simulate_projections`.
+- "rotation": in-house rotate-and-sum Radon transform with one sparse matrix per
+  angle, in parallel over angles. Pixel (row, col) of
+  a slice projects to detector position center + x cos(theta) + y sin(theta),
+  with x = col - (n - 1) / 2 and y = row - (n - 1) / 2 (the geometry of
+  `tomopyui.backend.util.center.center_scan`).
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import scipy.sparse
+
+
+class ForwardProjector:
+    """
+    Base class of the forward projectors.
+
+    Parameters
+    ----------
+    theta : array-like
+        Projection angles in radians.
+    shape : tuple of int
+        Shape of the volumes to project, (dy, dx, dx).
+    center : float, optional
+        Detector position of the rotation axis. Defaults to the middle of the
+        detector.
+    ncore : int, optional
+        Number of threads. Defaults to the num_cpu_cores environment variable.
+    """
+
+    def __init__(self, theta, shape, center=None, ncore=None):
+        self.theta = np.asarray(theta, dtype=np.float64)
+        self.shape = tuple(shape)
+        self.center = center
+        if ncore is None:
+            ncore = int(os.environ.get("num_cpu_cores", os.cpu_count()))
+        self.ncore = ncore
+
+    @property
+    def sim_shape(self):
+        return (len(self.theta), self.shape[0], self.shape[2])
+
+    def project(self, rec, out=None, num_batches=1, progress=None, angles=None):
+        """
+        Projects rec in num_batches batches of slices.
+
+        Parameters
+        ----------
+        rec : ndarray
+            Volume with shape (dy, dx, dx).
+        out : ndarray, optional
+            Array with shape (angles, dy, dx) to write the projections into.
+        num_batches : int
+            Number of batches of slices. The progress bar steps once per batch.
+        progress : ipywidgets.IntProgress, optional
+            Progress bar.
+        angles : slice, optional
+            Contiguous range of angles to project. Defaults to all of them. Raises
+            ValueError if its step is not 1.
+
+        Returns
+        -------
+        ndarray
+            out.
+        """
+        if angles is None:
+            angles = slice(None)
+        start, stop, step = angles.indices(len(self.theta))
+        if step != 1:
+            raise ValueError(f"angles must be a contiguous range, got step {step}.")
+        angles = slice(start, stop)
+        if out is None:
+            num_angles = angles.stop - angles.start
+            out = np.empty((num_angles,) + self.sim_shape[1:], dtype=np.float32)
+        bounds = np.linspace(0, rec.shape[0], num_batches + 1).astype(int)
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            self._project(rec[start:stop], out[:, start:stop], angles)
+            if progress is not None:
+                progress.value += 1
+        return out
+
+    def _project(self, rec, out, angles):
+        raise NotImplementedError
+
+
+class TomopyProjector(ForwardProjector):
+    """
+    Projects with `tomopy.project`.
+    """
+
+    def _project(self, rec, out, angles):
+        import tomopy
+
+        out[:] = tomopy.project(
+            rec, self.theta[angles], center=self.center, pad=False, ncore=self.ncore
+        )
+
+
+class AstraProjector(ForwardProjector):
+    """
+    Projects with astra's 2D CPU projectors, one slice at a time in ncore threads.
+    Each thread keeps its own astra objects for each range of angles, made once
+    and reused.
+
+    Parameters
+    ----------
+    projector : str
+        astra projector type: "line", "strip" or "linear".
+    """
+
+    def __init__(self, theta, shape, center=None, ncore=None, projector="linear"):
+        super().__init__(theta, shape, center, ncore)
+        import astra
+
+        self.astra = astra
+        num_pixels = self.shape[2]
+        self.vol_geom = astra.create_vol_geom(num_pixels, num_pixels)
+        self.projector = projector
+        self._local = threading.local()
+        self._ids = []
+        self._lock = threading.Lock()
+
+    def _proj_geom(self, angles):
+        num_pixels = self.shape[2]
+        proj_geom = self.astra.create_proj_geom(
+            "parallel", 1.0, num_pixels, self.theta[angles]
+        )
+        if self.center is not None:
+            proj_geom = self.astra.geom_postalignment(
+                proj_geom, -(self.center - num_pixels / 2)
+            )
+        return proj_geom
+
+    def _objects(self, angles):
+        if not hasattr(self._local, "objects"):
+            self._local.objects = {}
+        key = (angles.start, angles.stop)
+        objects = self._local.objects.get(key)
+        if objects is None:
+            astra = self.astra
+            proj_geom = self._proj_geom(angles)
+            projector_id = astra.create_projector(
+                self.projector, proj_geom, self.vol_geom
+            )
+            volume_id = astra.data2d.create("-vol", self.vol_geom)
+            sinogram_id = astra.data2d.create("-sino", proj_geom)
+            config = astra.astra_dict("FP")
+            config["ProjectorId"] = projector_id
+            config["VolumeDataId"] = volume_id
+            config["ProjectionDataId"] = sinogram_id
+            algorithm_id = astra.algorithm.create(config)
+            objects = (projector_id, volume_id, sinogram_id, algorithm_id)
+            self._local.objects[key] = objects
+            with self._lock:
+                self._ids.append(objects)
+        return objects
+
+    def _project_slice(self, image, angles):
+        projector_id, volume_id, sinogram_id, algorithm_id = self._objects(angles)
+        self.astra.data2d.store(volume_id, image)
+        self.astra.algorithm.run(algorithm_id)
+        return self.astra.data2d.get_shared(sinogram_id)
+
+    def _project(self, rec, out, angles):
+        def project_slice(z):
+            out[:, z] = self._project_slice(rec[z], angles)
+
+        with ThreadPoolExecutor(max_workers=self.ncore) as pool:
+            list(pool.map(project_slice, range(rec.shape[0])))
+
+    def close(self):
+        """
+        Deletes the astra objects.
+        """
+        with self._lock:
+            for projector_id, volume_id, sinogram_id, algorithm_id in self._ids:
+                self.astra.algorithm.delete(algorithm_id)
+                self.astra.data2d.delete([volume_id, sinogram_id])
+                self.astra.projector.delete(projector_id)
+            self._ids = []
+        self._local = threading.local()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class RotationProjector(ForwardProjector):
+    """
+    Rotate-and-sum Radon transform. For each angle, the slices are sampled with
+    linear interpolation along rays one pixel apart, and the samples of each ray
+    are summed. The sampling of one angle is a sparse (dx, dx * dx) matrix, so all
+    slices of a batch are projected with one sparse matrix product per angle.
+    Angles are split between ncore threads.
+
+    Parameters
+    ----------
+    max_cache_bytes : int
+        The matrices are made once and kept if they fit in this many bytes.
+        Otherwise they are made again on every call.
+    """
+
+    def __init__(self, theta, shape, center=None, ncore=None, max_cache_bytes=2**30):
+        super().__init__(theta, shape, center, ncore)
+        num_pixels = self.shape[2]
+        if center is None:
+            center = (num_pixels - 1) / 2
+        self._center = center
+        # about 4 nonzeros (value and column index) per pixel and angle
+        matrix_bytes = 4 * num_pixels**2 * 8
+        self.cache_matrices = matrix_bytes * len(self.theta) <= max_cache_bytes
+        self._matrices = {}
+
+    def _matrix(self, i):
+        if i in self._matrices:
+            return self._matrices[i]
+        n = self.shape[2]
+        middle = (n - 1) / 2
+        # rays long enough to cross the corners of the slices
+        ray_length = int(np.ceil(n * np.sqrt(2)))
+        t = np.arange(ray_length) - (ray_length - 1) / 2
+        u = np.arange(n) - self._center
+        cos, sin = np.cos(self.theta[i]), np.sin(self.theta[i])
+        rows = (u[None, :] * sin + t[:, None] * cos + middle).ravel()
+        cols = (u[None, :] * cos - t[:, None] * sin + middle).ravel()
+        detector = np.broadcast_to(np.arange(n)[None, :], (ray_length, n)).ravel()
+        row0 = np.floor(rows).astype(np.intp)
+        col0 = np.floor(cols).astype(np.intp)
+        weight_row = (rows - row0).astype(np.float32)
+        weight_col = (cols - col0).astype(np.float32)
+        entries = [], [], []
+        for d_row, w_row in ((0, 1 - weight_row), (1, weight_row)):
+            for d_col, w_col in ((0, 1 - weight_col), (1, weight_col)):
+                r = row0 + d_row
+                c = col0 + d_col
+                valid = (r >= 0) & (r < n) & (c >= 0) & (c < n)
+                entries[0].append(detector[valid])
+                entries[1].append(r[valid] * n + c[valid])
+                entries[2].append((w_row * w_col)[valid])
+        detector, pixel, weight = (np.concatenate(e) for e in entries)
+        matrix = scipy.sparse.csr_matrix(
+            (weight, (detector, pixel)), shape=(n, n * n), dtype=np.float32
+        )
+        if self.cache_matrices:
+            self._matrices[i] = matrix
+        return matrix
+
+    def _project(self, rec, out, angles):
+        n = self.shape[2]
+        flat = np.ascontiguousarray(
+            np.asarray(rec, dtype=np.float32).reshape(rec.shape[0], n * n).T
+        )
+
+        def project_angles(indices):
+            for i in indices:
+                out[i - angles.start] = (self._matrix(i) @ flat).T
+
+        indices = np.arange(angles.start, angles.stop)
+        chunks = np.array_split(indices, min(self.ncore, len(indices)))
+        with ThreadPoolExecutor(max_workers=self.ncore) as pool:
+            list(pool.map(project_angles, chunks))
+
+
+forward_projectors = {
+    "tomopy": TomopyProjector,
+    "astra": AstraProjector,
+    "rotation": RotationProjector,
+}
+
+
+def make_projector(name, theta, shape, center=None, ncore=None):
+    """
+    Makes the forward projector called name (a key of `forward_projectors`).
+    """
+    try:
+        projector_class = forward_projectors[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown projector {name}, choose one of {list(forward_projectors)}"
+        )
+    return projector_class(theta, shape, center=center, ncore=ncore)
@@ -0,0 +1,140 @@
+"""
+Batched phase cross-correlation on the CPU.
+
+Same result as `._phase_cross_correlation_cupy.phase_cross_correlation` (and
+skimage's `phase_cross_correlation` without normalization), for a whole stack of
+images at once:
+
+- the spectra are computed with `scipy.fft.rfft2` in complex64, using several
+  threads,
+- the coarse peak of every image is found with one `irfft2`,
+- the upsampled refinement around each peak (Guizar-Sicairos et al., 2008) is one
+  batched matrix product over the half spectrum.
+
+The frequency grids, DFT kernels and edge masks only depend on the image shape
+and upsample factor, so they are computed once and cached.
+"""
+
+import functools
+import os
+
+import numpy as np
+import scipy.fft
+
+
+@functools.lru_cache(maxsize=8)
+def edge_mask(shape, low=0, high=0.8):
+    """
+    Radial mask that blurs the edges of images with this shape (see
+    `tomopyui.tomocupy.prep.alignment.blur_edges_cp`). Read only.
+    """
+    dy, dx = shape
+    rows, cols = np.mgrid[:dy, :dx]
+    rad = np.sqrt((rows - dy / 2) ** 2 + (cols - dx / 2) ** 2)
+    rmin, rmax = low * rad.max(), high * rad.max()
+    mask = np.clip((rmax - rad) / (rmax - rmin), 0, 1).astype(np.float32)
+    mask.flags.writeable = False
+    return mask
+
+
+@functools.lru_cache(maxsize=8)
+def _upsampled_kernels(shape, upsample_factor):
+    """
+    Parts of the upsampled DFT kernels that do not depend on the coarse peak.
+
+    Returns
+    -------
+    freq_y : ndarray
+        Signed frequencies along y (cycles per image).
+    freq_x : ndarray
+        Frequencies of the rfft along x.
+    kernel_y : ndarray
+        (region, ny) kernel along y, for a peak at 0.
+    kernel_x : ndarray
+        (nx // 2 + 1, region) kernel along x, for a peak at 0, with the weights
+        that turn the sum over half the spectrum into the real part of the
+        inverse DFT.
+    dftshift : float
+        Position of the coarse peak in the upsampled region.
+    """
+    ny, nx = shape
+    region_size = int(np.ceil(upsample_factor * 1.5))
+    dftshift = np.fix(region_size / 2.0)
+    offsets = (np.arange(region_size) - dftshift) / upsample_factor
+    freq_y = scipy.fft.fftfreq(ny)
+    freq_x = scipy.fft.rfftfreq(nx)
+    kernel_y = np.exp(2j * np.pi * offsets[:, None] * freq_y[None, :])
+    weights = np.full(freq_x.size, 2.0)
+    weights[0] = 1
+    if nx % 2 == 0:
+        weights[-1] = 1
+    kernel_x = weights[:, None] * np.exp(
+        2j * np.pi * freq_x[:, None] * offsets[None, :]
+    )
+    for kernel in (kernel_y, kernel_x):
+        kernel.flags.writeable = False
+    return (
+        freq_y,
+        freq_x,
+        kernel_y.astype(np.complex64),
+        kernel_x.astype(np.complex64),
+        dftshift,
+    )
+
+
+def phase_cross_correlation(
+    reference_images, moving_images, upsample_factor=1, workers=None
+):
+    """
+    Shifts that register each of moving_images with the matching reference image.
+
+    Parameters
+    ----------
+    reference_images, moving_images : ndarray
+        Stacks of images with shape (n, dy, dx).
+    upsample_factor : int
+        Images are registered to within 1 / upsample_factor of a pixel.
+    workers : int, optional
+        Threads used by the FFTs. Defaults to the num_cpu_cores environment
+        variable.
+
+    Returns
+    -------
+    shifts : ndarray
+        Shifts with shape (2, n): y shifts in shifts[0], x shifts in shifts[1].
+        Same sign convention as skimage.
+    """
+    if reference_images.shape != moving_images.shape:
+        raise ValueError("images must be same shape")
+    if workers is None:
+        workers = int(os.environ.get("num_cpu_cores", os.cpu_count()))
+    num_images, ny, nx = reference_images.shape
+    src_freqs = scipy.fft.rfft2(
+        np.asarray(reference_images, dtype=np.float32), workers=workers
+    )
+    target_freqs = scipy.fft.rfft2(
+        np.asarray(moving_images, dtype=np.float32), workers=workers
+    )
+    image_product = src_freqs * target_freqs.conj()
+    cross_correlation = scipy.fft.irfft2(image_product, s=(ny, nx), workers=workers)
+    maxima = np.argmax(np.abs(cross_correlation).reshape(num_images, -1), axis=1)
+    shifts = np.stack(np.unravel_index(maxima, (ny, nx))).astype(np.float64)
+    shifts[0, shifts[0] > np.fix(ny / 2)] -= ny
+    shifts[1, shifts[1] > np.fix(nx / 2)] -= nx
+    if upsample_factor == 1:
+        return shifts
+
+    shifts = np.round(shifts * upsample_factor) / upsample_factor
+    freq_y, freq_x, kernel_y, kernel_x, dftshift = _upsampled_kernels(
+        (ny, nx), upsample_factor
+    )
+    # move the kernels to each coarse peak
+    phase_y = np.exp(2j * np.pi * shifts[0][:, None] * freq_y[None, :])
+    phase_x = np.exp(2j * np.pi * shifts[1][:, None] * freq_x[None, :])
+    kernels_y = kernel_y[None] * phase_y[:, None, :].astype(np.complex64)
+    kernels_x = kernel_x[None] * phase_x[:, :, None].astype(np.complex64)
+    upsampled = np.abs((kernels_y @ image_product @ kernels_x).real)
+    region_size = upsampled.shape[-1]
+    maxima = np.argmax(upsampled.reshape(num_images, -1), axis=1)
+    maxima = np.stack(np.unravel_index(maxima, (region_size, region_size)))
+    return shifts + (maxima - dftshift) / upsample_factor
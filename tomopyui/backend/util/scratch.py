@@ -0,0 +1,68 @@
+"""
+Memory-mapped scratch arrays for out-of-core alignment.
+
+With out-of-core alignment, the padded projections, the reprojections and the
+reconstruction are .npy files in a scratch folder of the run, opened with
+`numpy.lib.format.open_memmap`. The alignment loop already works on them in
+batches (of angles for the correlation and shifting, of slices for the
+reconstruction and reprojection), so only the batches being processed are in
+memory and the operating system pages the rest in and out.
+"""
+
+import pathlib
+import shutil
+
+import numpy as np
+
+
+class ScratchArrays:
+    """
+    Makes memory-mapped arrays in a scratch folder.
+
+    Parameters
+    ----------
+    directory : pathlib.Path
+        Scratch folder. Made if it does not exist.
+    """
+
+    def __init__(self, directory):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.filepaths = {}
+        self._count = 0
+
+    def zeros(self, name, shape, dtype=np.float32):
+        """
+        Makes a memory-mapped array filled with zeros. An array made before with the
+        same name is replaced: its file is deleted, and arrays still using it keep
+        their data until they are closed.
+
+        Returns
+        -------
+        numpy.memmap
+        """
+        self.release(name)
+        self._count += 1
+        filepath = self.directory / f"{name}_{self._count}.npy"
+        self.filepaths[name] = filepath
+        return np.lib.format.open_memmap(
+            filepath, mode="w+", dtype=dtype, shape=tuple(shape)
+        )
+
+    def release(self, name):
+        """
+        Deletes the file of the array called name, if there is one.
+        """
+        filepath = self.filepaths.pop(name, None)
+        if filepath is not None:
+            try:
+                filepath.unlink()
+            except OSError:
+                pass
+
+    def cleanup(self):
+        """
+        Deletes the scratch folder.
+        """
+        self.filepaths = {}
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,126 @@
+"""
+Batched subpixel shifting of projection stacks on the CPU.
+
+`shift_stack` shifts every projection by its own (sy, sx) with a phase ramp in
+Fourier space, a batch of projections at a time: one multithreaded `rfft2`, one
+multiply and one `irfft2` per batch, written into a preallocated output (which can
+be the input). This replaces calling `scipy.ndimage.shift` on one frame at a time.
+
+Fourier shifts are periodic: what leaves one side of the image comes back on the
+other. Projections are padded with zeros before alignment, so as long as the
+shifts stay within the padding (see `within_pad`) nothing wraps around.
+"""
+
+import functools
+import os
+
+import numpy as np
+import scipy.fft
+
+from tomopyui.backend.util.padding import pad_projections
+
+
+@functools.lru_cache(maxsize=8)
+def _frequencies(shape):
+    ny, nx = shape
+    freq_y = scipy.fft.fftfreq(ny).astype(np.float32)
+    freq_x = scipy.fft.rfftfreq(nx).astype(np.float32)
+    for freq in (freq_y, freq_x):
+        freq.flags.writeable = False
+    return freq_y, freq_x
+
+
+def within_pad(sx, sy, shift_x, shift_y, pad):
+    """
+    True for the projections that stay inside the padding after adding the shifts,
+    the rule used by `tomopyui.tomocupy.prep.alignment.shift_prj_update_shift_cp`.
+    """
+    return (np.abs(sx + shift_x) < pad[0]) & (np.abs(sy + shift_y) < pad[1])
+
+
+def initial_shifts(RunAlign):
+    """
+    Shifts the projections of RunAlign already have when its alignment loop
+    starts (RunAlign.sx_init and sy_init, zeros if they are not set), in pixels of
+    RunAlign.prjs. The loops start sx and sy from them and add their own shifts, so
+    that `within_pad` limits the total shift of every projection.
+
+    Returns
+    -------
+    sx, sy : ndarray
+    """
+    num_angles = RunAlign.prjs.shape[0]
+    shifts = []
+    for name in ("sx_init", "sy_init"):
+        init = getattr(RunAlign, name, None)
+        if init is None:
+            shifts.append(np.zeros(num_angles))
+        else:
+            shifts.append(np.array(init, dtype=np.float64))
+    return tuple(shifts)
+
+
+def shift_stack(prj, sx, sy, out=None, mask=None, batch_size=32, workers=None):
+    """
+    Shifts each projection prj[i] by (sy[i], sx[i]) pixels.
+
+    Parameters
+    ----------
+    prj : ndarray
+        Projections with shape (angles, dy, dx).
+    sx, sy : array-like
+        Shifts along x and y of every projection. Positive shifts move the image
+        right and down, like `scipy.ndimage.shift`.
+    out : ndarray, optional
+        Output with the same shape as prj. Can be prj or a view of it, to shift in
+        place. A new float32 array is made if None.
+    mask : array-like of bool, optional
+        Only projections where mask is True are shifted. The others are copied to
+        out unchanged.
+    batch_size : int
+        Projections transformed at a time. Bounds the memory of the spectra.
+    workers : int, optional
+        Threads used by the FFTs. Defaults to the num_cpu_cores environment
+        variable.
+
+    Returns
+    -------
+    ndarray
+        out.
+    """
+    if workers is None:
+        workers = int(os.environ.get("num_cpu_cores", os.cpu_count()))
+    if out is None:
+        out = np.empty(prj.shape, dtype=np.float32)
+    sx = np.asarray(sx, dtype=np.float32)
+    sy = np.asarray(sy, dtype=np.float32)
+    if mask is None:
+        mask = (sx != 0) | (sy != 0)
+    indices = np.flatnonzero(mask)
+    if not np.shares_memory(out, prj):
+        unshifted = np.flatnonzero(~np.asarray(mask, dtype=bool))
+        out[unshifted] = prj[unshifted]
+    freq_y, freq_x = _frequencies(prj.shape[1:])
+    for start in range(0, len(indices), batch_size):
+        batch = indices[start : start + batch_size]
+        spectrum = scipy.fft.rfft2(
+            np.asarray(prj[batch], dtype=np.float32), workers=workers
+        )
+        ramp_y = np.exp(-2j * np.pi * sy[batch, None] * freq_y[None, :])
+        ramp_x = np.exp(-2j * np.pi * sx[batch, None] * freq_x[None, :])
+        spectrum *= ramp_y[:, :, None].astype(np.complex64)
+        spectrum *= ramp_x[:, None, :].astype(np.complex64)
+        out[batch] = scipy.fft.irfft2(spectrum, s=prj.shape[1:], workers=workers)
+    return out
+
+
+def shift_projections(projections, sx, sy):
+    """
+    Pads the projections by the largest shift (rounded up) and shifts each one by
+    (sy, sx), with `shift_stack`.
+    """
+    sx = np.asarray(sx)
+    sy = np.asarray(sy)
+    pad = (int(np.ceil(np.max(np.abs(sx)))), int(np.ceil(np.max(np.abs(sy)))))
+    new_prj_imgs = pad_projections(np.asarray(projections, dtype=np.float32), pad)
+    return shift_stack(new_prj_imgs, sx, sy, out=new_prj_imgs)
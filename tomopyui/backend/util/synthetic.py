@@ -0,0 +1,1093 @@
+"""
+Synthetic tomography scans for benchmarking and regression testing.
+
+Projections are computed analytically from a 3D modified Shepp-Logan phantom, so
+they can be generated at any size without ever holding a reconstructed volume in
+memory. Known misalignments (per-projection jitter, rotation center offset and axis
+tilt) can be applied so that center finding, alignment and reconstruction results
+can be checked against the ground truth that is saved next to each scan.
+
+The writers produce the same file layouts that the importers in
+`tomopyui.backend.io` expect:
+
+- SSRL 6-2c: .xrm files, a ScanInfo file and a run script with "sete" and
+  "collect" lines. Multiple exposures per angle and multiple energies are
+  supported.
+- SSRL 6-2b: folders of .tif projections and references, each with a
+  Micro-Manager style metadata.txt.
+- ALS 8.3.2 and APS: a single raw hdf5 file in the data exchange format.
+- Prenormalized data: a .tif stack, a folder of .tif files or a .npy file.
+
+Example
+-------
+>>> from tomopyui.backend.util import synthetic
+>>> truth = synthetic.write_als832("scan.h5", scale="small", jitter_std=2)
+"""
+
+import datetime
+import inspect
+import json
+import pathlib
+import struct
+
+import h5py
+import numpy as np
+import tifffile as tf
+
+# (num_angles, num_rows, num_cols) presets for the "scale" keyword.
+SCALES = {
+    "tiny": (31, 32, 32),
+    "small": (91, 64, 64),
+    "medium": (181, 256, 256),
+    "large": (721, 1024, 1024),
+    "xlarge": (1801, 2048, 2048),
+}
+
+# Modified 3D Shepp-Logan phantom (Toft). Each row is
+# (density, a, b, c, x0, y0, z0, phi) in normalized coordinates, where a, b and c
+# are the semi-axes and phi is the rotation about the z (rotation) axis in degrees.
+SHEPP_LOGAN_3D = np.array(
+    [
+        [1.0, 0.6900, 0.920, 0.810, 0.0, 0.0, 0.0, 0.0],
+        [-0.8, 0.6624, 0.874, 0.780, 0.0, -0.0184, 0.0, 0.0],
+        [-0.2, 0.1100, 0.310, 0.220, 0.22, 0.0, 0.0, -18.0],
+        [-0.2, 0.1600, 0.410, 0.280, -0.22, 0.0, 0.0, 18.0],
+        [0.1, 0.2100, 0.250, 0.410, 0.0, 0.35, -0.15, 0.0],
+        [0.1, 0.0460, 0.046, 0.050, 0.0, 0.1, 0.25, 0.0],
+        [0.1, 0.0460, 0.046, 0.050, 0.0, -0.1, 0.25, 0.0],
+        [0.1, 0.0460, 0.023, 0.050, -0.08, -0.605, 0.0, 0.0],
+        [0.1, 0.0230, 0.023, 0.020, 0.0, -0.606, 0.0, 0.0],
+        [0.1, 0.0230, 0.046, 0.020, 0.06, -0.605, 0.0, 0.0],
+    ]
+)
+
+truth_filename = "synthetic_truth.json"
+
+
+def get_scan_shape(scale=None, num_angles=None, num_rows=None, num_cols=None):
+    """
+    Resolves the (num_angles, num_rows, num_cols) of a scan from a preset in
+    `SCALES` and/or explicit sizes. Explicit sizes override the preset.
+    """
+    shape = list(SCALES["small"] if scale is None else SCALES[scale])
+    for i, val in enumerate((num_angles, num_rows, num_cols)):
+        if val is not None:
+            shape[i] = int(val)
+    return tuple(shape)
+
+
+def make_angles(num_angles, angle_start=0, angle_end=180):
+    """
+    Makes evenly spaced angles in degrees, including both endpoints (same as
+    `tomopy.sim.project.angles`).
+    """
+    return np.linspace(angle_start, angle_end, num_angles)
+
+
+def make_misalignment(
+    num_angles,
+    jitter_std=0.0,
+    jitter_std_y=None,
+    center_offset=0.0,
+    tilt_deg=0.0,
+    seed=0,
+):
+    """
+    Creates a ground truth misalignment dictionary.
+
+    Parameters
+    ----------
+    num_angles : int
+        Number of projections.
+    jitter_std : float
+        Standard deviation (px) of the random horizontal shift of each projection.
+    jitter_std_y : float, optional
+        Standard deviation (px) of the random vertical shift of each projection.
+        Defaults to jitter_std.
+    center_offset : float
+        Offset (px) of the rotation axis from the middle of the detector.
+    tilt_deg : float
+        Tilt of the rotation axis in the detector plane (degrees). Positive tilt
+        moves the axis to the right going down the detector.
+    seed : int
+        Seed for the random number generator.
+
+    Returns
+    -------
+    dict
+        Dictionary with keys "sx", "sy", "center_offset" and "tilt_deg". Positive
+        sx (sy) moves the projection content to the right (down).
+    """
+    rng = np.random.default_rng(seed)
+    if jitter_std_y is None:
+        jitter_std_y = jitter_std
+    sx = rng.normal(0, jitter_std, num_angles) if jitter_std else np.zeros(num_angles)
+    sy = (
+        rng.normal(0, jitter_std_y, num_angles)
+        if jitter_std_y
+        else np.zeros(num_angles)
+    )
+    return {
+        "sx": sx,
+        "sy": sy,
+        "center_offset": float(center_offset),
+        "tilt_deg": float(tilt_deg),
+    }
+
+
+def project_phantom(
+    angles_deg,
+    num_rows,
+    num_cols,
+    misalignment=None,
+    absorbance_scale=4.0,
+    ellipsoids=SHEPP_LOGAN_3D,
+    dtype=np.float32,
+):
+    """
+    Analytic parallel-beam projections (line integrals) of an ellipsoid phantom.
+
+    The phantom spans the full detector width. Pixels are square, so the top and
+    bottom of the phantom are cut off on detectors that are wider than they are tall.
+
+    Parameters
+    ----------
+    angles_deg : array-like
+        Projection angles in degrees.
+    num_rows, num_cols : int
+        Detector size.
+    misalignment : dict, optional
+        Output of `make_misalignment`. sx and sy must have len(angles_deg) entries.
+    absorbance_scale : float
+        Absorbance of unit density over the detector half width. The default gives
+        a maximum absorbance of about 1.5 for the Shepp-Logan phantom.
+    ellipsoids : ndarray
+        Phantom definition, see `SHEPP_LOGAN_3D`.
+
+    Returns
+    -------
+    ndarray
+        Absorbance images with shape (len(angles_deg), num_rows, num_cols).
+    """
+    theta = np.deg2rad(np.asarray(angles_deg, dtype=np.float64))
+    num_angles = theta.size
+    half = num_cols / 2
+    if misalignment is None:
+        misalignment = make_misalignment(num_angles)
+    sx = np.asarray(misalignment["sx"], dtype=np.float64)
+    sy = np.asarray(misalignment["sy"], dtype=np.float64)
+    slope = np.tan(np.deg2rad(misalignment["tilt_deg"]))
+    cols = np.arange(num_cols) - (num_cols - 1) / 2
+    rows = np.arange(num_rows) - (num_rows - 1) / 2
+    # normalized detector coordinates of every pixel, with the axis position and
+    # per-projection shifts taken out.
+    axis = misalignment["center_offset"] + slope * rows
+    u = (cols[None, None, :] - axis[None, :, None] - sx[:, None, None]) / half
+    v = (rows[None, :, None] - sy[:, None, None]) / half
+    prj = np.zeros((num_angles, num_rows, num_cols), dtype=np.float64)
+    for rho, a, b, c, x0, y0, z0, phi in ellipsoids:
+        phi = np.deg2rad(phi)
+        alpha2 = (a * np.cos(theta - phi)) ** 2 + (b * np.sin(theta - phi)) ** 2
+        t0 = x0 * np.cos(theta) + y0 * np.sin(theta)
+        s2 = 1 - ((v - z0) / c) ** 2
+        inner = s2 * alpha2[:, None, None] - (u - t0[:, None, None]) ** 2
+        np.maximum(inner, 0, out=inner)
+        prj += (2 * rho * a * b / alpha2)[:, None, None] * np.sqrt(inner)
+    prj *= absorbance_scale
+    return prj.astype(dtype, copy=False)
+
+
+def iter_projections(
+    angles_deg, num_rows, num_cols, misalignment=None, chunk_size=16, **kwargs
+):
+    """
+    Generator version of `project_phantom` that yields (angle slice, absorbance)
+    chunks of at most chunk_size projections, so scans larger than memory can be
+    written.
+    """
+    angles_deg = np.asarray(angles_deg)
+    if misalignment is None:
+        misalignment = make_misalignment(angles_deg.size)
+    for start in range(0, angles_deg.size, chunk_size):
+        slc = slice(start, min(start + chunk_size, angles_deg.size))
+        chunk_misalignment = dict(misalignment)
+        chunk_misalignment["sx"] = np.asarray(misalignment["sx"])[slc]
+        chunk_misalignment["sy"] = np.asarray(misalignment["sy"])[slc]
+        yield slc, project_phantom(
+            angles_deg[slc], num_rows, num_cols, chunk_misalignment, **kwargs
+        )
+
+
+def phantom_slice(num_cols, row=None, num_rows=None, ellipsoids=SHEPP_LOGAN_3D):
+    """
+    Rasterizes one horizontal slice of the phantom in the units of a reconstruction
+    of `project_phantom` data (absorbance per pixel, before absorbance_scale).
+    Useful for checking reconstructions.
+
+    Parameters
+    ----------
+    num_cols : int
+        Width (and height) of the slice.
+    row : int, optional
+        Detector row of the slice. Defaults to the middle row.
+    num_rows : int, optional
+        Number of detector rows. Defaults to num_cols.
+    """
+    if num_rows is None:
+        num_rows = num_cols
+    if row is None:
+        row = num_rows // 2
+    half = num_cols / 2
+    z = (row - (num_rows - 1) / 2) / half
+    coords = (np.arange(num_cols) - (num_cols - 1) / 2) / half
+    x = coords[None, :]
+    y = coords[:, None]
+    img = np.zeros((num_cols, num_cols), dtype=np.float32)
+    for rho, a, b, c, x0, y0, z0, phi in ellipsoids:
+        phi = np.deg2rad(phi)
+        xr = (x - x0) * np.cos(phi) + (y - y0) * np.sin(phi)
+        yr = -(x - x0) * np.sin(phi) + (y - y0) * np.cos(phi)
+        inside = (xr / a) ** 2 + (yr / b) ** 2 + ((z - z0) / c) ** 2 <= 1
+        img[inside] += rho
+    return img / half
+
+
+def absorbance_to_counts(absorbance, flat, dark=0, rng=None, dtype=np.uint16):
+    """
+    Converts absorbance to detector counts (Beer-Lambert), with Poisson noise if
+    rng is given.
+    """
+    counts = flat * np.exp(-absorbance) + dark
+    if rng is not None:
+        counts = rng.poisson(counts)
+    if np.issubdtype(dtype, np.integer):
+        counts = np.clip(counts, 0, np.iinfo(dtype).max)
+    return counts.astype(dtype)
+
+
+def make_flat(num_rows, num_cols, photons=20000):
+    """
+    Flat field with a smooth, slightly off-center beam profile.
+    """
+    rows = np.linspace(-1, 1, num_rows)[:, None]
+    cols = np.linspace(-1, 1, num_cols)[None, :]
+    profile = np.exp(-((cols - 0.1) ** 2) / 4 - (rows**2) / 2)
+    return photons * profile
+
+
+def save_truth(truth_filepath, angles_deg, misalignment, shape, **extra):
+    """
+    Saves the ground truth for a synthetic scan as json.
+    """
+    num_angles, num_rows, num_cols = shape
+    truth = {
+        "shape": [int(x) for x in shape],
+        "angles_deg": [float(x) for x in angles_deg],
+        "sx": [float(x) for x in misalignment["sx"]],
+        "sy": [float(x) for x in misalignment["sy"]],
+        "center_offset": misalignment["center_offset"],
+        "tilt_deg": misalignment["tilt_deg"],
+        # center of rotation in tomopy convention (pixel index) at the middle row
+        "center": (num_cols - 1) / 2 + misalignment["center_offset"],
+    }
+    truth.update(extra)
+    with open(truth_filepath, "w") as f:
+        json.dump(truth, f, indent=4)
+    return truth
+
+
+def load_truth(filepath):
+    """
+    Loads a ground truth json saved by one of the writers in this module. filepath
+    can be the json itself or the directory it was saved in.
+    """
+    filepath = pathlib.Path(filepath)
+    if filepath.is_dir():
+        filepath = filepath / truth_filename
+    with open(filepath) as f:
+        return json.load(f)
+
+
+# -- Prenormalized ------------------------------------------------------------
+
+
+def write_prenormalized(
+    savedir,
+    file_format="tif",
+    scale=None,
+    num_angles=None,
+    num_rows=None,
+    num_cols=None,
+    angle_start=0,
+    angle_end=180,
+    jitter_std=0.0,
+    center_offset=0.0,
+    tilt_deg=0.0,
+    noise=0.0,
+    seed=0,
+    chunk_size=16,
+):
+    """
+    Writes prenormalized (absorbance) projections.
+
+    Parameters
+    ----------
+    savedir : pathlike
+        Folder to write into. Created if it does not exist.
+    file_format : str
+        "tif" (a single tiff stack), "tiff_folder" (one tiff per projection) or
+        "npy".
+    noise : float
+        Standard deviation of additive gaussian noise on the absorbance.
+
+    Other parameters are described in `get_scan_shape` and `make_misalignment`.
+
+    Returns
+    -------
+    dict
+        Ground truth, also saved as synthetic_truth.json in savedir.
+    """
+    savedir = pathlib.Path(savedir)
+    savedir.mkdir(parents=True, exist_ok=True)
+    shape = get_scan_shape(scale, num_angles, num_rows, num_cols)
+    angles_deg = make_angles(shape[0], angle_start, angle_end)
+    misalignment = make_misalignment(
+        shape[0], jitter_std, None, center_offset, tilt_deg, seed
+    )
+    rng = np.random.default_rng(seed + 1)
+    chunks = iter_projections(
+        angles_deg, shape[1], shape[2], misalignment, chunk_size=chunk_size
+    )
+    if file_format == "npy":
+        filepath = savedir / "normalized_projections.npy"
+        out = np.lib.format.open_memmap(
+            filepath, mode="w+", dtype=np.float32, shape=shape
+        )
+        for slc, prj in chunks:
+            if noise:
+                prj += rng.normal(0, noise, prj.shape).astype(np.float32)
+            out[slc] = prj
+        out.flush()
+        del out
+    elif file_format == "tif":
+        filepath = savedir / "projections.tif"
+        with tf.TiffWriter(filepath, bigtiff=np.prod(shape) * 4 > 2**31) as tif:
+            for slc, prj in chunks:
+                if noise:
+                    prj += rng.normal(0, noise, prj.shape).astype(np.float32)
+                for image in prj:
+                    tif.write(image, contiguous=True)
+    elif file_format == "tiff_folder":
+        filepath = savedir
+        for slc, prj in chunks:
+            if noise:
+                prj += rng.normal(0, noise, prj.shape).astype(np.float32)
+            for i, image in zip(range(slc.start, slc.stop), prj):
+                tf.imwrite(savedir / f"projection_{i:05d}.tif", image)
+    else:
+        raise ValueError(f"Unknown prenormalized file format: {file_format}")
+    return save_truth(
+        savedir / truth_filename,
+        angles_deg,
+        misalignment,
+        shape,
+        file_format=file_format,
+        filepath=str(filepath),
+    )
+
+
+# -- ALS 8.3.2 / APS ----------------------------------------------------------
+
+
+def _write_exchange_hdf5(
+    filepath,
+    shape,
+    angles_deg,
+    misalignment,
+    num_flats,
+    num_darks,
+    photons,
+    dark_level,
+    pixel_size_mm,
+    energy_ev,
+    camera_distance_mm,
+    seed,
+    chunk_size,
+):
+    num_angles, num_rows, num_cols = shape
+    rng = np.random.default_rng(seed + 1) if photons else None
+    flat = make_flat(num_rows, num_cols, photons or 20000)
+    filepath = pathlib.Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    with h5py.File(filepath, "w") as f:
+        det = f.create_group("measurement/instrument/detector")
+        det.create_dataset("dimension_y", data=np.asarray(num_rows)[np.newaxis])
+        det.create_dataset("dimension_x", data=np.asarray(num_cols)[np.newaxis])
+        det.create_dataset("pixel_size", data=np.asarray(pixel_size_mm)[np.newaxis])
+        rot = f.create_group("process/acquisition/rotation")
+        rot.create_dataset("num_angles", data=np.asarray(num_angles)[np.newaxis])
+        rot.create_dataset(
+            "range",
+            data=np.asarray(np.abs(angles_deg[-1] - angles_deg[0]))[np.newaxis],
+        )
+        f.create_dataset(
+            "measurement/instrument/camera_motor_stack/setup/camera_distance",
+            data=camera_distance_mm * np.ones(num_angles + num_flats + num_darks),
+        )
+        f.create_dataset(
+            "measurement/instrument/monochromator/energy",
+            data=np.asarray(energy_ev)[np.newaxis],
+        )
+        exch = f.create_group("exchange")
+        data = exch.create_dataset(
+            "data", shape=shape, dtype=np.uint16, chunks=(1, num_rows, num_cols)
+        )
+        for slc, prj in iter_projections(
+            angles_deg, num_rows, num_cols, misalignment, chunk_size=chunk_size
+        ):
+            data[slc] = absorbance_to_counts(prj, flat, dark_level, rng)
+        exch.create_dataset(
+            "data_white",
+            data=absorbance_to_counts(
+                np.zeros((num_flats, num_rows, num_cols)), flat, dark_level, rng
+            ),
+        )
+        exch.create_dataset(
+            "data_dark",
+            data=absorbance_to_counts(
+                np.full((num_darks, num_rows, num_cols), np.inf), flat, dark_level, rng
+            ),
+        )
+        exch.create_dataset("theta", data=angles_deg)
+    return filepath
+
+
+def write_als832(
+    filepath,
+    scale=None,
+    num_angles=None,
+    num_rows=None,
+    num_cols=None,
+    angle_start=0,
+    angle_end=180,
+    jitter_std=0.0,
+    center_offset=0.0,
+    tilt_deg=0.0,
+    num_flats=5,
+    num_darks=5,
+    photons=20000,
+    dark_level=100,
+    energy_ev=10000,
+    seed=0,
+    chunk_size=16,
+):
+    """
+    Writes a raw ALS 8.3.2 hdf5 file (data exchange format, see
+    `RawProjectionsHDF5_ALS832`).
+
+    Parameters
+    ----------
+    filepath : pathlike
+        Path of the .h5 file.
+    num_flats, num_darks : int
+        Number of flat and dark images.
+    photons : int or None
+        Counts in the flat field. Poisson noise is added unless this is None.
+    dark_level : float
+        Dark current counts.
+    energy_ev : float
+        Monochromator energy in eV.
+
+    Other parameters are described in `get_scan_shape` and `make_misalignment`.
+
+    Returns
+    -------
+    dict
+        Ground truth, also saved as synthetic_truth.json next to the file.
+    """
+    shape = get_scan_shape(scale, num_angles, num_rows, num_cols)
+    angles_deg = make_angles(shape[0], angle_start, angle_end)
+    misalignment = make_misalignment(
+        shape[0], jitter_std, None, center_offset, tilt_deg, seed
+    )
+    filepath = _write_exchange_hdf5(
+        filepath,
+        shape,
+        angles_deg,
+        misalignment,
+        num_flats,
+        num_darks,
+        photons,
+        dark_level,
+        pixel_size_mm=0.00065,
+        energy_ev=energy_ev,
+        camera_distance_mm=100,
+        seed=seed,
+        chunk_size=chunk_size,
+    )
+    return save_truth(
+        filepath.parent / truth_filename,
+        angles_deg,
+        misalignment,
+        shape,
+        filepath=str(filepath),
+    )
+
+
+def write_aps(filepath, energy_ev=25000, dark_level=50, **kwargs):
+    """
+    Writes a raw APS hdf5 file. Same layout as `write_als832`, with APS-like
+    defaults.
+    """
+    return write_als832(filepath, energy_ev=energy_ev, dark_level=dark_level, **kwargs)
+
+
+# -- SSRL 6-2b ----------------------------------------------------------------
+
+
+def _write_ssrl62b_folder(folder, prefix, images, angles_deg, exposure_ms, binning):
+    """
+    Writes tiffs and a Micro-Manager style metadata.txt. images yields
+    (index, image) in the orientation tomopyui should end up with after import.
+    """
+    folder.mkdir(parents=True, exist_ok=True)
+    now = datetime.datetime.now()
+    metadata = {
+        "Summary": {
+            "Prefix": prefix,
+            "z-step_um": float(
+                1000 * (angles_deg[1] - angles_deg[0]) if len(angles_deg) > 1 else 0
+            ),
+            "Slices": len(angles_deg),
+            "PixelType": "GRAY16",
+        }
+    }
+    for i, image in images:
+        filename = f"{prefix}_{i:05d}.tif"
+        # the importer rotates images by 90 degrees, so undo that here.
+        image = np.rot90(image, k=-1)
+        tf.imwrite(folder / filename, image)
+        metadata["Metadata-Default/" + filename] = {
+            "ZPositionUm": float(1000 * angles_deg[i]),
+            "Exposure-ms": float(exposure_ms),
+            "ElapsedTime-ms": float(i * exposure_ms),
+            "ReceivedTime": str(now + datetime.timedelta(milliseconds=i * exposure_ms)),
+            "Width": int(image.shape[1]),
+            "Height": int(image.shape[0]),
+            "Binning": int(binning),
+        }
+    with open(folder / "metadata.txt", "w") as f:
+        json.dump(metadata, f, indent=2)
+
+
+def write_ssrl62b(
+    savedir,
+    scale=None,
+    num_angles=None,
+    num_rows=None,
+    num_cols=None,
+    angle_start=0,
+    angle_end=180,
+    jitter_std=0.0,
+    center_offset=0.0,
+    tilt_deg=0.0,
+    num_flats=10,
+    photons=20000,
+    exposure_ms=100,
+    binning=1,
+    seed=0,
+    chunk_size=16,
+):
+    """
+    Writes a raw SSRL 6-2b scan: savedir/projections and savedir/references, each
+    with .tif files and a metadata.txt.
+
+    Parameters are described in `write_als832`.
+
+    Returns
+    -------
+    dict
+        Ground truth, also saved as synthetic_truth.json in savedir.
+    """
+    savedir = pathlib.Path(savedir)
+    shape = get_scan_shape(scale, num_angles, num_rows, num_cols)
+    angles_deg = make_angles(shape[0], angle_start, angle_end)
+    misalignment = make_misalignment(
+        shape[0], jitter_std, None, center_offset, tilt_deg, seed
+    )
+    rng = np.random.default_rng(seed + 1) if photons else None
+    flat = make_flat(shape[1], shape[2], photons or 20000)
+
+    def projection_images():
+        for slc, prj in iter_projections(
+            angles_deg, shape[1], shape[2], misalignment, chunk_size=chunk_size
+        ):
+            counts = absorbance_to_counts(prj, flat, 0, rng)
+            for i, image in zip(range(slc.start, slc.stop), counts):
+                yield i, image
+
+    def reference_images():
+        for i in range(num_flats):
+            yield i, absorbance_to_counts(np.zeros(shape[1:]), flat, 0, rng)
+
+    _write_ssrl62b_folder(
+        savedir / "projections",
+        "projections",
+        projection_images(),
+        angles_deg,
+        exposure_ms,
+        binning,
+    )
+    _write_ssrl62b_folder(
+        savedir / "references",
+        "references",
+        reference_images(),
+        np.full(num_flats, angles_deg[0]),
+        exposure_ms,
+        binning,
+    )
+    return save_truth(savedir / truth_filename, angles_deg, misalignment, shape)
+
+
+# -- SSRL 6-2c ----------------------------------------------------------------
+
+
+def ssrl62c_px_size(energy, binning):
+    """
+    Pixel size in nm (same calibration as
+    `RawProjectionsXRM_SSRL62C.calculate_px_size`).
+    """
+    return (0.002039449 * energy - 0.792164997) * binning
+
+
+def write_xrm(filepath, image, angle_deg=0.0, pixel_size_um=0.02, binning=1):
+    """
+    Writes a single-image Xradia .xrm file that can be read by
+    `tomopyui.backend.util.dxchange.reader.read_xrm`.
+
+    The reader flips images vertically on import (see
+    `RawProjectionsXRM_SSRL62C.load_xrms`) and assumes square images, so image is
+    stored flipped and must be square.
+    """
+    image = np.asarray(image)
+    if image.shape[0] != image.shape[1]:
+        raise ValueError("XRM images must be square.")
+    if image.dtype == np.uint16:
+        data_type = 5
+    elif image.dtype == np.float32:
+        data_type = 10
+    else:
+        raise ValueError("XRM images must be uint16 or float32.")
+    height, width = image.shape
+    streams = {
+        "ImageInfo/NoOfImages": struct.pack("<I", 1),
+        "ImageInfo/ImageWidth": struct.pack("<I", width),
+        "ImageInfo/ImageHeight": struct.pack("<I", height),
+        "ImageInfo/DataType": struct.pack("<I", data_type),
+        "ImageInfo/ExpTimes": struct.pack("<f", 1.0),
+        "ImageInfo/ImagesPerProjection": struct.pack("<I", 1),
+        "ImageInfo/ImagesTaken": struct.pack("<I", 1),
+        "ImageInfo/CameraBinning": struct.pack("<I", binning),
+        "ImageInfo/PixelSize": struct.pack("<f", pixel_size_um),
+        "ImageInfo/Angles": struct.pack("<f", angle_deg),
+        "ImageInfo/XPosition": struct.pack("<f", 0.0),
+        "ImageInfo/YPosition": struct.pack("<f", 0.0),
+        "ImageInfo/ZPosition": struct.pack("<f", 0.0),
+        "AcquisitionSettings/CCDPixelSize": struct.pack("<f", 13.5),
+        "ImageData1/Image1": np.ascontiguousarray(
+            np.flip(image, axis=0), dtype=image.dtype.newbyteorder("<")
+        ).tobytes(),
+    }
+    write_ole_file(filepath, streams)
+
+
+def write_ssrl62c(
+    savedir,
+    scale=None,
+    num_angles=None,
+    num_cols=None,
+    angle_start=-90,
+    angle_end=90,
+    energies=(8333.0,),
+    num_exposures=1,
+    ref_num_exposures=5,
+    ref_every=None,
+    jitter_std=0.0,
+    center_offset=0.0,
+    tilt_deg=0.0,
+    photons=20000,
+    flat_drift=0.02,
+    binning=2,
+    sample_name="synthetic",
+    seed=0,
+    chunk_size=16,
+):
+    """
+    Writes a raw SSRL 6-2c scan: one .xrm per exposure, a ScanInfo file and a run
+    script, laid out like a TXM acquisition.
+
+    Parameters
+    ----------
+    savedir : pathlike
+        Folder to write into. Created if it does not exist.
+    num_cols : int
+        Width and height of the (square) detector.
+    energies : sequence of float
+        Energies in eV. Each energy gets a "sete" line and a full tomography in the
+        run script. Pixel size scales with energy, like on the instrument, but
+        the projections are the same for all energies.
+    num_exposures : int
+        Exposures per angle (averaged on import).
+    ref_num_exposures : int
+        Exposures per reference group.
+    ref_every : int, optional
+        Number of angles between reference groups. There is always a reference
+        group at the start and the end of each tomography. Defaults to taking
+        references half way through.
+    flat_drift : float
+        Fractional change of the beam intensity over each tomography, so that
+        normalizing by the nearest reference group matters.
+    chunk_size : int
+        Number of projections computed at a time (for each energy).
+
+    Other parameters are described in `get_scan_shape` and `make_misalignment`.
+
+    Returns
+    -------
+    dict
+        Ground truth, also saved as synthetic_truth.json in savedir.
+    """
+    savedir = pathlib.Path(savedir)
+    savedir.mkdir(parents=True, exist_ok=True)
+    shape = get_scan_shape(scale, num_angles, num_cols, num_cols)
+    angles_deg = make_angles(shape[0], angle_start, angle_end)
+    misalignment = make_misalignment(
+        shape[0], jitter_std, None, center_offset, tilt_deg, seed
+    )
+    if ref_every is None:
+        ref_every = max(1, int(np.ceil(shape[0] / 2)))
+    rng = np.random.default_rng(seed + 1) if photons else None
+    flat = make_flat(shape[1], shape[2], photons or 20000)
+
+    def projections():
+        for slc, prj in iter_projections(
+            angles_deg, shape[1], shape[2], misalignment, chunk_size=chunk_size
+        ):
+            yield from zip(range(slc.start, slc.stop), prj)
+
+    scan_files = []
+    run_script = [";; TXM run script written by tomopyui.backend.util.synthetic"]
+    for energy in energies:
+        run_script.append(f"sete {energy:.2f}")
+        px_size_um = ssrl62c_px_size(energy, binning) / 1000
+        ref_group = 0
+        num_ref_groups = int(np.ceil(shape[0] / ref_every)) + 1
+
+        def drift(group):
+            return 1 + flat_drift * group / max(num_ref_groups - 1, 1)
+
+        def collect(filename, image, angle):
+            write_xrm(savedir / filename, image, angle, px_size_um, binning)
+            scan_files.append(filename)
+            run_script.append(f"collect {filename}")
+
+        def collect_refs(group):
+            for n in range(ref_num_exposures):
+                filename = (
+                    f"ref_{sample_name}_{energy:08.2f}_eV_"
+                    f"{group:03d}_{n + 1:03d}of{ref_num_exposures:03d}.xrm"
+                )
+                image = absorbance_to_counts(
+                    np.zeros(shape[1:]), drift(group) * flat, 0, rng
+                )
+                collect(filename, image, 0.0)
+
+        for i, absorbance in projections():
+            angle = angles_deg[i]
+            if i % ref_every == 0:
+                collect_refs(ref_group)
+                ref_group += 1
+            # beam intensity when this angle was taken
+            intensity = drift(ref_group - 1 + (i % ref_every) / ref_every)
+            for n in range(num_exposures):
+                filename = (
+                    f"{sample_name}_{energy:08.2f}_eV_{angle:+07.2f}_"
+                    f"{n + 1:03d}of{num_exposures:03d}.xrm"
+                )
+                image = absorbance_to_counts(absorbance, intensity * flat, 0, rng)
+                collect(filename, image, angle)
+        collect_refs(ref_group)
+
+    scan_info = {
+        "VERSION": 1,
+        "ENERGY": 2 if len(energies) > 1 else 0,
+        "TOMO": 1,
+        "MOSAIC": 0,
+        "MULTIEXPOSURE": 3 if num_exposures > 1 else 0,
+        "NREPEATSCAN": 1,
+        "WAITNSECS": 0,
+        "NEXPOSURES": num_exposures,
+        "AVERAGEONTHEFLY": 0,
+        "IMAGESPERPROJECTION": 1,
+        "REFNEXPOSURES": ref_num_exposures,
+        # the importer drops the first digit of this line
+        "REF4EVERYEXPOSURES": ref_every,
+        "REFABBA": 0,
+        "REFAVERAGEONTHEFLY": 0,
+        "MOSAICUP": 1,
+        "MOSAICDOWN": 1,
+        "MOSAICLEFT": 1,
+        "MOSAICRIGHT": 1,
+        "MOSAICOVERLAP": 0,
+        "MOSAICCENTRALTILE": 1,
+    }
+    with open(savedir / f"{sample_name}_ScanInfo.txt", "w") as f:
+        for key, val in scan_info.items():
+            f.write(f"{key} {val}\n")
+        f.write("FILES\n")
+        for filename in scan_files:
+            f.write(filename + "\n")
+    with open(savedir / f"{sample_name}_run_script.txt", "w") as f:
+        f.write("\n".join(run_script) + "\n")
+    return save_truth(
+        savedir / truth_filename,
+        angles_deg,
+        misalignment,
+        shape,
+        energies=[float(x) for x in energies],
+        num_exposures=num_exposures,
+    )
+
+
+def _writer_kwargs(kwargs, *writers):
+    """
+    The items of kwargs that are parameters of one of writers.
+    """
+    names = set()
+    for writer in writers:
+        names.update(inspect.signature(writer).parameters)
+    return {key: val for key, val in kwargs.items() if key in names}
+
+
+def write_all(savedir, scale="tiny", **kwargs):
+    """
+    Writes one scan of each supported format into subfolders of savedir. Each
+    writer gets the keyword arguments it accepts (for example, energies only goes
+    to `write_ssrl62c`).
+
+    Returns
+    -------
+    dict
+        Ground truth of each scan, keyed by format name.
+    """
+    savedir = pathlib.Path(savedir)
+    ssrl62c_kwargs = _writer_kwargs(kwargs, write_ssrl62c)
+    ssrl62b_kwargs = _writer_kwargs(kwargs, write_ssrl62b)
+    als832_kwargs = _writer_kwargs(kwargs, write_als832)
+    aps_kwargs = _writer_kwargs(kwargs, write_aps, write_als832)
+    prenormalized_kwargs = _writer_kwargs(kwargs, write_prenormalized)
+    return {
+        "SSRL62C": write_ssrl62c(savedir / "SSRL62C", scale=scale, **ssrl62c_kwargs),
+        "SSRL62B": write_ssrl62b(savedir / "SSRL62B", scale=scale, **ssrl62b_kwargs),
+        "ALS832": write_als832(
+            savedir / "ALS832" / "als832.h5", scale=scale, **als832_kwargs
+        ),
+        "APS": write_aps(savedir / "APS" / "aps.h5", scale=scale, **aps_kwargs),
+        "prenormalized_tif": write_prenormalized(
+            savedir / "prenormalized_tif", "tif", scale=scale, **prenormalized_kwargs
+        ),
+        "prenormalized_npy": write_prenormalized(
+            savedir / "prenormalized_npy", "npy", scale=scale, **prenormalized_kwargs
+        ),
+    }
+
+
+# -- Minimal OLE2 (compound file) writer --------------------------------------
+
+_ENDOFCHAIN = 0xFFFFFFFE
+_FREESECT = 0xFFFFFFFF
+_FATSECT = 0xFFFFFFFD
+_DIFSECT = 0xFFFFFFFC
+_NOSTREAM = 0xFFFFFFFF
+_SECTOR = 512
+_MINI_SECTOR = 64
+_MINI_CUTOFF = 4096
+
+
+def write_ole_file(filepath, streams):
+    """
+    Writes an OLE2 compound file (version 3) containing streams.
+
+    Parameters
+    ----------
+    filepath : pathlike
+        File to write.
+    streams : dict
+        {"Storage/SubStorage/Stream": bytes}. Storages are created as needed.
+    """
+    # Build the directory tree. Entry 0 is the root storage.
+    entries = [{"name": "Root Entry", "type": 5, "children": [], "data": None}]
+    index = {(): 0}
+    for path, data in streams.items():
+        parts = tuple(path.split("/"))
+        for depth in range(1, len(parts) + 1):
+            key = parts[:depth]
+            if key in index:
+                continue
+            is_stream = depth == len(parts)
+            entries.append(
+                {
+                    "name": key[-1],
+                    "type": 2 if is_stream else 1,
+                    "children": [],
+                    "data": bytes(data) if is_stream else None,
+                }
+            )
+            index[key] = len(entries) - 1
+            entries[index[key[:-1]]]["children"].append(index[key])
+
+    # Lay out stream data in the mini stream or in regular sectors.
+    mini_stream = bytearray()
+    minifat = []
+    big_streams = []
+    for entry in entries:
+        data = entry["data"]
+        if data is None:
+            continue
+        if len(data) < _MINI_CUTOFF:
+            num = -(-len(data) // _MINI_SECTOR)
+            entry["start"] = len(minifat)
+            minifat.extend(range(len(minifat) + 1, len(minifat) + num))
+            minifat.append(_ENDOFCHAIN)
+            mini_stream += data.ljust(num * _MINI_SECTOR, b"\0")
+        else:
+            big_streams.append(entry)
+
+    sectors = []  # list of (bytes padded to a sector multiple, number of sectors)
+    chains = []  # (first sector, number of sectors)
+
+    def add_sectors(data):
+        num = -(-len(data) // _SECTOR)
+        start = sum(n for _, n in sectors)
+        sectors.append((bytes(data).ljust(num * _SECTOR, b"\0"), num))
+        chains.append((start, num))
+        return start if num else _ENDOFCHAIN
+
+    for entry in big_streams:
+        entry["start"] = add_sectors(entry["data"])
+    root_start = add_sectors(mini_stream)
+    minifat_bytes = struct.pack(f"<{len(minifat)}I", *minifat)
+    num_minifat_sectors = -(-len(minifat_bytes) // _SECTOR)
+    minifat_bytes = minifat_bytes.ljust(num_minifat_sectors * _SECTOR, b"\xff")
+    minifat_start = add_sectors(minifat_bytes)
+
+    # Directory entries, each storage's children chained through right siblings.
+    for entry in entries:
+        children = sorted(
+            entry["children"],
+            key=lambda i: (len(entries[i]["name"]), entries[i]["name"].upper()),
+        )
+        entry["child"] = children[0] if children else _NOSTREAM
+        for a, b in zip(children, children[1:]):
+            entries[a]["right"] = b
+    directory = bytearray()
+    for i, entry in enumerate(entries):
+        name = entry["name"].encode("utf-16-le")
+        if i == 0:
+            start, size = root_start, len(mini_stream)
+        elif entry["type"] == 2:
+            start, size = entry["start"], len(entry["data"])
+        else:
+            start, size = 0, 0
+        directory += struct.pack(
+            "<64sHBBIII16sIQQIQ",
+            name,
+            len(name) + 2,
+            entry["type"],
+            1,  # black
+            _NOSTREAM,
+            entry.get("right", _NOSTREAM),
+            entry["child"],
+            b"\0" * 16,
+            0,
+            0,
+            0,
+            start,
+            size,
+        )
+    empty_entry = struct.pack(
+        "<64sHBBIII16sIQQIQ",
+        b"",
+        0,
+        0,
+        0,
+        _NOSTREAM,
+        _NOSTREAM,
+        _NOSTREAM,
+        b"\0" * 16,
+        0,
+        0,
+        0,
+        0,
+        0,
+    )
+    while len(directory) % _SECTOR:
+        directory += empty_entry
+    directory_start = add_sectors(directory)
+
+    # FAT and DIFAT sectors also have to be described by the FAT.
+    num_data = sum(n for _, n in sectors)
+    num_fat, num_difat = 1, 0
+    while True:
+        num_difat = max(0, -(-(num_fat - 109) // 127))
+        if num_fat * (_SECTOR // 4) >= num_data + num_fat + num_difat:
+            break
+        num_fat += 1
+    fat = [_FREESECT] * (num_fat * (_SECTOR // 4))
+    for start, num in chains:
+        for s in range(start, start + num - 1):
+            fat[s] = s + 1
+        if num:
+            fat[start + num - 1] = _ENDOFCHAIN
+    fat_ids = list(range(num_data, num_data + num_fat))
+    difat_ids = list(range(num_data + num_fat, num_data + num_fat + num_difat))
+    for s in fat_ids:
+        fat[s] = _FATSECT
+    for s in difat_ids:
+        fat[s] = _DIFSECT
+    difat = bytearray()
+    remaining = fat_ids[109:]
+    for n, s in enumerate(difat_ids):
+        ids = remaining[n * 127 : (n + 1) * 127]
+        ids = ids + [_FREESECT] * (127 - len(ids))
+        nxt = difat_ids[n + 1] if n + 1 < len(difat_ids) else _ENDOFCHAIN
+        difat += struct.pack("<128I", *ids, nxt)
+
+    header_difat = fat_ids[:109] + [_FREESECT] * (109 - len(fat_ids[:109]))
+    header = struct.pack(
+        "<8s16sHHHHH6sIIIIIIIII109I",
+        b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1",
+        b"\0" * 16,
+        0x003E,
+        0x0003,
+        0xFFFE,
+        9,
+        6,
+        b"\0" * 6,
+        0,
+        num_fat,
+        directory_start,
+        0,
+        _MINI_CUTOFF,
+        minifat_start if minifat else _ENDOFCHAIN,
+        num_minifat_sectors,
+        difat_ids[0] if difat_ids else _ENDOFCHAIN,
+        num_difat,
+        *header_difat,
+    )
+    with open(filepath, "wb") as f:
+        f.write(header)
+        for data, _ in sectors:
+            f.write(data)
+        f.write(struct.pack(f"<{len(fat)}I", *fat))
+        f.write(bytes(difat))
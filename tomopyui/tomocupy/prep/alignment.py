@@ -1,6 +1,5 @@
 import astra
 import os
-import bqplot as bq
 import cupy as cp
 import numpy as np
 import matplotlib.pyplot as plt
@@ -14,9 +13,13 @@ from tomopyui.backend.util.registration._phase_cross_correlation_cupy import (
 )
 from tomopy.prep.alignment import scale as scale_tomo
 from tomopy.recon import algorithm as tomopy_algorithm
-from bqplot_image_gl import ImageGL
 from ipywidgets import *
 from tomopyui.backend.util.padding import *
+from tomopyui.backend.util.profiling import StageProfiler
+from tomopyui.widgets.view import AlignmentPlots
+from tomopyui.backend.util.checkpoint import resume_iteration
+from tomopyui.backend.util.convergence import EarlyStopping, recon_iterations
+from tomopyui.backend.util.shifting import initial_shifts
 
 
 def align_joint(RunAlign):
@@ -27,7 +30,6 @@ def align_joint(RunAlign):
     # Initialize variables from metadata for ease of reading:
     init_tomo_shape = RunAlign.prjs.shape
     num_iter = RunAlign.num_iter
-    downsample = RunAlign.downsample
     pad = RunAlign.pad
     pad_ds = RunAlign.pad_ds
     method_str = list(RunAlign.metadata.metadata["methods"].keys())[0]
@@ -37,7 +39,10 @@ def align_joint(RunAlign):
     num_batches = RunAlign.num_batches
     center = RunAlign.center
     pre_alignment_iters = RunAlign.pre_alignment_iters
+    stopping = EarlyStopping.from_run(RunAlign)
+    checkpoint = getattr(RunAlign, "checkpoint", None)
     projection_num = 50  # default to 50 now, TODO: can make an option
+    profiler = getattr(RunAlign, "profiler", StageProfiler(enabled=False))
 
     # Needs scaling for skimage float operations
     RunAlign.prjs, scl = scale_tomo(RunAlign.prjs)
@@ -49,191 +54,79 @@ def align_joint(RunAlign):
     )
 
     # Initialize shift/convergence
-    RunAlign.sx = np.zeros((tomo_shape[0]))
-    RunAlign.sy = np.zeros((tomo_shape[0]))
+    RunAlign.sx, RunAlign.sy = initial_shifts(RunAlign)
     RunAlign.conv = np.zeros((num_iter))
+    start = resume_iteration(RunAlign, scl)
     subset_x = RunAlign.subset_x
     subset_y = RunAlign.subset_y
     subset_x = [int(x) + pad_ds[0] for x in subset_x]
     subset_y = [int(y) + pad_ds[1] for y in subset_y]
-    # Initialize projection images plot
-    scale_x = bq.LinearScale(min=0, max=1)
-    scale_y = bq.LinearScale(min=1, max=0)
-    scales = {"x": scale_x, "y": scale_y}
-
-    projection_fig = bq.Figure(scales=scales)
-    simulated_fig = bq.Figure(scales=scales)
-
-    scales_image = {
-        "x": scale_x,
-        "y": scale_y,
-        "image": bq.ColorScale(
-            min=float(np.min(RunAlign.prjs[projection_num])),
-            max=float(np.max(RunAlign.prjs[projection_num])),
-            scheme="viridis",
-        ),
-    }
-
-    image_projection = ImageGL(
-        image=RunAlign.prjs[projection_num],
-        scales=scales_image,
-    )
-    image_simulated = ImageGL(
-        image=np.zeros_like(RunAlign.prjs[projection_num]),
-        scales=scales_image,
-    )
-
-    projection_fig.marks = (image_projection,)
-    projection_fig.layout.width = "600px"
-    projection_fig.layout.height = "600px"
-    projection_fig.title = f"Projection Number {50}"
-    simulated_fig.marks = (image_simulated,)
-    simulated_fig.layout.width = "600px"
-    simulated_fig.layout.height = "600px"
-    simulated_fig.title = f"Re-projected Image {50}"
-    with RunAlign.plot_output1:
-        RunAlign.plot_output1.clear_output(wait=True)
-        display(
-            HBox(
-                [projection_fig, simulated_fig],
-                layout=Layout(
-                    flex_flow="row wrap",
-                    justify_content="center",
-                    align_items="stretch",
-                ),
-            )
-        )
-
-    # Initialize Sx, Sy plot
-    xs = bq.LinearScale()
-    ys = bq.LinearScale()
-    x = range(RunAlign.prjs.shape[0])
-    y = [RunAlign.sx, RunAlign.sy]
-    line = bq.Lines(
-        x=x,
-        y=y,
-        scales={"x": xs, "y": ys},
-        colors=["dodgerblue", "red"],
-        stroke_width=3,
-        labels=["Shift in X (px)", "Shift in Y (px)"],
-        display_legend=True,
-    )
-    xax = bq.Axis(scale=xs, label="Projection Number", grid_lines="none")
-    yax = bq.Axis(
-        scale=ys,
-        orientation="vertical",
-        tick_format="0.1f",
-        label="Shift",
-        grid_lines="none",
-    )
-    fig_SxSy = bq.Figure(marks=[line], axes=[xax, yax], animation_duration=1000)
-    fig_SxSy.layout.width = "600px"
-    # Initialize convergence plot
-    xs_conv = bq.LinearScale(min=0)
-    ys_conv = bq.LinearScale()
-    x_conv = [0]
-    y_conv = [RunAlign.conv[0]]
-    line_conv = bq.Lines(
-        x=x_conv,
-        y=y_conv,
-        scales={"x": xs_conv, "y": ys_conv},
-        colors=["dodgerblue"],
-        stroke_width=3,
-        labels=["Convergence"],
-        display_legend=True,
-    )
-    xax_conv = bq.Axis(scale=xs_conv, label="Iteration", grid_lines="none")
-    yax_conv = bq.Axis(
-        scale=ys_conv,
-        orientation="vertical",
-        tick_format="0.1f",
-        label="Convergence",
-        grid_lines="none",
-    )
-    fig_conv = bq.Figure(
-        marks=[line_conv], axes=[xax_conv, yax_conv], animation_duration=1000
-    )
-    fig_conv.layout.width = "600px"
-    with RunAlign.plot_output2:
-        RunAlign.plot_output2.clear_output()
-        display(
-            HBox(
-                [fig_SxSy, fig_conv],
-                layout=Layout(
-                    flex_flow="row wrap",
-                    justify_content="center",
-                    align_items="stretch",
-                    width="95%",
-                ),
-            )
-        )
+    plots = AlignmentPlots(RunAlign, projection_num)
 
     # Start alignment
-    for n in range(num_iter):
-        if n == 0:
-            recon_iterations = pre_alignment_iters
-        else:
-            recon_iterations = 1
+    for n in range(start, num_iter):
+        recon_iters = recon_iterations(n, pre_alignment_iters, RunAlign.recon_iters)
 
         # for progress bars
         RunAlign.Align.progress_shifting.value = 0
         RunAlign.Align.progress_reprj.value = 0
         RunAlign.Align.progress_phase_cross_corr.value = 0
-        _rec = RunAlign.recon
-        # TODO: handle reconstruction-type parsing elsewhere
-        if method_str == "SIRT_Plugin":
-            RunAlign.recon = tomocupy_algorithm.recon_sirt_plugin(
-                RunAlign.prjs,
-                RunAlign.angles_rad,
-                num_iter=recon_iterations,
-                rec=_rec,
-                center=center,
-            )
-        elif method_str == "SIRT_3D":
-            RunAlign.recon = tomocupy_algorithm.recon_sirt_3D(
-                RunAlign.prjs,
-                RunAlign.angles_rad,
-                num_iter=recon_iterations,
-                rec=_rec,
-                center=center,
-            )
-        elif method_str == "CGLS_3D":
-            RunAlign.recon = tomocupy_algorithm.recon_cgls_3D_allgpu(
-                RunAlign.prjs,
-                RunAlign.angles_rad,
-                num_iter=recon_iterations,
-                rec=_rec,
-                center=center,
-            )
-        else:
-            # Options go into kwargs which go into recon()
-            kwargs = {}
-            options = {
-                "proj_type": "cuda",
-                "method": method_str,
-                "num_iter": recon_iterations,
-                "extra_options": {"MinConstraint": 0},
-            }
-            kwargs["options"] = options
-            if n == 0:
-                RunAlign.recon = tomopy_algorithm.recon(
+        with profiler.stage("reconstruct"):
+            _rec = RunAlign.recon
+            # TODO: handle reconstruction-type parsing elsewhere
+            if method_str == "SIRT_Plugin":
+                RunAlign.recon = tomocupy_algorithm.recon_sirt_plugin(
                     RunAlign.prjs,
                     RunAlign.angles_rad,
-                    algorithm=wrappers.astra,
+                    num_iter=recon_iters,
+                    rec=_rec,
                     center=center,
-                    ncore=1,
-                    **kwargs,
                 )
-            else:
-                RunAlign.recon = tomopy_algorithm.recon(
+            elif method_str == "SIRT_3D":
+                RunAlign.recon = tomocupy_algorithm.recon_sirt_3D(
                     RunAlign.prjs,
                     RunAlign.angles_rad,
-                    algorithm=wrappers.astra,
-                    init_recon=_rec,
+                    num_iter=recon_iters,
+                    rec=_rec,
                     center=center,
-                    ncore=1,
-                    **kwargs,
                 )
+            elif method_str == "CGLS_3D":
+                RunAlign.recon = tomocupy_algorithm.recon_cgls_3D_allgpu(
+                    RunAlign.prjs,
+                    RunAlign.angles_rad,
+                    num_iter=recon_iters,
+                    rec=_rec,
+                    center=center,
+                )
+            else:
+                # Options go into kwargs which go into recon()
+                kwargs = {}
+                options = {
+                    "proj_type": "cuda",
+                    "method": method_str,
+                    "num_iter": recon_iters,
+                    "extra_options": {"MinConstraint": 0},
+                }
+                kwargs["options"] = options
+                if n == 0:
+                    RunAlign.recon = tomopy_algorithm.recon(
+                        RunAlign.prjs,
+                        RunAlign.angles_rad,
+                        algorithm=wrappers.astra,
+                        center=center,
+                        ncore=1,
+                        **kwargs,
+                    )
+                else:
+                    RunAlign.recon = tomopy_algorithm.recon(
+                        RunAlign.prjs,
+                        RunAlign.angles_rad,
+                        algorithm=wrappers.astra,
+                        init_recon=_rec,
+                        center=center,
+                        ncore=1,
+                        **kwargs,
+                    )
 
         RunAlign.recon[np.isnan(RunAlign.recon)] = 0
         RunAlign.Align.progress_total.value = n + 1
@@ -242,21 +135,22 @@ def align_joint(RunAlign):
         # may not need a copy.
         _rec = RunAlign.recon.copy()
 
-        # initialize simulated projection cpu array
-        sim = []
+        with profiler.stage("reproject"):
+            # initialize simulated projection cpu array
+            sim = []
 
-        # begin simulating projections using astra.
-        # this could probably be made more efficient, right now I am not
-        # certain if I need to be deleting every time.
+            # begin simulating projections using astra.
+            # this could probably be made more efficient, right now I am not
+            # certain if I need to be deleting every time.
 
-        simulate_projections(
-            _rec,
-            sim,
-            center,
-            RunAlign.angles_rad,
-            progress=RunAlign.Align.progress_reprj,
-        )
-        sim = np.concatenate(sim, axis=1)
+            simulate_projections(
+                _rec,
+                sim,
+                center,
+                RunAlign.angles_rad,
+                progress=RunAlign.Align.progress_reprj,
+            )
+            sim = np.concatenate(sim, axis=1)
         # only flip the simulated datasets if using normal tomopy algorithm
         # can remove if it is flipped in the algorithm
         if (
@@ -268,60 +162,59 @@ def align_joint(RunAlign):
         else:
             sim = np.flip(sim, axis=0)
         # Cross correlation
-        shift_cpu = []
-        batch_cross_correlation(
-            RunAlign.prjs,
-            sim,
-            shift_cpu,
-            num_batches,
-            upsample_factor,
-            subset_correlation=RunAlign.use_subset_correlation,
-            subset_x=subset_x,
-            subset_y=subset_y,
-            blur=True,
-            pad=RunAlign.pad_ds,
-            progress=RunAlign.Align.progress_phase_cross_corr,
-        )
-        RunAlign.shift = np.concatenate(shift_cpu, axis=1)
+        with profiler.stage("cross_correlation"):
+            shift_cpu = []
+            batch_cross_correlation(
+                RunAlign.prjs,
+                sim,
+                shift_cpu,
+                num_batches,
+                upsample_factor,
+                subset_correlation=RunAlign.use_subset_correlation,
+                subset_x=subset_x,
+                subset_y=subset_y,
+                blur=True,
+                pad=RunAlign.pad_ds,
+                progress=RunAlign.Align.progress_phase_cross_corr,
+            )
+            RunAlign.shift = np.concatenate(shift_cpu, axis=1)
         # Shifting.
-        (
-            RunAlign.prjs,
-            RunAlign.sx,
-            RunAlign.sy,
-            RunAlign.shift,
-            err,
-            RunAlign.pad_ds,
-            center,
-        ) = shift_prj_update_shift_cp(
-            RunAlign.prjs,
-            RunAlign.sx,
-            RunAlign.sy,
-            RunAlign.shift,
-            num_batches,
-            RunAlign.pad_ds,
-            center,
-            downsample_factor=RunAlign.ds_factor,
-            progress=RunAlign.Align.progress_shifting,
-        )
+        with profiler.stage("shift"):
+            (
+                RunAlign.prjs,
+                RunAlign.sx,
+                RunAlign.sy,
+                RunAlign.shift,
+                err,
+                RunAlign.pad_ds,
+                center,
+            ) = shift_prj_update_shift_cp(
+                RunAlign.prjs,
+                RunAlign.sx,
+                RunAlign.sy,
+                RunAlign.shift,
+                num_batches,
+                RunAlign.pad_ds,
+                center,
+                downsample_factor=RunAlign.ds_factor,
+                progress=RunAlign.Align.progress_shifting,
+            )
         RunAlign.conv[n] = np.linalg.norm(err)
-        # update images
-        image_projection.image = RunAlign.prjs[projection_num]
-        image_simulated.image = sim[projection_num]
-        # update plot lines
-        line_conv.x = np.arange(0, n + 1)
-        line_conv.y = RunAlign.conv[range(n + 1)]
-        line.y = [RunAlign.sx, RunAlign.sy]
+        plots.update(n, RunAlign.prjs, sim, RunAlign.sx, RunAlign.sy, RunAlign.conv)
         RunAlign.recon = np.concatenate(RunAlign.recon, axis=0)
         mempool = cp.get_default_memory_pool()
         mempool.free_all_blocks()
+        if checkpoint is not None and checkpoint.due(n):
+            with profiler.stage("checkpoint"):
+                checkpoint.save(RunAlign, n, center, scl)
+        if stopping.update(RunAlign.conv[: n + 1], err):
+            RunAlign.conv = RunAlign.conv[: n + 1]
+            break
+    RunAlign.stop_reason = stopping.reason
 
     # Re-normalize data
     RunAlign.prjs *= scl
     RunAlign.recon = circ_mask(RunAlign.recon, 0)
-    if downsample:
-        RunAlign.sx /= RunAlign.ds_factor
-        RunAlign.sy /= RunAlign.ds_factor
-        RunAlign.shift /= RunAlign.ds_factor
 
     RunAlign.pad = tuple([int(x / RunAlign.ds_factor) for x in RunAlign.pad_ds])
     return RunAlign
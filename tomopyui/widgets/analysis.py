@@ -11,6 +11,14 @@ from tomopyui.widgets.view import (
     BqImViewer_Projections_Child,
 )
 from tomopyui.backend.runanalysis import RunAlign, RunRecon
+from tomopyui.backend.util.memory import plan_memory
+from tomopyui.backend.util.projectors import forward_projectors
+from tomopyui.backend.util.alignment import (
+    default_alignment_schedule,
+    format_alignment_schedule,
+    parse_alignment_schedule,
+    pipeline_fallback_reason,
+)
 from tomopyui.backend.io import (
     Projections_Child,
     Metadata_Align,
@@ -50,6 +58,8 @@ class AnalysisBase(ABC):
         self.padding_y = 10
         self.use_subset_correlation = False
         self.pre_alignment_iters = 1
+        self.memory_plan = None
+        self.auto_memory = False
         self.tomopy_methods_list = [key for key in tomopy_recon_algorithm_kwargs]
         self.tomopy_methods_list.remove("gridrec")
         self.tomopy_methods_list.remove("fbp")
@@ -230,6 +240,19 @@ class AnalysisBase(ABC):
             style=extend_description_style,
         )
 
+        # Memory planning
+        self.auto_memory_checkbox = Checkbox(
+            description="Auto memory settings",
+            value=self.auto_memory,
+            tooltip="Set batches and downsampling to fit in memory before running.",
+        )
+        self.apply_memory_plan_button = Button(
+            description="Apply recommended memory settings",
+            disabled=True,
+            layout=Layout(width="auto"),
+        )
+        self.memory_label = HTML()
+
     def refresh_plots(self):
         self.imported_viewer.plot(self.projections)
         self.altered_projections = Projections_Child(self.projections)
@@ -279,9 +302,31 @@ class AnalysisBase(ABC):
         # Extra options
         self.extra_options_textbox.observe(self.update_extra_options, names="value")
 
+        # Memory planning
+        self.auto_memory_checkbox.observe(self._auto_memory_turn_on, names="value")
+        self.apply_memory_plan_button.on_click(self.apply_memory_plan)
+
         # Start button
         self.start_button.on_click(self.set_options_and_run)
 
+    def set_memory_plan_observes(self):
+        """
+        Updates the memory plan when an option it depends on changes. Called at the
+        end of the subclass set_observes, so that the options are updated first.
+        """
+        for widget in [
+            self.downsample_checkbox,
+            self.ds_factor_dropdown,
+            self.num_batches_textbox,
+            self.padding_x_textbox,
+            self.padding_y_textbox,
+        ]:
+            widget.observe(self.update_memory_plan, names="value")
+        for checkbox in self.tomopy_methods_checkboxes:
+            checkbox.observe(self.update_memory_plan, names="value")
+        for checkbox in self.astra_cuda_methods_checkboxes:
+            checkbox.observe(self.update_memory_plan, names="value")
+
     # -- Radio to turn on tab ---------------------------------------------
     def activate_tab(self, *args):
         if self.accordions_open is False:
@@ -290,6 +335,7 @@ class AnalysisBase(ABC):
             self.projections = self.Import.projections
             self.center = self.Center.current_center
             self.center_textbox.value = self.Center.current_center
+            self.update_memory_plan()
             self.metadata.set_metadata(self)
             self.load_metadata_button.disabled = False
             self.start_button.disabled = False
@@ -372,6 +418,15 @@ class AnalysisBase(ABC):
         change.description = (
             "Setting options and loading data into alignment algorithm."
         )
+        self.update_memory_plan()
+        if self.memory_plan is not None and not self.memory_plan.fits:
+            if self.auto_memory:
+                self.apply_memory_plan()
+            else:
+                self.log.warning(
+                    "Settings may not fit in memory: "
+                    + " ".join(self.memory_plan.messages)
+                )
         self.run()
         change.button_style = "success"
         change.icon = "fa-check-square"
@@ -452,6 +507,64 @@ class AnalysisBase(ABC):
         self.extra_options = change.new
         self.metadata.set_metadata(self)
 
+    # Memory planning
+    def _auto_memory_turn_on(self, change):
+        self.auto_memory = change.new
+        self.metadata.set_metadata(self)
+
+    def update_memory_plan(self, *args):
+        """
+        Estimates the memory needed with the current options, for the region of the
+        projections that will be used in the run, and shows a warning with the
+        recommended settings if they do not fit.
+        """
+        shape = (
+            self.projections.pxZ,
+            self.px_range_y[1] - self.px_range_y[0] + 1,
+            self.px_range_x[1] - self.px_range_x[0] + 1,
+        )
+        methods = [
+            key.replace(" ", "_") for key, value in self.methods_opts.items() if value
+        ]
+        self.memory_plan = plan_memory(
+            shape,
+            pad=(self.padding_x, self.padding_y),
+            pyramid_level=self.pyramid_level if self.downsample else -1,
+            num_batches=self.num_batches,
+            methods=methods,
+            analysis="align" if isinstance(self, Align) else "recon",
+        )
+        summary = self.memory_plan.summary()
+        if self.memory_plan.fits:
+            self.memory_label.value = summary
+            self.apply_memory_plan_button.disabled = True
+        else:
+            self.memory_label.value = (
+                f"<span style='color:red'>{summary}. "
+                + " ".join(self.memory_plan.messages)
+                + "</span>"
+            )
+            self.apply_memory_plan_button.disabled = False
+
+    def apply_memory_plan(self, *args):
+        """
+        Sets the number of batches and downsampling recommended by the memory plan.
+        """
+        plan = self.memory_plan
+        if plan.pyramid_level != -1:
+            self.downsample_checkbox.value = True
+            self.ds_factor_dropdown.value = plan.pyramid_level
+        self.num_batches_textbox.value = plan.num_batches
+        if plan.stream:
+            self.log.warning(
+                "Data does not fit in memory at any downsampling level. Crop the "
+                + "projections before running."
+            )
+        self.log.info(
+            f"Using {plan.num_batches} batches and downsample factor "
+            + f"{np.power(2, int(plan.pyramid_level + 1))} to fit in memory."
+        )
+
     # def set_widgets_from_load_metadata(self):
 
     #     # -- Saving Options -------------------------------------------------------
@@ -578,7 +691,33 @@ class Align(AnalysisBase):
         self.metadata = Metadata_Align()
         self.subset_range_x = None
         self.subset_range_y = None
-        self.save_opts_list = ["tomo_after", "tomo_before", "recon", "tiff", "hdf"]
+        self.projector = "tomopy"
+        self.multi_resolution = False
+        self.alignment_schedule = copy.deepcopy(default_alignment_schedule)
+        self.conv_threshold = 0
+        self.conv_rtol = 0
+        self.shift_tol = 0
+        self.patience = 1
+        self.recon_iters = [1]
+        self.checkpoint_iters = 10
+        self.checkpoint_minutes = 30
+        self.resume_dir = None
+        self.pipeline_batches = False
+        self.slab_alignment = False
+        self.vertical_alignment = "band"
+        self.fast_alignment = "off"
+        self.angle_stride = 1
+        self.out_of_core = False
+        self.num_subsets = 1
+        self.subset_order = "bit_reversal"
+        self.save_opts_list = [
+            "tomo_after",
+            "tomo_before",
+            "recon",
+            "tiff",
+            "hdf",
+            "dask_trace",
+        ]
         self.Import.Align = self
         self.init_widgets()
         self.set_observes()
@@ -613,19 +752,278 @@ class Align(AnalysisBase):
             style=extend_description_style,
             value=self.upsample_factor,
         )
+        # -- Forward projector (CPU alignment) --------------------------------
+        self.projector_dropdown = Dropdown(
+            description="CPU Projector: ",
+            options=list(forward_projectors),
+            value=self.projector,
+            style=extend_description_style,
+        )
+        # -- Coarse-to-fine schedule ------------------------------------------
+        self.multi_resolution_checkbox = Checkbox(
+            description="Coarse-to-fine?",
+            value=self.multi_resolution,
+            tooltip="Align at each pyramid level of the schedule, coarse to fine.",
+        )
+        self.alignment_schedule_textbox = Text(
+            description="Schedule (level:iters:threshold): ",
+            value=format_alignment_schedule(self.alignment_schedule),
+            placeholder="2:20:1.5, 1:10, -1:5",
+            disabled=True,
+            style=extend_description_style,
+        )
+        # -- Early stopping ---------------------------------------------------
+        self.conv_threshold_textbox = FloatText(
+            description="Stop below convergence (px): ",
+            value=self.conv_threshold,
+            style=extend_description_style,
+        )
+        self.conv_rtol_textbox = FloatText(
+            description="Stop below relative change: ",
+            value=self.conv_rtol,
+            style=extend_description_style,
+        )
+        self.shift_tol_textbox = FloatText(
+            description="Stop below max shift (px): ",
+            value=self.shift_tol,
+            style=extend_description_style,
+        )
+        self.patience_textbox = IntText(
+            description="Patience (iterations): ",
+            value=self.patience,
+            style=extend_description_style,
+        )
+        # -- Reconstruction iterations per alignment iteration ----------------
+        self.recon_iters_textbox = Text(
+            description="Recon iterations per iteration: ",
+            value="1",
+            placeholder="4, 2, 1",
+            tooltip="After the pre-alignment iterations. The last one repeats.",
+            style=extend_description_style,
+        )
+        # -- Checkpoints ------------------------------------------------------
+        self.checkpoint_iters_textbox = IntText(
+            description="Checkpoint every (iterations): ",
+            value=self.checkpoint_iters,
+            style=extend_description_style,
+        )
+        self.checkpoint_minutes_textbox = FloatText(
+            description="Checkpoint every (minutes): ",
+            value=self.checkpoint_minutes,
+            style=extend_description_style,
+        )
+        self.resume_dir_textbox = Text(
+            description="Resume run in folder: ",
+            placeholder="Folder of an interrupted alignment",
+            style=extend_description_style,
+        )
+        # -- Pipelined batches (CPU alignment) --------------------------------
+        self.pipeline_batches_checkbox = Checkbox(
+            description="Pipeline batches?",
+            value=self.pipeline_batches,
+            tooltip="Overlap reprojection, correlation and shifting of batches.",
+        )
+        # -- Slab alignment (CPU alignment) -----------------------------------
+        self.slab_alignment_checkbox = Checkbox(
+            description="Reconstruct subset rows only?",
+            value=self.slab_alignment,
+            tooltip="With Phase Corr. Subset, only reconstruct the subset rows.",
+        )
+        self.vertical_alignment_dropdown = Dropdown(
+            description="Vertical shifts: ",
+            options=[
+                ("From correlation", "band"),
+                ("From row profiles", "profile"),
+                ("None", "none"),
+            ],
+            value=self.vertical_alignment,
+            style=extend_description_style,
+        )
+        # -- Fast alignment (row profiles and centers of mass) ----------------
+        self.fast_alignment_dropdown = Dropdown(
+            description="Fast alignment: ",
+            options=[
+                ("Off", "off"),
+                ("Start joint alignment from it", "initialize"),
+                ("Fast alignment only", "standalone"),
+            ],
+            value=self.fast_alignment,
+            style=extend_description_style,
+        )
+        # -- Angle-decimated first iterations (CPU alignment) -----------------
+        self.angle_stride_textbox = IntText(
+            description="Starting angle stride: ",
+            value=self.angle_stride,
+            tooltip="First iterations use every k-th angle; k halves as it converges.",
+            style=extend_description_style,
+        )
+        # -- Out-of-core alignment ---------------------------------------------
+        self.out_of_core_checkbox = Checkbox(
+            description="Out-of-core (memory-mapped scratch files)?",
+            value=self.out_of_core,
+            tooltip="Keep projections, reprojections and reconstruction on disk.",
+        )
+        # -- Ordered subsets (CPU alignment) ----------------------------------
+        self.num_subsets_textbox = IntText(
+            description="Ordered subsets: ",
+            value=self.num_subsets,
+            tooltip="Angle subsets per iteration, each with its own recon update.",
+            style=extend_description_style,
+        )
+        self.subset_order_dropdown = Dropdown(
+            description="Subset order: ",
+            options=[
+                ("Bit reversal", "bit_reversal"),
+                ("Sequential", "sequential"),
+                ("Random", "random"),
+            ],
+            value=self.subset_order,
+            style=extend_description_style,
+        )
 
     def set_observes(self):
         super().set_observes()
         self.num_iterations_textbox.observe(self.update_num_iter, names="value")
         self.num_batches_textbox.observe(self.update_num_batches, names="value")
         self.upsample_factor_textbox.observe(self.update_upsample_factor, names="value")
+        self.projector_dropdown.observe(self.update_projector, names="value")
+        self.multi_resolution_checkbox.observe(
+            self._multi_resolution_turn_on, names="value"
+        )
+        self.alignment_schedule_textbox.observe(
+            self.update_alignment_schedule, names="value"
+        )
+        self.conv_threshold_textbox.observe(self.update_stopping, names="value")
+        self.conv_rtol_textbox.observe(self.update_stopping, names="value")
+        self.shift_tol_textbox.observe(self.update_stopping, names="value")
+        self.patience_textbox.observe(self.update_stopping, names="value")
+        self.recon_iters_textbox.observe(self.update_recon_iters, names="value")
+        self.checkpoint_iters_textbox.observe(self.update_checkpoints, names="value")
+        self.checkpoint_minutes_textbox.observe(self.update_checkpoints, names="value")
+        self.resume_dir_textbox.observe(self.update_resume_dir, names="value")
+        self.pipeline_batches_checkbox.observe(
+            self.update_pipeline_batches, names="value"
+        )
+        self.use_subset_correlation_checkbox.observe(
+            self.update_pipeline_availability, names="value"
+        )
+        self.slab_alignment_checkbox.observe(self.update_slab_alignment, names="value")
+        self.vertical_alignment_dropdown.observe(
+            self.update_vertical_alignment, names="value"
+        )
+        self.fast_alignment_dropdown.observe(self.update_fast_alignment, names="value")
+        self.angle_stride_textbox.observe(self.update_angle_stride, names="value")
+        self.out_of_core_checkbox.observe(self.update_out_of_core, names="value")
+        self.num_subsets_textbox.observe(self.update_ordered_subsets, names="value")
+        self.subset_order_dropdown.observe(self.update_ordered_subsets, names="value")
         self.start_button.on_click(self.set_options_and_run)
+        self.set_memory_plan_observes()
 
     # Upsampling
     def update_upsample_factor(self, change):
         self.upsample_factor = change.new
         self.metadata.set_metadata(self)
 
+    # Forward projector
+    def update_projector(self, change):
+        self.projector = change.new
+        self.metadata.set_metadata(self)
+
+    # Coarse-to-fine schedule
+    def _multi_resolution_turn_on(self, change):
+        self.multi_resolution = change.new
+        self.alignment_schedule_textbox.disabled = not change.new
+        self.metadata.set_metadata(self)
+
+    def update_alignment_schedule(self, change):
+        try:
+            self.alignment_schedule = parse_alignment_schedule(change.new)
+        except ValueError:
+            return
+        self.metadata.set_metadata(self)
+
+    # Early stopping
+    def update_stopping(self, *args):
+        self.conv_threshold = self.conv_threshold_textbox.value
+        self.conv_rtol = self.conv_rtol_textbox.value
+        self.shift_tol = self.shift_tol_textbox.value
+        self.patience = max(1, self.patience_textbox.value)
+        self.metadata.set_metadata(self)
+
+    # Reconstruction iterations per alignment iteration
+    def update_recon_iters(self, change):
+        try:
+            recon_iters = [int(x) for x in change.new.split(",")]
+        except ValueError:
+            return
+        if min(recon_iters) < 1:
+            return
+        self.recon_iters = recon_iters
+        self.metadata.set_metadata(self)
+
+    # Checkpoints
+    def update_checkpoints(self, *args):
+        self.checkpoint_iters = max(0, self.checkpoint_iters_textbox.value)
+        self.checkpoint_minutes = max(0, self.checkpoint_minutes_textbox.value)
+        self.metadata.set_metadata(self)
+
+    def update_resume_dir(self, change):
+        self.resume_dir = pathlib.Path(change.new) if change.new else None
+
+    # Pipelined batches
+    def update_pipeline_batches(self, change):
+        self.pipeline_batches = change.new
+        self.metadata.set_metadata(self)
+
+    def update_pipeline_availability(self, *args):
+        reason = pipeline_fallback_reason(
+            self.use_subset_correlation and self.slab_alignment,
+            self.vertical_alignment,
+            self.num_subsets,
+        )
+        self.pipeline_batches_checkbox.disabled = reason is not None
+        if reason is not None:
+            tooltip = f"Not available: {reason}."
+        else:
+            tooltip = "Overlap reprojection, correlation and shifting of batches."
+            if self.angle_stride > 1:
+                tooltip += " Iterations with an angle stride above 1 are not."
+        self.pipeline_batches_checkbox.tooltip = tooltip
+
+    # Slab alignment
+    def update_slab_alignment(self, change):
+        self.slab_alignment = change.new
+        self.update_pipeline_availability()
+        self.metadata.set_metadata(self)
+
+    def update_vertical_alignment(self, change):
+        self.vertical_alignment = change.new
+        self.update_pipeline_availability()
+        self.metadata.set_metadata(self)
+
+    # Fast alignment
+    def update_fast_alignment(self, change):
+        self.fast_alignment = change.new
+        self.metadata.set_metadata(self)
+
+    # Angle decimation
+    def update_angle_stride(self, change):
+        self.angle_stride = max(1, change.new)
+        self.update_pipeline_availability()
+        self.metadata.set_metadata(self)
+
+    # Out-of-core
+    def update_out_of_core(self, change):
+        self.out_of_core = change.new
+        self.metadata.set_metadata(self)
+
+    # Ordered subsets
+    def update_ordered_subsets(self, change):
+        self.num_subsets = max(1, self.num_subsets_textbox.value)
+        self.subset_order = self.subset_order_dropdown.value
+        self.update_pipeline_availability()
+        self.metadata.set_metadata(self)
+
     # TODO: implement load metadata
     # def set_widgets_from_load_metadata(self):
     #     super().set_widgets_from_load_metadata()
@@ -651,7 +1049,7 @@ class Align(AnalysisBase):
         self.metadata.set_metadata(self)
 
     def run(self):
-        self.analysis = RunAlign(self)
+        self.analysis = RunAlign(self, resume_dir=self.resume_dir)
         self.result_after_viewer.create_app()
         self.result_after_viewer.plot(self.analysis.projections, ds=self.downsample)
         self.plot_result()
@@ -719,6 +1117,25 @@ class Align(AnalysisBase):
                         self.num_iterations_textbox,
                         self.center_textbox,
                         self.upsample_factor_textbox,
+                        self.projector_dropdown,
+                        self.multi_resolution_checkbox,
+                        self.alignment_schedule_textbox,
+                        self.conv_threshold_textbox,
+                        self.conv_rtol_textbox,
+                        self.shift_tol_textbox,
+                        self.patience_textbox,
+                        self.recon_iters_textbox,
+                        self.checkpoint_iters_textbox,
+                        self.checkpoint_minutes_textbox,
+                        self.resume_dir_textbox,
+                        self.pipeline_batches_checkbox,
+                        self.slab_alignment_checkbox,
+                        self.vertical_alignment_dropdown,
+                        self.fast_alignment_dropdown,
+                        self.angle_stride_textbox,
+                        self.out_of_core_checkbox,
+                        self.num_subsets_textbox,
+                        self.subset_order_dropdown,
                         self.num_batches_textbox,
                         self.padding_x_textbox,
                         self.padding_y_textbox,
@@ -727,6 +1144,9 @@ class Align(AnalysisBase):
                         self.extra_options_textbox,
                         self.use_subset_correlation_checkbox,
                         self.pre_alignment_iters_textbox,
+                        self.auto_memory_checkbox,
+                        self.apply_memory_plan_button,
+                        self.memory_label,
                     ],
                     layout=Layout(flex_flow="row wrap", justify_content="flex-start"),
                 ),
@@ -767,7 +1187,8 @@ class Recon(AnalysisBase):
     def __init__(self, Import, Center):
         super().init_attributes(Import, Center)
         self.metadata = Metadata_Recon()
-        self.save_opts_list = ["tomo_before", "recon", "tiff", "npy"]
+        self.use_center_fit = False
+        self.save_opts_list = ["tomo_before", "recon", "tiff", "npy", "dask_trace"]
         self.Import.Recon = self
         self.init_widgets()
         self.set_observes()
@@ -787,9 +1208,18 @@ class Recon(AnalysisBase):
             layout=Layout(width="auto", justify_content="center"),
         )
 
+        # -- Per-row centers from the Center tab ------------------------------
+        self.use_center_fit_checkbox = Checkbox(
+            description="Per-row centers (tilt fit)",
+            value=self.use_center_fit,
+            tooltip="Use the center fit over rows from the Center tab.",
+        )
+
     def set_observes(self):
         super().set_observes()
         self.num_iterations_textbox.observe(self.update_num_iter, names="value")
+        self.use_center_fit_checkbox.observe(self.update_use_center_fit, names="value")
+        self.set_memory_plan_observes()
 
     # TODO: implement load metadata
     # def load_metadata(self):
@@ -813,6 +1243,15 @@ class Recon(AnalysisBase):
         self.num_iter = change.new
         self.metadata.set_metadata(self)
 
+    # Per-row centers
+    def update_use_center_fit(self, change):
+        if change.new and self.Center.center_fit is None:
+            self.log.warning("Fit the center over rows in the Center tab first.")
+            self.use_center_fit_checkbox.value = False
+            return
+        self.use_center_fit = change.new
+        self.metadata.set_metadata(self)
+
     def run(self):
         self.analysis = RunRecon(self)
         self.analysis_projections = Projections_Child(self.projections)
@@ -888,6 +1327,10 @@ class Recon(AnalysisBase):
                         self.downsample_checkbox,
                         self.ds_factor_dropdown,
                         self.extra_options_textbox,
+                        self.use_center_fit_checkbox,
+                        self.auto_memory_checkbox,
+                        self.apply_memory_plan_button,
+                        self.memory_label,
                     ],
                     layout=Layout(
                         flex_flow="row wrap", justify_content="space-between"
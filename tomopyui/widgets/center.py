@@ -1,14 +1,23 @@
 import numpy as np
 import copy
+import bqplot as bq
 
 # astra_cuda_recon_algorithm_kwargs, tomopy_recon_algorithm_kwargs,
 # and tomopy_filter_names, extend_description_style
 from tomopyui._sharedvars import *
 from ipywidgets import *
-from tomopy.recon.rotation import find_center_vo, find_center, find_center_pc
+from tomopy.recon.rotation import find_center, find_center_pc
 from tomopyui.widgets.view import BqImViewer_Center, BqImViewer_Center_Recon
-from tomopyui.backend.util.center import write_center
+from tomopyui.backend.util.center import (
+    find_center_pyramid,
+    find_center_mirror,
+    fit_center_rows,
+    scale_center_fit,
+    find_center_vo,
+)
+from tomopyui.backend.util.center_cache import CenterScanCache
 from tomopyui.widgets.helpers import ReactiveTextButton
+from tomopyui.backend.util.profiling import StageProfiler
 
 
 class Center:
@@ -40,6 +49,33 @@ class Center:
     filter : str
         Filter to be used. Only works with fbp and gridrec. If you choose
         another algorith, this will be ignored.
+    auto_search_range : double
+        Search range around center_guess for the coarse-to-fine search, and
+        around the middle of the detector for Vo's method.
+    center_metric : str
+        Sharpness metric for the coarse-to-fine search (see
+        `tomopyui.backend.util.center.center_metric`).
+    center_search_curves : list of dict
+        Metric curves of each pass of the last coarse-to-fine search.
+    tilt_deg : double
+        Tilt of the rotation axis estimated from opposing projections or from the
+        center fit.
+    num_center_rows : int
+        Number of rows to find the center on when fitting the center over rows.
+    center_fit : dict
+        Result of `tomopyui.backend.util.center.fit_center_rows`, in full
+        resolution pixels. The Recon tab can reconstruct with these per-row centers.
+    vo_band_rows : int
+        Number of rows around index_to_try (on the downsampled level shown in the
+        viewer) averaged into the sinogram for Vo's method.
+    vo_centers : tuple of double
+        Coarse and fine centers from the last run of Vo's method, in full
+        resolution pixels.
+    center_scan_cache : `CenterScanCache`
+        Reconstructions of previous manual center scans. Scanning the same or an
+        overlapping range again only reconstructs the new centers.
+    cache_center_scans_on_disk : bool
+        Also store the center scans in a folder next to the imported data.
 
     """
 
@@ -57,7 +93,18 @@ class Center:
         self.num_iter = int(1)
         self.algorithm = "gridrec"
         self.filter = "parzen"
+        self.auto_search_range = 50
+        self.center_metric = "entropy"
+        self.center_search_curves = None
+        self.tilt_deg = None
+        self.num_center_rows = 8
+        self.center_fit = None
+        self.vo_band_rows = 5
+        self.vo_centers = None
+        self.center_scan_cache = CenterScanCache()
+        self.cache_center_scans_on_disk = False
         self.metadata = {}
+        self.profiler = StageProfiler()
         self.viewer = BqImViewer_Center()
         self.viewer.create_app()
         self.rec_viewer = BqImViewer_Center_Recon()
@@ -79,6 +126,18 @@ class Center:
         self.metadata["num_iter"] = self.num_iter
         self.metadata["algorithm"] = self.algorithm
         self.metadata["filter"] = self.filter
+        self.metadata["tilt_deg"] = self.tilt_deg
+        self.metadata["center_fit"] = self.center_fit
+        self.metadata["center_vo"] = {
+            "band_rows": self.vo_band_rows,
+            "centers": self.vo_centers,
+        }
+        self.metadata["center_search"] = {
+            "metric": self.center_metric,
+            "search_range": self.auto_search_range,
+            "curves": self.center_search_curves,
+        }
+        self.metadata["profile"] = self.profiler.as_dict()
 
     def _init_widgets(self):
 
@@ -107,6 +166,64 @@ class Center:
             "Found center.",
             warning="Please import some data first.",
         )
+        self.find_center_mirror_button = ReactiveTextButton(
+            self.find_center_mirror_on_click,
+            "Click to estimate center guess (opposing projections).",
+            "Estimating center from opposing projections.",
+            "Estimated center guess.",
+            warning="No projections 180 degrees apart.",
+        )
+        self.tilt_label = Label()
+        self.fit_center_rows_button = ReactiveTextButton(
+            self.fit_center_rows_on_click,
+            "Click to fit the center over several rows (tilt).",
+            "Finding the center on several rows.",
+            "Fit center over rows.",
+            warning="Please import some data first.",
+        )
+        self.num_center_rows_textbox = IntText(
+            description="Rows for tilt fit:",
+            disabled=False,
+            style=extend_description_style,
+            value=self.num_center_rows,
+        )
+        self.find_center_pyramid_button = ReactiveTextButton(
+            self.find_center_pyramid_on_click,
+            "Click to automatically find center (coarse to fine).",
+            "Automatically finding center (coarse to fine).",
+            "Found center.",
+            warning="Please import some data first.",
+        )
+        self.auto_search_range_textbox = FloatText(
+            description="Search range (coarse to fine):",
+            disabled=False,
+            style=extend_description_style,
+            value=self.auto_search_range,
+        )
+        self.center_metric_dropdown = Dropdown(
+            options=[
+                ("entropy", "entropy"),
+                ("negativity", "negativity"),
+                ("gradient (biased)", "gradient"),
+            ],
+            value=self.center_metric,
+            description="Metric:",
+        )
+        self.center_search_scale_x = bq.LinearScale()
+        self.center_search_scale_y = bq.LinearScale(min=0, max=1)
+        self.center_search_fig = bq.Figure(
+            marks=[],
+            axes=[
+                bq.Axis(scale=self.center_search_scale_x, label="Center"),
+                bq.Axis(
+                    scale=self.center_search_scale_y,
+                    orientation="vertical",
+                    label="Metric (normalized)",
+                ),
+            ],
+            legend_location="top-right",
+            layout=Layout(width="550px", height="300px"),
+        )
         self.find_center_vo_button = ReactiveTextButton(
             self.find_center_vo_on_click,
             "Click to automatically find center (Vo).",
@@ -114,6 +231,12 @@ class Center:
             "Found center.",
             warning="Please import some data first.",
         )
+        self.vo_band_rows_textbox = IntText(
+            description="Rows for Vo:",
+            disabled=False,
+            style=extend_description_style,
+            value=self.vo_band_rows,
+        )
         self.find_center_manual_button = ReactiveTextButton(
             self.find_center_manual_on_click,
             "Click to find center by plotting.",
@@ -161,6 +284,21 @@ class Center:
             disabled=False,
             style=extend_description_style,
         )
+        self.cache_center_scans_on_disk_checkbox = Checkbox(
+            description="Save center scans to disk: ",
+            value=self.cache_center_scans_on_disk,
+            disabled=False,
+            style=extend_description_style,
+        )
+
+    def _cache_center_scans_on_disk_update(self, change):
+        self.cache_center_scans_on_disk = change.new
+        if change.new:
+            self.center_scan_cache.cache_dir = (
+                self.projections.filedir / CenterScanCache.dirname
+            )
+        else:
+            self.center_scan_cache.cache_dir = None
 
     def _use_ds_data(self, change):
         self.use_ds = self.use_ds_checkbox.value
@@ -217,6 +355,22 @@ class Center:
         self.filter = change.new
         self.set_metadata()
 
+    def _auto_search_range_update(self, change):
+        self.auto_search_range = change.new
+        self.set_metadata()
+
+    def _update_center_metric(self, change):
+        self.center_metric = change.new
+        self.set_metadata()
+
+    def _num_center_rows_update(self, change):
+        self.num_center_rows = change.new
+        self.set_metadata()
+
+    def _vo_band_rows_update(self, change):
+        self.vo_band_rows = max(1, change.new)
+        self.set_metadata()
+
     def _slice_slider_update(self, change):
         self.viewer.slice_line.y = [
             change.new / self.viewer.pxY,
@@ -244,12 +398,23 @@ class Center:
         self.search_step_textbox.observe(self._search_step_update, names="value")
         self.algorithms_dropdown.observe(self._update_algorithm, names="value")
         self.filters_dropdown.observe(self._update_filters, names="value")
+        self.auto_search_range_textbox.observe(
+            self._auto_search_range_update, names="value"
+        )
+        self.center_metric_dropdown.observe(self._update_center_metric, names="value")
+        self.num_center_rows_textbox.observe(
+            self._num_center_rows_update, names="value"
+        )
+        self.vo_band_rows_textbox.observe(self._vo_band_rows_update, names="value")
         # Callback for index going to center
         self.rec_viewer.image_index_slider.observe(
             self._center_textbox_slider_update, names="value"
         )
         self.viewer.slice_line_slider.observe(self._slice_slider_update, names="value")
         self.use_ds_checkbox.observe(self._use_ds_data, names="value")
+        self.cache_center_scans_on_disk_checkbox.observe(
+            self._cache_center_scans_on_disk_update, names="value"
+        )
 
     def find_center_on_click(self, *args):
         """
@@ -260,34 +425,188 @@ class Center:
         """
         prj_imgs, ds_value = self.get_ds_projections()
         angles_rad = self.projections.angles_rad
-        self.current_center = find_center(
-            prj_imgs,
-            angles_rad,
-            ratio=0.9,
-            ind=self.index_to_try,
-            init=self.center_guess,
+        with self.profiler.stage("center_entropy"):
+            self.current_center = find_center(
+                prj_imgs,
+                angles_rad,
+                ratio=0.9,
+                ind=self.index_to_try,
+                init=self.center_guess,
+            )
+        self.center_textbox.value = self.current_center
+
+    def find_center_mirror_on_click(self, *args):
+        """
+        Callback to button for estimating center_guess (and the tilt of the rotation
+        axis) from projections 180 degrees apart, using
+        `tomopyui.backend.util.center.find_center_mirror`. Does not reconstruct, so
+        it is a quick starting point for the other methods.
+        """
+        prj_imgs, ds_value = self.get_ds_projections()
+        ds_factor = np.power(2, int(ds_value + 1))
+        with self.profiler.stage("center_mirror"):
+            center, self.tilt_deg = find_center_mirror(
+                prj_imgs, self.projections.angles_rad
+            )
+        if center is None:
+            self.find_center_mirror_button.warning()
+            return
+        self.center_guess_textbox.value = (center + 0.5) * ds_factor - 0.5
+        self.tilt_label.value = f"Rotation axis tilt: {self.tilt_deg:.3f} degrees"
+        self.set_metadata()
+
+    def fit_center_rows_on_click(self, *args):
+        """
+        Callback to button for finding the center on num_center_rows rows spread over
+        the height of the projections (in parallel processes) and fitting a line
+        through them, using `tomopyui.backend.util.center.fit_center_rows`. Searches
+        center_guess +/- search_range in steps of search_step. Sets the center to the
+        fitted center of the middle row.
+        """
+        if self.center_guess is None:
+            self._load_rough_center_onclick(None)
+        prj_imgs, ds_value = self.get_ds_projections()
+        ds_factor = np.power(2, int(ds_value + 1))
+        num_rows = prj_imgs.shape[1]
+        margin = num_rows // 10
+        rows = np.unique(
+            np.linspace(margin, num_rows - 1 - margin, self.num_center_rows).astype(int)
+        )
+        with self.profiler.stage("center_rows"):
+            fit = fit_center_rows(
+                prj_imgs,
+                self.projections.angles_rad,
+                rows,
+                (self.center_guess + 0.5) / ds_factor - 0.5,
+                self.search_range / ds_factor,
+                step=max(self.search_step / ds_factor, 0.25),
+                metric=self.center_metric,
+                filter_name=self.filter,
+            )
+        self.center_fit = scale_center_fit(fit, ds_factor)
+        self.tilt_deg = self.center_fit["tilt_deg"]
+        middle_row = (self.projections.pxY - 1) / 2
+        self.center_textbox.value = (
+            self.center_fit["intercept"] + self.center_fit["slope"] * middle_row
+        )
+        residual = np.max(np.abs(self.center_fit["residuals"]))
+        self.tilt_label.value = (
+            f"Rotation axis tilt: {self.tilt_deg:.3f} degrees "
+            + f"(max residual {residual:.2f} px)"
         )
+        self.set_metadata()
+
+    def find_center_pyramid_on_click(self, *args):
+        """
+        Callback to button for finding the center from coarse to fine, using
+        `tomopyui.backend.util.center.find_center_pyramid`. Searches
+        center_guess +/- auto_search_range on the coarsest downsampled level,
+        then narrows the search on each finer level. Plots the metric curves.
+        """
+        if self.center_guess is None or self.index_to_try is None:
+            self._load_rough_center_onclick(None)
+        with self.profiler.stage("load_projections"):
+            sinograms = self._get_pyramid_sinograms(self.index_to_try)
+        with self.profiler.stage("center_pyramid"):
+            self.current_center, self.center_search_curves = find_center_pyramid(
+                sinograms,
+                self.projections.angles_rad,
+                self.center_guess,
+                self.auto_search_range,
+                metric=self.center_metric,
+                filter_name=self.filter,
+            )
         self.center_textbox.value = self.current_center
+        self._plot_center_search_curves()
+
+    def _get_pyramid_sinograms(self, index):
+        """
+        Returns [(ds_factor, sinogram), ...] of slice index (in full resolution
+        pixels) for each downsampled level in the projections' hdf file, from the
+        coarsest to full resolution. Only full resolution is used if the data is not
+        in an hdf file.
+        """
+        if self.projections.hdf_file is None:
+            return [(1, np.asarray(self.projections.data[:, index, :]))]
+        sinograms = []
+        for pyramid_level in (2, 1, 0):
+            ds_factor = int(np.power(2, pyramid_level + 1))
+            row = int(np.around((index + 0.5) / ds_factor - 0.5))
+            try:
+                self.projections._return_ds_data(
+                    pyramid_level, ([0, None], [row, row + 1])
+                )
+            except KeyError:
+                continue
+            sinograms.append((ds_factor, self.projections.data_returned[:, 0, :]))
+        self.projections._return_data(([0, None], [index, index + 1]))
+        sinograms.append((1, self.projections.data_returned[:, 0, :]))
+        return sinograms
+
+    def _plot_center_search_curves(self):
+        colors = ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd"]
+        marks = []
+        for i, curve in enumerate(self.center_search_curves):
+            metric = np.asarray(curve["metric"])
+            span = np.ptp(metric)
+            metric = (metric - metric.min()) / (span if span > 0 else 1)
+            marks.append(
+                bq.Lines(
+                    x=curve["centers"],
+                    y=metric,
+                    scales={
+                        "x": self.center_search_scale_x,
+                        "y": self.center_search_scale_y,
+                    },
+                    colors=[colors[i % len(colors)]],
+                    marker="circle",
+                    marker_size=16,
+                    labels=[f"Downsampled {curve['ds_factor']}x"],
+                    display_legend=True,
+                )
+            )
+        self.center_search_fig.marks = marks
 
     def find_center_vo_on_click(self, *args):
         """
         Callback to button for attempting to find center automatically using
-        `tomopy.recon.rotation.find_center_vo`. Note: this method has not worked
-        well for me.
+        `tomopyui.backend.util.center.find_center_vo`, on the average of
+        vo_band_rows rows around index_to_try of the level shown in the viewer.
+        Uses all cores. Searches shifts of +/- auto_search_range around the
+        middle of the detector. Only works for scans over 180 degrees.
         """
+        if self.index_to_try is None:
+            self._load_rough_center_onclick(None)
         prj_imgs, ds_value = self.get_ds_projections()
-        angles_rad = self.projections.angles_rad
+        ds_factor = np.power(2, int(ds_value + 1))
+        num_rows = prj_imgs.shape[1]
+        row = int(np.clip((self.index_to_try + 0.5) / ds_factor - 0.5, 0, num_rows - 1))
+        start = max(0, row - self.vo_band_rows // 2)
+        stop = min(num_rows, start + self.vo_band_rows)
+        search = int(np.ceil(self.auto_search_range / ds_factor))
         try:
-            self.current_center = find_center_vo(prj_imgs, ncore=1)
-            self.center_textbox.value = self.current_center
-        except Excepton:
+            with self.profiler.stage("center_vo"):
+                centers = find_center_vo(
+                    prj_imgs,
+                    rows=(start, stop),
+                    smin=-search,
+                    smax=search,
+                    srad=min(6, max(search, 1)),
+                )
+        except Exception:
             self.find_center_vo_button.warning()
+            return
+        self.vo_centers = tuple((c + 0.5) * ds_factor - 0.5 for c in centers)
+        self.current_center = self.vo_centers[1]
+        self.center_textbox.value = self.current_center
+        self.set_metadata()
 
     def find_center_manual_on_click(self, *args):
         """
         Reconstructs at various centers when you click the button, and plots
         the results with a slider so one can view. TODO: see X example.
-        Uses search_range, search_step, center_guess.
+        Uses search_range, search_step, center_guess. Centers that were already
+        reconstructed with the same data and settings come from center_scan_cache.
         Creates a :doc:`hyperslicer <mpl-interactions:examples/hyperslicer>` +
         :doc:`histogram <mpl-interactions:examples/hist>` plot
         """
@@ -308,16 +627,18 @@ class Center:
         ]
         # reconstruct, but also pull the centers used out to map to center
         # textbox
-        self.rec, cen_range = write_center(
-            prj_imgs,
-            angles_rad,
-            cen_range=cen_range,
-            ind=_index_to_try,
-            mask=True,
-            algorithm=self.algorithm,
-            filter_name=self.filter,
-            num_iter=self.num_iter,
-        )
+        with self.profiler.stage("center_manual"):
+            self.rec, cen_range = self.center_scan_cache.scan(
+                prj_imgs,
+                angles_rad,
+                cen_range=cen_range,
+                ind=_index_to_try,
+                pyramid_level=ds_value,
+                mask=True,
+                algorithm=self.algorithm,
+                filter_name=self.filter,
+                num_iter=self.num_iter,
+            )
         self.cen_range = [ds_factor * cen for cen in cen_range]
         if self.rec is None:
             self.find_center_manual_button.warning()
@@ -326,6 +647,10 @@ class Center:
 
     def get_ds_projections(self):
         ds_value = self.viewer.ds_viewer_dropdown.value
+        with self.profiler.stage("load_projections"):
+            return self._get_ds_projections(ds_value)
+
+    def _get_ds_projections(self, ds_value):
         if self.use_ds:
             if ds_value == -1:
                 prj_imgs = self.projections.data
@@ -355,16 +680,36 @@ class Center:
         self.automatic_center_vbox = VBox(
             [
                 HBox(
-                    [self.find_center_button.button, self.find_center_vo_button.button],
+                    [
+                        self.find_center_button.button,
+                        self.find_center_vo_button.button,
+                        self.find_center_pyramid_button.button,
+                    ],
+                    layout=Layout(justify_content="center"),
+                ),
+                HBox(
+                    [
+                        self.find_center_mirror_button.button,
+                        self.fit_center_rows_button.button,
+                        self.num_center_rows_textbox,
+                        self.tilt_label,
+                    ],
                     layout=Layout(justify_content="center"),
                 ),
                 HBox(
                     [
                         self.center_guess_textbox,
                         self.index_to_try_textbox,
+                        self.auto_search_range_textbox,
+                        self.center_metric_dropdown,
+                        self.vo_band_rows_textbox,
                     ],
                     layout=Layout(justify_content="center"),
                 ),
+                HBox(
+                    [self.center_search_fig],
+                    layout=Layout(justify_content="center"),
+                ),
             ]
         )
         self.automatic_center_accordion = Accordion(
@@ -394,6 +739,7 @@ class Center:
                         self.algorithms_dropdown,
                         self.filters_dropdown,
                         self.use_ds_checkbox,
+                        self.cache_center_scans_on_disk_checkbox,
                     ],
                     layout=Layout(
                         display="flex",
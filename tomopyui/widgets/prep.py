@@ -17,6 +17,7 @@ from tomopyui.widgets.view import (
     BqImViewer_TwoEnergy_Low,
 )
 from tomopyui.backend.util.padding import *
+from tomopyui.backend.util.shifting import shift_projections
 from tomopyui.backend.io import Metadata_Prep
 
 
@@ -794,23 +795,6 @@ class PrepMethod:
         self.Prep.prepped_data = self.partial_func()
 
 
-def shift_projections(projections, sx, sy):
-    new_prj_imgs = copy.deepcopy(projections)
-    pad_x = np.max(np.abs(sx))
-    pad_y = np.max(np.abs(sy))
-    pad = (pad_x, pad_y)
-    new_prj_imgs, pad = pad_projections(new_prj_imgs, pad)
-    new_prj_imgs = shift_prj_cp(
-        new_prj_imgs,
-        sx,
-        sy,
-        5,
-        pad,
-        use_corr_prj_gpu=False,
-    )
-    return new_prj_imgs
-
-
 def renormalize_by_roi(projections, px_range_x, px_range_y):
     exp_full = np.exp(-projections)
     averages = [
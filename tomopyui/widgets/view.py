@@ -465,9 +465,12 @@ class BqImViewerBase(ABC):
             self.from_npy = True
 
     def set_state_on_plot(self):
-        self.pxX = self.original_images.shape[2]
-        self.pxY = self.original_images.shape[1]
-        self.pxZ = self.original_images.shape[0]
+        # The dataset keeps its shape after its hdf file is closed.
+        if self.original_images is self.projections.data:
+            shape = self.projections.dataset.shape
+        else:
+            shape = self.original_images.shape
+        (self.pxZ, self.pxY, self.pxX) = shape
         self.px_range_x = [0, self.pxX - 1]
         self.px_range_y = [0, self.pxY - 1]
         self.px_range = [self.px_range_x, self.px_range_y]
@@ -1197,3 +1200,138 @@ class ScaleBar:
         # fig.layout.height = dimensions[1]
         # fig.layout.width = dimensions[0]
         # fig
+
+
+class AlignmentPlots:
+    """
+    Live plots of an alignment run: one projection next to its reprojection, the
+    shifts of all projections and the convergence.
+
+    Parameters
+    ----------
+    RunAlign : `RunAlign`
+        Run whose plot_output1 and plot_output2 are used.
+    projection_num : int
+        Projection to show.
+    """
+
+    def __init__(self, RunAlign, projection_num=50):
+        self.projection_num = min(projection_num, RunAlign.prjs.shape[0] - 1)
+        prj = RunAlign.prjs[self.projection_num]
+
+        # Initialize projection images plot
+        scale_x = bq.LinearScale(min=0, max=1)
+        scale_y = bq.LinearScale(min=1, max=0)
+        scales = {"x": scale_x, "y": scale_y}
+        self.projection_fig = projection_fig = bq.Figure(scales=scales)
+        self.simulated_fig = simulated_fig = bq.Figure(scales=scales)
+        scales_image = {
+            "x": scale_x,
+            "y": scale_y,
+            "image": bq.ColorScale(
+                min=float(np.min(prj)), max=float(np.max(prj)), scheme="viridis"
+            ),
+        }
+        self.image_projection = ImageGL(image=prj, scales=scales_image)
+        self.image_simulated = ImageGL(image=np.zeros_like(prj), scales=scales_image)
+        projection_fig.marks = (self.image_projection,)
+        projection_fig.layout.width = "600px"
+        projection_fig.layout.height = "600px"
+        self._set_titles(self.projection_num)
+        simulated_fig.marks = (self.image_simulated,)
+        simulated_fig.layout.width = "600px"
+        simulated_fig.layout.height = "600px"
+        with RunAlign.plot_output1:
+            RunAlign.plot_output1.clear_output(wait=True)
+            display(
+                HBox(
+                    [projection_fig, simulated_fig],
+                    layout=Layout(
+                        flex_flow="row wrap",
+                        justify_content="center",
+                        align_items="stretch",
+                    ),
+                )
+            )
+
+        # Initialize Sx, Sy plot
+        xs = bq.LinearScale()
+        ys = bq.LinearScale()
+        self.line = bq.Lines(
+            x=range(RunAlign.prjs.shape[0]),
+            y=[RunAlign.sx, RunAlign.sy],
+            scales={"x": xs, "y": ys},
+            colors=["dodgerblue", "red"],
+            stroke_width=3,
+            labels=["Shift in X (px)", "Shift in Y (px)"],
+            display_legend=True,
+        )
+        xax = bq.Axis(scale=xs, label="Projection Number", grid_lines="none")
+        yax = bq.Axis(
+            scale=ys,
+            orientation="vertical",
+            tick_format="0.1f",
+            label="Shift",
+            grid_lines="none",
+        )
+        fig_SxSy = bq.Figure(
+            marks=[self.line], axes=[xax, yax], animation_duration=1000
+        )
+        fig_SxSy.layout.width = "600px"
+
+        # Initialize convergence plot
+        xs_conv = bq.LinearScale(min=0)
+        ys_conv = bq.LinearScale()
+        self.line_conv = bq.Lines(
+            x=[0],
+            y=[RunAlign.conv[0]],
+            scales={"x": xs_conv, "y": ys_conv},
+            colors=["dodgerblue"],
+            stroke_width=3,
+            labels=["Convergence"],
+            display_legend=True,
+        )
+        xax_conv = bq.Axis(scale=xs_conv, label="Iteration", grid_lines="none")
+        yax_conv = bq.Axis(
+            scale=ys_conv,
+            orientation="vertical",
+            tick_format="0.1f",
+            label="Convergence",
+            grid_lines="none",
+        )
+        fig_conv = bq.Figure(
+            marks=[self.line_conv], axes=[xax_conv, yax_conv], animation_duration=1000
+        )
+        fig_conv.layout.width = "600px"
+        with RunAlign.plot_output2:
+            RunAlign.plot_output2.clear_output()
+            display(
+                HBox(
+                    [fig_SxSy, fig_conv],
+                    layout=Layout(
+                        flex_flow="row wrap",
+                        justify_content="center",
+                        align_items="stretch",
+                        width="95%",
+                    ),
+                )
+            )
+
+    def _set_titles(self, projection_num):
+        self.projection_fig.title = f"Projection Number {projection_num}"
+        self.simulated_fig.title = f"Re-projected Image {projection_num}"
+
+    def update(self, n, prjs, sim, sx, sy, conv, stride=1, offset=0):
+        """
+        Updates the plots after alignment iteration n. prjs and sim have every
+        stride-th projection, starting from projection offset. The projection
+        closest to projection_num is shown, and named in the titles.
+        """
+        index = int(round((self.projection_num - offset) / stride))
+        index = min(max(index, 0), len(prjs) - 1)
+        self._set_titles(offset + index * stride)
+        self.image_projection.image = prjs[index]
+        self.image_simulated.image = sim[index]
+        self.line_conv.x = np.arange(0, n + 1)
+        self.line_conv.y = conv[range(n + 1)]
+        self.line.y = [sx, sy]